@@ -92,4 +92,8 @@ CREATE TABLE IF NOT EXISTS settings (
     account_id INT PRIMARY KEY REFERENCES accounts(account_id) ON DELETE CASCADE,
     dark_theme_enabled BOOLEAN NOT NULL DEFAULT FALSE,
     weekend_days weekend_days_enum NOT NULL DEFAULT 'Saturday & Sunday'
-);
\ No newline at end of file
+);
+
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS schedules_account_year_month_idx ON schedules (account_id, year, month, schedule_id);
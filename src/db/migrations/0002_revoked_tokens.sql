@@ -0,0 +1,9 @@
+-- Deny-list of signed session tokens (TOKEN_FORMAT=signed) that were revoked before they expired.
+-- Rows are only useful until `expires_at`, after which the token is rejected anyway.
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti VARCHAR(64) PRIMARY KEY,
+    account_id INT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at_idx ON revoked_tokens (expires_at);
@@ -0,0 +1,2 @@
+-- Lets the token sweeper find expired rows without scanning the whole table.
+CREATE INDEX IF NOT EXISTS tokens_expires_at_idx ON tokens (expires_at);
@@ -0,0 +1,11 @@
+-- Local subscription state kept in sync by Stripe webhooks & the reconciler, so auth never calls Stripe.
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS status VARCHAR(32) NOT NULL DEFAULT 'active';
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS synced_at TIMESTAMPTZ NOT NULL DEFAULT NOW();  -- Time of the Stripe state last applied
+CREATE INDEX IF NOT EXISTS subscriptions_account_expires_at_idx ON subscriptions (account_id, expires_at DESC);
+
+-- IDs of processed webhook events, since Stripe may deliver an event more than once
+CREATE TABLE IF NOT EXISTS stripe_events (
+    event_id VARCHAR(255) PRIMARY KEY,
+    event_type VARCHAR(128) NOT NULL,
+    received_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,23 @@
+-- Local copy of Stripe invoices, filled by webhooks & a background refresher, so the dashboard never waits on Stripe.
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_id VARCHAR(255) PRIMARY KEY,  -- Stripe invoice ID
+    account_id INT NOT NULL REFERENCES accounts(account_id) ON DELETE CASCADE,
+    stripe_subscription_id VARCHAR(128),
+    amount_due INT NOT NULL,  -- In the currency's smallest unit, as given by Stripe
+    amount_paid INT NOT NULL,
+    currency VARCHAR(8) NOT NULL,
+    status VARCHAR(32),
+    invoice_pdf TEXT,
+    hosted_invoice_url TEXT,
+    description TEXT,
+    created_at TIMESTAMPTZ NOT NULL,
+    due_date TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS invoices_account_created_at_idx ON invoices (account_id, created_at DESC);
+
+-- When each account's invoices were last fully re-read from Stripe
+CREATE TABLE IF NOT EXISTS invoice_syncs (
+    account_id INT PRIMARY KEY REFERENCES accounts(account_id) ON DELETE CASCADE,
+    synced_at TIMESTAMPTZ NOT NULL
+);
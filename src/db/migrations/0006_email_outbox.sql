@@ -0,0 +1,17 @@
+-- Emails are queued in the caller's transaction & delivered by a background sender with retries.
+CREATE TABLE IF NOT EXISTS email_outbox (
+    email_id SERIAL PRIMARY KEY,
+    sender VARCHAR(256) NOT NULL,
+    recipients TEXT[] NOT NULL,
+    reply_to TEXT[] NOT NULL DEFAULT '{}',
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',  -- 'pending', 'sent' or 'failed'
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS email_outbox_pending_idx ON email_outbox (next_attempt_at) WHERE status = 'pending';
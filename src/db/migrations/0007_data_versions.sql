@@ -0,0 +1,28 @@
+-- Per-account data version, from which read endpoints derive their ETags. It is bumped by triggers, so that writes
+-- from any worker, script or raw SQL statement change it, without an extra round trip from the server.
+ALTER TABLE accounts ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS TRIGGER AS $$
+BEGIN
+    -- Statement-level, so that a bulk write bumps each of its accounts once
+    IF TG_OP = 'DELETE' THEN
+        UPDATE accounts SET data_version = data_version + 1 WHERE account_id IN (SELECT DISTINCT account_id FROM old_rows);
+    ELSE
+        UPDATE accounts SET data_version = data_version + 1 WHERE account_id IN (SELECT DISTINCT account_id FROM new_rows);
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl TEXT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['teams', 'employees', 'shifts', 'schedules', 'holidays', 'settings'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_insert_data_version ON %1$I', tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_update_data_version ON %1$I', tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_delete_data_version ON %1$I', tbl);
+        EXECUTE format('CREATE TRIGGER %1$s_insert_data_version AFTER INSERT ON %1$I REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()', tbl);
+        EXECUTE format('CREATE TRIGGER %1$s_update_data_version AFTER UPDATE ON %1$I REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()', tbl);
+        EXECUTE format('CREATE TRIGGER %1$s_delete_data_version AFTER DELETE ON %1$I REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()', tbl);
+    END LOOP;
+END$$;
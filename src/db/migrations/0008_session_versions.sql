@@ -0,0 +1,41 @@
+-- Per-account session version, which every worker compares with its cached authenticated sessions of the account.
+-- It is bumped by triggers on changes to the account's credentials, tokens & subscriptions.
+ALTER TABLE accounts ADD COLUMN IF NOT EXISTS session_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_session_version() RETURNS TRIGGER AS $$
+BEGIN
+    -- Statement-level, so that a bulk write bumps each of its accounts once
+    IF TG_OP = 'DELETE' THEN
+        UPDATE accounts SET session_version = session_version + 1 WHERE account_id IN (SELECT DISTINCT account_id FROM old_rows);
+    ELSE
+        UPDATE accounts SET session_version = session_version + 1 WHERE account_id IN (SELECT DISTINCT account_id FROM new_rows);
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_own_session_version() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.session_version := OLD.session_version + 1;
+    RETURN NEW;
+END$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl TEXT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['tokens', 'subscriptions'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_insert_session_version ON %1$I', tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_update_session_version ON %1$I', tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_delete_session_version ON %1$I', tbl);
+        EXECUTE format('CREATE TRIGGER %1$s_insert_session_version AFTER INSERT ON %1$I REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_session_version()', tbl);
+        EXECUTE format('CREATE TRIGGER %1$s_update_session_version AFTER UPDATE ON %1$I REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_session_version()', tbl);
+        EXECUTE format('CREATE TRIGGER %1$s_delete_session_version AFTER DELETE ON %1$I REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_session_version()', tbl);
+    END LOOP;
+END$$;
+
+-- Changes to the account's own credentials (but not its version columns)
+DROP TRIGGER IF EXISTS accounts_session_version ON accounts;
+CREATE TRIGGER accounts_session_version BEFORE UPDATE ON accounts FOR EACH ROW
+    WHEN ((OLD.email, OLD.hashed_password, OLD.email_verified, OLD.password_changed, OLD.stripe_customer_id)
+        IS DISTINCT FROM (NEW.email, NEW.hashed_password, NEW.email_verified, NEW.password_changed, NEW.stripe_customer_id))
+    EXECUTE FUNCTION bump_own_session_version();
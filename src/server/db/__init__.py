@@ -1,6 +1,7 @@
 from .functions import *
 from .tables import *
 from .utils import *
+from .cache import get_cache_stats, get_session_cache_stats, evict_sessions, clear_cache, at_data_version, own_writes
 from .utils import (
     _check_account,
     _sanitize_email,
@@ -0,0 +1,299 @@
+from typing import Any, Callable, Hashable, Optional, Iterator
+from collections import OrderedDict
+from copy import deepcopy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import chain
+from functools import wraps
+from threading import Lock
+import sys, time
+from sqlalchemy import event
+from sqlalchemy.orm import Session as _SessionType
+from src.server.lib.constants import CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES
+from .tables import Session, Account, Token, Subscription, Team, Employee, Shift, Schedule, Holiday, Settings
+
+_TRACKED_MODELS = (Account, Subscription, Team, Employee, Shift, Schedule, Holiday, Settings)
+_SESSION_MODELS = (Account, Token, Subscription)  # Changes to these invalidate the account's authenticated sessions
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds. Keeps hit/miss counters & an estimate of its memory use.
+    `on_evict` is called (outside the cache's lock) with the key of every entry dropped for expiring or for being least recently used.
+    """
+    def __init__(self, max_entries: int, ttl: float, on_evict: Optional[Callable[[Hashable], None]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = Lock()
+        self._size = 0
+        self.hits = self.misses = self.evictions = 0
+
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """Returns whether the key was found, and its value."""
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and entry[0] < time.monotonic()
+            if entry is None or expired:
+                if expired: self._remove(key)
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2]
+        if expired: self._evicted([key])
+        return False, None
+
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Stores a value, evicting the least recently used entries if the cache is full. `ttl` can only shorten the cache's TTL.
+        Returns whether the value was stored (i.e., the cache & TTL are not disabled).
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_entries <= 0: return False
+        size = _sizeof(value)
+        evicted = []
+        with self._lock:
+            if key in self._entries: self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._size += size
+            while len(self._entries) > self.max_entries:
+                evicted.append(next(iter(self._entries)))
+                self._remove(evicted[-1])
+                self.evictions += 1
+        self._evicted(evicted)
+        return True
+
+
+    def pop(self, key: Hashable) -> None:
+        """Removes a key if it exists."""
+        with self._lock:
+            if key in self._entries: self._remove(key)
+
+
+    def clear(self) -> None:
+        """Removes all entries & resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+    def stats(self) -> dict[str, int | float]:
+        """Returns the cache's hit ratio, size, and estimated memory use in bytes."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'memory_bytes': self._size
+            }
+
+
+    def _remove(self, key: Hashable) -> None:
+        self._size -= self._entries.pop(key)[1]
+
+
+    def _evicted(self, keys: list[Hashable]) -> None:
+        if self.on_evict is None: return
+        for key in keys: self.on_evict(key)
+
+
+class _Snapshot:
+    """Column values of an ORM object, from which new (transient) objects are built."""
+    __slots__ = ('model', 'values')
+
+    def __init__(self, model: type, values: dict[str, Any]):
+        self.model = model
+        self.values = values
+
+
+def _freeze(value: Any) -> Any:
+    """Snapshots an ORM object, or a list of them."""
+    if isinstance(value, list): return tuple(_freeze(item) for item in value)
+    if hasattr(value, '__table__'): return _Snapshot(type(value), {col.key: getattr(value, col.key) for col in value.__table__.columns})
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """Builds new objects from a snapshot, so that callers can't modify the cached entry through them."""
+    if isinstance(value, tuple): return [_thaw(item) for item in value]
+    if isinstance(value, _Snapshot): return value.model(**deepcopy(value.values))
+    return value
+
+
+def _sizeof(value: Any) -> int:
+    """Estimates the memory use of a cached value, including snapshots of ORM objects."""
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + _sizeof(v) for k, v in value.items())
+    if isinstance(value, _Snapshot):
+        return sys.getsizeof(value) + _sizeof(value.values)
+    return sys.getsizeof(value)
+
+
+
+## Versions
+_written_at: dict[int, float] = {}
+_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+_data_version: ContextVar[Optional[int]] = ContextVar('data_version', default=None)
+_own_writes: ContextVar[bool] = ContextVar('own_writes', default=False)
+
+
+def record_write(account_id: int) -> None:
+    """Records that this process committed a write to the account (see `written_within`)."""
+    _written_at[account_id] = time.monotonic()
+
+
+def written_within(account_id: int, seconds: float) -> bool:
+    """Returns whether this process committed a write to the account in the last `seconds` seconds."""
+    written_at = _written_at.get(account_id)
+    return written_at is not None and time.monotonic() - written_at < seconds
+
+
+@contextmanager
+def own_writes(enabled: bool = True) -> Iterator[None]:
+    """Routes the replica reads within the block to the primary, e.g., for a client that wrote recently through another worker."""
+    token = _own_writes.set(enabled)
+    try:
+        yield
+    finally:
+        _own_writes.reset(token)
+
+
+def reading_own_writes() -> bool:
+    return _own_writes.get()
+
+
+@contextmanager
+def at_data_version(version: Optional[int]) -> Iterator[None]:
+    """
+    Reads the collections cached within the block at an already looked-up data version of the account (see `cached`),
+    e.g., the one an ETag is derived from, instead of looking it up again for each collection.
+    """
+    token = _data_version.set(version)
+    try:
+        yield
+    finally:
+        _data_version.reset(token)
+
+
+def touch(account_id: int, *, session: _SessionType) -> None:
+    """
+    Marks an account as modified by the session, so that its reads stick to the primary once the session commits.
+    Flushed ORM objects are tracked automatically; statements that bypass the unit of work (e.g., bulk inserts) must call this.
+    """
+    session.info.setdefault('touched_accounts', set()).add(account_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_objects(session: _SessionType, flush_context) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, _TRACKED_MODELS) and obj.account_id is not None:
+            touch(obj.account_id, session=session)
+        if isinstance(obj, _SESSION_MODELS) and obj.account_id is not None:
+            session.info.setdefault('touched_sessions', set()).add(obj.account_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _record_touched_accounts(session: _SessionType) -> None:
+    for account_id in session.info.pop('touched_accounts', ()):
+        record_write(account_id)
+    for account_id in session.info.pop('touched_sessions', ()):
+        evict_sessions(account_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched_accounts(session: _SessionType) -> None:
+    session.info.pop('touched_accounts', None)
+    session.info.pop('touched_sessions', None)
+
+
+
+## Authenticated sessions
+_session_keys: dict[int, set[tuple[int, str]]] = {}  # account ID -> keys of its cached sessions
+_session_keys_lock = Lock()
+
+
+def _unindex_session(key: tuple[int, str]) -> None:
+    with _session_keys_lock:
+        keys = _session_keys.get(key[0])
+        if keys is None: return
+        keys.discard(key)
+        if not keys: del _session_keys[key[0]]
+
+
+_sessions = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS, on_evict=_unindex_session)
+
+
+def get_cached_session(account_id: int, token: str) -> Optional[Any]:
+    """Returns the snapshot of a validated `(account_id, token)` session, or None if it is not cached."""
+    return _sessions.get((account_id, token))[1]
+
+
+def cache_session(account_id: int, token: str, snapshot: Any, ttl: Optional[float] = None) -> None:
+    """Caches the snapshot of a validated session for at most `ttl` seconds (e.g., until its token expires)."""
+    with _session_keys_lock:
+        _session_keys.setdefault(account_id, set()).add((account_id, token))
+    if not _sessions.set((account_id, token), snapshot, ttl): _unindex_session((account_id, token))
+
+
+def evict_sessions(account_id: int) -> None:
+    """
+    Evicts every cached session of an account in this process. Called after commits that change the account, its tokens,
+    or its subscriptions (e.g., password change, token renewal, account deletion), and on logout. Other processes notice
+    such changes by the account's session version (see `log_in_account_with_cookies`).
+    """
+    with _session_keys_lock:
+        keys = _session_keys.pop(account_id, ())
+    for key in keys: _sessions.pop(key)
+
+
+def get_session_cache_stats() -> dict[str, int | float]:
+    """Returns the hit ratio, size & estimated memory use of the authenticated-session cache."""
+    return _sessions.stats()
+
+
+
+## Public
+def cached(collection: str, data_version: Callable[[int], int]) -> Callable:
+    """
+    Read-through cache for a function that takes only an account ID and returns one of its collections.
+    Entries are keyed by the account's persisted data version (`data_version(account_id)`), which DB triggers bump on every
+    write (`accounts.data_version`, migration 0007), so a committed write from any worker or script makes them unreachable.
+    A hit therefore still costs one primary key lookup, unless the version is already known (see `at_data_version`).
+    Entries are snapshots of the objects' columns, and every call gets new objects built from them.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(account_id: int, *args, **kwargs):
+            if args or kwargs: return func(account_id, *args, **kwargs)
+            version = _data_version.get()
+            key = (collection, account_id, data_version(account_id) if version is None else version)
+            hit, snapshot = _cache.get(key)
+            if not hit:
+                snapshot = _freeze(func(account_id))
+                _cache.set(key, snapshot)
+            return _thaw(snapshot)
+        return wrapper
+    return decorator
+
+
+def get_cache_stats() -> dict[str, int | float]:
+    """Returns the hit ratio, size & estimated memory use of the reference data cache."""
+    return _cache.stats()
+
+
+def clear_cache() -> None:
+    """Drops every cached collection & authenticated session of every account."""
+    _cache.clear()
+    _sessions.clear()
+    with _session_keys_lock:
+        _session_keys.clear()
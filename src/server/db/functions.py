@@ -1,20 +1,24 @@
-from typing import Any, Optional
+from typing import Any, Optional, Iterator, TYPE_CHECKING
 from textwrap import dedent
-from datetime import date, time, datetime, timezone
-from sqlalchemy import inspect
+from datetime import date, time, datetime, timezone, timedelta
+from sqlalchemy import inspect, select, delete, tuple_, or_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session as _SessionType
-import stripe
+import orjson
+if TYPE_CHECKING: import stripe
 
-from src.server.lib.utils import log, parse_date, parse_time, utcnow, todict, todicts, format_template
+from src.server.lib.utils import log, errlog, parse_date, parse_time, utcnow, todict, todicts, format_template, load_stripe
 from src.server.lib.models import Credentials, Cookies, ScheduleType
-from src.server.lib.exceptions import CookiesUnavailable, NonExistent
+from src.server.lib.exceptions import CookiesUnavailable, InvalidCookies, NonExistent
 from src.server.lib.types import SettingValue
-from src.server.lib.constants import WEB_SERVER_URL, SUPPORT_EMAIL, NOREPLY_EMAIL, SYSTEM_EMAIL, PROD_URL
-from src.server.lib.emails import send_email
+from src.server.lib.constants import WEB_SERVER_URL, SUPPORT_EMAIL, NOREPLY_EMAIL, SYSTEM_EMAIL, PROD_URL, MAX_PAGE_SIZE, INVOICE_MAX_STALENESS_SECONDS, INVOICE_REFRESH_INTERVAL_SECONDS
+from src.server.lib.emails import queue_email
 
-from .tables import Account, Token, Subscription, Team, Employee, Shift, Schedule, Holiday, Settings
+from .tables import Session, Account, Token, Subscription, Invoice, InvoiceSync, StripeEvent, Team, Employee, Shift, Schedule, Holiday, Settings
+from .cache import cached, at_data_version, get_cached_session, cache_session, evict_sessions
 from .utils import (
     dbsession,
+    _open_session,
     _check_email_is_not_registered,
     _check_account,
     _check_team,
@@ -33,14 +37,33 @@ from .utils import (
     _verify_password,
     _authenticate_credentials,
     _create_new_token,
+    _encode_token,
     _get_token_from_account,
     _renew_token,
     _validate_cookies,
+    _validate_token,
     _get_email_from_token,
     _get_active_sub,
-    _delete_all_holidays_of_employee
+    _apply_stripe_sub,
+    _invoice_values,
+    _upsert_invoices,
+    _mark_invoices_synced,
+    _read_invoices,
+    _ACTIVE_SUB_STATUSES,
+    _remove_employees_from_holidays,
+    _check_bulk_size,
+    _check_name,
+    _check_employee_row,
+    _check_shift_row,
+    _check_holiday_row,
+    _validate_rows,
+    _bulk_insert,
+    _bulk_update
 )
 
+_SUB_EVENTS = ('customer.subscription.created', 'customer.subscription.updated', 'customer.subscription.deleted')
+_INVOICE_EVENTS = ('invoice.created', 'invoice.finalized', 'invoice.updated', 'invoice.paid', 'invoice.payment_failed', 'invoice.voided')
+
 ## Account
 @dbsession(commit=True)
 def create_account(cred: Credentials, *, session: _SessionType) -> tuple[Account, str]:
@@ -73,8 +96,8 @@ def change_email(cookies: Cookies, new_email: str, *, session: _SessionType) ->
 
 
 @dbsession(commit=True)
-def change_password(cookies: Cookies, new_password: str, current_password: Optional[str] = None, require_current: bool = True, *, session: _SessionType) -> Account:
-    """Updates the account's password after validation."""
+def change_password(cookies: Cookies, new_password: str, current_password: Optional[str] = None, require_current: bool = True, *, session: _SessionType) -> tuple[Account, str]:
+    """Updates the account's password after validation, and renews its auth token, so that other sessions are logged out. Returns the new token."""
     if current_password is None:
         assert require_current is False, 'Please provide the current password.'
 
@@ -87,20 +110,22 @@ def change_password(cookies: Cookies, new_password: str, current_password: Optio
     new_password = _sanitize_password(new_password)
     account.hashed_password = _hash_password(new_password)
     account.password_changed = True
+    token = _renew_token(account.account_id, session=session)
     log(f'Modified account: {account}; password has changed', 'account')
-    return account
+    return account, token
 
 
-@dbsession()
-async def request_delete_account(cookies: Cookies, *, session: _SessionType) -> None:
-    """Sends a delete-account request to SUPPORT_EMAIL."""
+@dbsession(commit=True)
+def request_delete_account(cookies: Cookies, *, session: _SessionType) -> None:
+    """Queues a delete-account request to SUPPORT_EMAIL."""
     account = _validate_cookies(cookies, session=session)
-    await send_email(
+    queue_email(
         subject='Account Deletion Request',
         body=format_template('delete_account.html', customer_email=account.email),
         sender=SYSTEM_EMAIL,
         recipients=[SUPPORT_EMAIL],
-        reply_to=[account.email]
+        reply_to=[account.email],
+        session=session
     )
     log(f'Account to be deleted: {account}', 'account')
 
@@ -113,18 +138,60 @@ def delete_account(account_id: int, *, session: _SessionType) -> None:
     session.delete(account)
 
 
+@dbsession(replica=True)
+def get_data_version(account_id: int, *, session: _SessionType) -> int:
+    """Returns the account's data version, which DB triggers bump on every write to its teams, employees, shifts, schedules, holidays & settings."""
+    return session.scalar(select(Account.data_version).filter_by(account_id=account_id)) or 0
+
+
 @dbsession()
-def get_account_data(cookies: Cookies, *, session: _SessionType) -> dict[str, dict|list]:
+def get_account_data(cookies: Cookies, schedules_since: Optional[tuple[int, int]] = None, *, session: _SessionType) -> dict[str, dict|list]:
+    """Returns all data of the account. Only schedules from `schedules_since` (year, month) onwards are included, if given."""
     account_id = _validate_cookies(cookies, session=session).account_id
-    return {
-        'teams': todicts(get_teams(account_id)),
-        'employees': todicts(get_employees(account_id)),
-        'shifts': todicts(get_shifts(account_id)),
-        'holidays': todicts(get_holidays(account_id)),
-        'schedules': todicts(get_schedules(account_id)),
-        'settings': todict(get_settings(account_id)),
-        'invoices': get_invoices(account_id) if _get_active_sub(account_id, session=session) else []
-    }
+    with at_data_version(get_data_version(account_id)):  # One version lookup for all cached collections
+        return {
+            'teams': todicts(get_teams(account_id)),
+            'employees': todicts(get_employees(account_id)),
+            'shifts': todicts(get_shifts(account_id)),
+            'holidays': todicts(get_holidays(account_id)),
+            'schedules': todicts(get_schedules(account_id, since=schedules_since)),
+            'settings': todict(get_settings(account_id)),
+            'invoices': get_invoices(account_id) if _get_active_sub(account_id, session=session) else []
+        }
+
+
+
+def iter_account_data(account_id: int, schedules_since: Optional[tuple[int, int]] = None, batch_size: int = 500) -> Iterator[bytes]:
+    """
+    Streams the same JSON document as `get_account_data`, one section at a time.
+    Rows are read from server-side cursors in batches of `batch_size` and encoded with orjson, so memory use stays
+    flat regardless of the account's size. The account must already be authenticated.
+    """
+    sections = (('teams', Team), ('employees', Employee), ('shifts', Shift), ('holidays', Holiday), ('schedules', Schedule))
+
+    with _open_session(replica=True, account_id=account_id) as session:
+        try:
+            yield b'{'
+            for key, model in sections:
+                query = select(model.__table__).where(model.account_id == account_id)
+                if model is Schedule:
+                    if schedules_since is not None: query = query.where(tuple_(Schedule.year, Schedule.month) >= tuple(schedules_since))
+                    query = query.order_by(Schedule.year, Schedule.month, Schedule.schedule_id)
+
+                yield b'"' + key.encode() + b'":['
+                separator = b''
+                for rows in session.execute(query, execution_options={'yield_per': batch_size}).mappings().partitions():
+                    yield separator + b','.join(orjson.dumps(dict(row)) for row in rows)
+                    separator = b','
+                yield b'],'
+
+            settings = session.execute(select(Settings.__table__).where(Settings.account_id == account_id)).mappings().first()
+            with _open_session() as primary: has_sub = _get_active_sub(account_id, session=primary) is not None
+            invoices = get_invoices(account_id) if has_sub else []
+            yield b'"settings":' + orjson.dumps(dict(settings) if settings else None) + b',"invoices":' + orjson.dumps(invoices) + b'}'
+        except Exception as e:
+            errlog('iter_account_data', e, 'db')
+            raise
 
 
 
@@ -142,10 +209,11 @@ def log_in_account(cred: Credentials, *, session: _SessionType) -> tuple[Account
     # Check if a token is valid or needs to be renewed
     if retrieved_token_obj is None:
         token = _create_new_token(account.account_id, session=session)
+        session.commit()
     elif utcnow() > retrieved_token_obj.expires_at:
         token = _renew_token(account.account_id, session=session)
     else:
-        token = retrieved_token_obj.token
+        token = _encode_token(retrieved_token_obj)
 
     # Retrieve the active subscription for the account
     sub = _get_active_sub(account.account_id, session=session)
@@ -154,18 +222,52 @@ def log_in_account(cred: Credentials, *, session: _SessionType) -> tuple[Account
 
 
 @dbsession()
-def log_in_account_with_cookies(cookies: Cookies, *, session: _SessionType) -> tuple[Account, Optional[Subscription]]:
-    """Authenticate an account based on the given cookies."""
-    if not cookies.available(): raise CookiesUnavailable(cookies)
-    account = _validate_cookies(cookies, session=session)
+def _log_in_account_with_cookies(cookies: Cookies, *, session: _SessionType) -> tuple[Account, Optional[Subscription], datetime]:
+    token_expires_at = _validate_token(cookies, session=session)
+    account = _check_account(cookies.account_id, session=session)
     sub = _get_active_sub(account.account_id, session=session)
     log(f'Successful login with cookies for email: {account.email}', 'auth')
+    return account, sub, min(token_expires_at, sub.expires_at) if sub else token_expires_at
+
+
+@dbsession()
+def log_out_account(cookies: Cookies, *, session: _SessionType) -> None:
+    """Renews the auth token of valid cookies, so that it is rejected from now on (by other workers after their deny-list sync, if signed)."""
+    try:
+        _validate_token(cookies, session=session)
+    except (CookiesUnavailable, InvalidCookies, NonExistent):
+        return
+    _renew_token(cookies.account_id, session=session)
+    evict_sessions(cookies.account_id)
+    log(f'Logged out account ID {cookies.account_id}', 'auth')
+
+
+@dbsession()
+def _get_session_version(account_id: int, *, session: _SessionType) -> Optional[int]:
+    return session.scalar(select(Account.session_version).filter_by(account_id=account_id))
+
+
+def log_in_account_with_cookies(cookies: Cookies) -> tuple[Account, Optional[Subscription]]:
+    """
+    Authenticate an account based on the given cookies.
+    Validated sessions are cached (see `db.cache`), so repeated authentication with the same cookies costs a single
+    lookup of the account's session version, which catches changes made through other workers (e.g., a password change).
+    """
+    if not cookies.available(): raise CookiesUnavailable(cookies)
+    snapshot = get_cached_session(cookies.account_id, cookies.token)
+    if snapshot is not None:
+        account, sub, version = snapshot
+        if _get_session_version(cookies.account_id) == version: return account, sub
+        evict_sessions(cookies.account_id)
+
+    account, sub, valid_until = _log_in_account_with_cookies(cookies)
+    cache_session(cookies.account_id, cookies.token, (account, sub, account.session_version), (valid_until - utcnow()).total_seconds())
     return account, sub
 
 
 @dbsession(commit=True)
-async def request_reset_password(email: str, *, session: _SessionType) -> str:
-    """Sends a password reset email to users with a password set."""
+def request_reset_password(email: str, *, session: _SessionType) -> str:
+    """Queues a password reset email to users with a password set."""
     email = _sanitize_email(email)
     account = session.query(Account).filter(Account.email == email).first()
     safe_msg = 'If this email exists, a reset link will be sent.'  # Prevents user enumeration attacks
@@ -175,11 +277,12 @@ async def request_reset_password(email: str, *, session: _SessionType) -> str:
     reset_token = _create_new_token(account.account_id, 'reset', session=session)
     reset_link = f'{WEB_SERVER_URL}/reset-password?token={reset_token}'
 
-    await send_email(
+    queue_email(
         subject='Reset Your Shiftiatrics Password',
         body=format_template('reset_password.html', reset_link=reset_link, contact_url=f'{PROD_URL}/support/contact'),
         sender=NOREPLY_EMAIL,
-        recipients=[account.email]
+        recipients=[account.email],
+        session=session
     )
 
     return safe_msg
@@ -200,14 +303,17 @@ def reset_password(new_password: str, reset_token: str, *, session: _SessionType
     account.hashed_password = _hash_password(new_password)
     # Delete the used reset token
     session.query(Token).filter(Token.token == reset_token, Token.token_type == 'reset').delete()
+    # Log out existing sessions
+    if _get_token_from_account(account.account_id, 'auth', session=session) is not None:
+        _renew_token(account.account_id, session=session)
     session.commit()
 
     return 'Password reset successfully. You can now log in with your new password.'
 
 
 @dbsession(commit=True)
-async def request_verify_email(email: str, *, session: _SessionType) -> str:
-    """Sends an email verification link to users who need to verify their email."""
+def request_verify_email(email: str, *, session: _SessionType) -> str:
+    """Queues an email verification link to users who need to verify their email."""
     email = _sanitize_email(email)
     account = session.query(Account).filter(Account.email == email).first()
     safe_msg = 'If this email exists, a verification link will be sent.'  # Prevents user enumeration attacks
@@ -219,11 +325,12 @@ async def request_verify_email(email: str, *, session: _SessionType) -> str:
     verify_token = _create_new_token(account.account_id, 'verify', session=session)
     verify_link = f'{WEB_SERVER_URL}/verify-email?token={verify_token}'
 
-    await send_email(
+    queue_email(
         subject='Verify Your Email',
         body=format_template('verify_email.html', verify_link=verify_link),
         sender=NOREPLY_EMAIL,
-        recipients=[account.email]
+        recipients=[account.email],
+        session=session
     )
 
     return safe_msg
@@ -251,7 +358,8 @@ def verify_email(verify_token: str, *, session: _SessionType) -> str:
 
 
 ## Teams
-@dbsession()
+@cached('teams', get_data_version)
+@dbsession(replica=True)
 def get_teams(account_id: int, *, session: _SessionType) -> list[Team]:
     """Returns all teams under an account."""
     _check_account(account_id, session=session)
@@ -294,12 +402,9 @@ def update_team(team_id: int, updates: dict, *, session: _SessionType) -> Team:
 def delete_team(team_id: int, *, session: _SessionType) -> None:
     """Deletes the team and its employees."""
     team = _check_team(team_id, session=session)
-    emps = session.query(Employee).filter(Employee.team_id == team_id).all()
-
-    for emp in emps:
-        _delete_all_holidays_of_employee(emp.employee_id, session=session)
-        session.delete(emp)
-
+    employee_ids = session.scalars(select(Employee.employee_id).filter_by(team_id=team_id)).all()
+    _remove_employees_from_holidays(employee_ids, session=session)
+    session.execute(delete(Employee).where(Employee.team_id == team_id))
     session.delete(team)
     log(f'Deleted team: {team}', 'db')
 
@@ -307,7 +412,8 @@ def delete_team(team_id: int, *, session: _SessionType) -> None:
 
 
 ## Employee
-@dbsession()
+@cached('employees', get_data_version)
+@dbsession(replica=True)
 def get_employees(account_id: int, *, session: _SessionType) -> list[Employee]:
     """Returns all employees in the database."""
     _check_account(account_id, session=session)
@@ -358,16 +464,49 @@ def update_employee(employee_id: int, updates: dict, *, session: _SessionType) -
 def delete_employee(employee_id: int, *, session: _SessionType) -> None:
     """Deletes an employee by their ID. It also removes their ID from any holiday assigned to them, and removes holidays that only contain that ID."""
     employee = _check_employee(employee_id, session=session)
-    holidays = session.query(Holiday).filter(Holiday.assigned_to.any(employee_id)).all()
-    _delete_all_holidays_of_employee(employee_id, session=session)
+    _remove_employees_from_holidays([employee_id], session=session)
     session.delete(employee)
     log(f'Deleted employee: {employee}', 'db')
 
 
 
 
+@dbsession(commit=True)
+def bulk_create_employees(account_id: int, employees: list[dict[str, Any]], *, session: _SessionType) -> dict[str, list[dict]]:
+    """
+    Creates a batch of employees for the given account ID with a single multi-row insert.
+    The whole batch is validated up front; invalid items are skipped and reported per item.
+    """
+    _check_account(account_id, session=session)
+    _check_bulk_size(employees)
+    team_ids = set(session.scalars(select(Team.team_id).filter_by(account_id=account_id)))
+    valid, errors = _validate_rows(employees, lambda row: _check_employee_row(row, team_ids))
+    created = _bulk_insert(Employee, [{'account_id': account_id, **row} for _, row in valid], session=session)
+    log(f'Bulk-created {len(created)} employees for account ID {account_id} ({len(errors)} failed)', 'db')
+    return {'created': [todict(obj, index=index) for (index, _), obj in zip(valid, created)], 'errors': errors}
+
+
+@dbsession(commit=True)
+def bulk_update_employees(account_id: int, updates: list[dict[str, Any]], *, session: _SessionType) -> dict[str, list[dict]]:
+    """Updates a batch of employees of the given account ID. Each item holds an `employee_id` and the attributes to modify."""
+    _check_account(account_id, session=session)
+    _check_bulk_size(updates)
+    team_ids = set(session.scalars(select(Team.team_id).filter_by(account_id=account_id)))
+    updated, errors = _bulk_update(
+        Employee, 'employee', account_id, updates,
+        {'employee_name', 'min_work_hours', 'max_work_hours'},
+        lambda row: _check_employee_row(row, team_ids),
+        session=session
+    )
+    log(f'Bulk-updated {len(updated)} employees for account ID {account_id} ({len(errors)} failed)', 'db')
+    return {'updated': [todict(obj, index=index) for index, obj in updated], 'errors': errors}
+
+
+
+
 ## Shift
-@dbsession()
+@cached('shifts', get_data_version)
+@dbsession(replica=True)
 def get_shifts(account_id: int, *, session: _SessionType) -> list[Shift]:
     """Returns all shifts associated with the given account ID."""
     _check_account(account_id, session=session)
@@ -414,12 +553,93 @@ def delete_shift(shift_id: int, *, session: _SessionType) -> None:
 
 
 
+@dbsession(commit=True)
+def bulk_create_shifts(account_id: int, shifts: list[dict[str, Any]], *, session: _SessionType) -> dict[str, list[dict]]:
+    """
+    Creates a batch of shifts for the given account ID with a single multi-row insert.
+    The whole batch is validated up front; invalid items are skipped and reported per item.
+    """
+    _check_account(account_id, session=session)
+    _check_bulk_size(shifts)
+    taken_names = set(session.scalars(select(Shift.shift_name).filter_by(account_id=account_id)))
+    valid, errors = _validate_rows(shifts, lambda row: _check_shift_row(row, taken_names))
+    created = _bulk_insert(Shift, [{'account_id': account_id, **row} for _, row in valid], session=session)
+    log(f'Bulk-created {len(created)} shifts for account ID {account_id} ({len(errors)} failed)', 'db')
+    return {'created': [todict(obj, index=index) for (index, _), obj in zip(valid, created)], 'errors': errors}
+
+
+@dbsession(commit=True)
+def bulk_update_shifts(account_id: int, updates: list[dict[str, Any]], *, session: _SessionType) -> dict[str, list[dict]]:
+    """Updates a batch of shifts of the given account ID. Each item holds a `shift_id` and the attributes to modify."""
+    _check_account(account_id, session=session)
+    _check_bulk_size(updates)
+    names = dict(session.execute(select(Shift.shift_id, Shift.shift_name).filter(Shift.account_id == account_id)).all())
+    claimed = set()  # New names of the shifts renamed earlier in the batch
+
+    def check(row: dict[str, Any]) -> dict[str, Any]:
+        # Renames only clash with each other here, clashes with the names of other shifts are resolved by `_bulk_update`
+        # against the names after the whole batch, so that two shifts can swap names
+        renamed = _check_name(row.get('shift_name'), 'shift') != names[row['shift_id']]
+        return _check_shift_row(row, claimed if renamed else set())
+
+    updated, errors = _bulk_update(
+        Shift, 'shift', account_id, updates, {'shift_name', 'start_time', 'end_time'}, check, unique_field='shift_name', session=session
+    )
+    log(f'Bulk-updated {len(updated)} shifts for account ID {account_id} ({len(errors)} failed)', 'db')
+    return {'updated': [todict(obj, index=index) for index, obj in updated], 'errors': errors}
+
+
+
+
 ## Schedule
-@dbsession()
-def get_schedules(account_id: int, *, session: _SessionType, **filter_kwargs) -> list[Schedule]:
-    """Returns all schedules associated with the given account ID."""
+@dbsession(replica=True)
+def get_schedules(
+    account_id: int,
+    since: Optional[tuple[int, int]] = None,
+    until: Optional[tuple[int, int]] = None,
+    after: Optional[tuple[int, int, int]] = None,
+    limit: Optional[int] = None,
+    fields: Optional[list[str]] = None,
+    *,
+    session: _SessionType,
+    **filter_kwargs
+) -> list[Schedule] | list[dict[str, Any]]:
+    """
+    Returns the schedules associated with the given account ID, ordered by year, month, and schedule ID.
+
+    Args:
+        account_id (int): The account ID.
+        since (tuple[int, int], optional): Inclusive lower bound as (year, month).
+        until (tuple[int, int], optional): Inclusive upper bound as (year, month).
+        after (tuple[int, int, int], optional): Keyset cursor; only schedules after this (year, month, schedule_id) are returned.
+        limit (int, optional): Maximum number of schedules to return (at most `MAX_PAGE_SIZE`).
+        fields (list[str], optional): Columns to load. When given, plain dictionaries with these columns (plus the cursor columns)
+            are returned instead of `Schedule` objects, which allows skipping the `schedule` JSONB column.
+        **filter_kwargs: Equality filters, such as `year`, `month`, or `team_id`.
+
+    Returns:
+        list[Schedule] | list[dict[str, Any]]: The matching schedules.
+    """
     _check_account(account_id, session=session)
-    return session.query(Schedule).filter_by(account_id=account_id, **filter_kwargs).all()
+    if limit is not None: assert 0 < limit <= MAX_PAGE_SIZE, f'Limit must be between 1 and {MAX_PAGE_SIZE}'
+
+    if fields is None:
+        query = select(Schedule)
+    else:
+        columns = inspect(Schedule).columns
+        for field in fields:
+            if field not in columns: raise ValueError(f'"{field}" is not a valid schedule field.')
+        fields = list(dict.fromkeys(['schedule_id', 'year', 'month', *fields]))
+        query = select(*(columns[field] for field in fields))
+
+    query = query.where(Schedule.account_id == account_id).filter_by(**filter_kwargs)
+    if since is not None: query = query.where(tuple_(Schedule.year, Schedule.month) >= tuple(since))
+    if until is not None: query = query.where(tuple_(Schedule.year, Schedule.month) <= tuple(until))
+    if after is not None: query = query.where(tuple_(Schedule.year, Schedule.month, Schedule.schedule_id) > tuple(after))
+    query = query.order_by(Schedule.year, Schedule.month, Schedule.schedule_id).limit(limit)
+
+    if fields is None: return session.scalars(query).all()
+    return [dict(row) for row in session.execute(query).mappings()]
 
 
 @dbsession(commit=True)
@@ -459,7 +679,8 @@ def delete_schedule(schedule_id: int, *, session: _SessionType) -> None:
 
 
 ## Holiday
-@dbsession()
+@cached('holidays', get_data_version)
+@dbsession(replica=True)
 def get_holidays(account_id: int, *, session: _SessionType) -> list[Holiday]:
     """Returns all holidays associated with the given account ID."""
     _check_account(account_id, session=session)
@@ -502,8 +723,42 @@ def delete_holiday(holiday_id: int, *, session: _SessionType) -> None:
 
 
 
+@dbsession(commit=True)
+def bulk_create_holidays(account_id: int, holidays: list[dict[str, Any]], *, session: _SessionType) -> dict[str, list[dict]]:
+    """
+    Creates a batch of holidays for the given account ID with a single multi-row insert.
+    The whole batch is validated up front; invalid items are skipped and reported per item.
+    """
+    _check_account(account_id, session=session)
+    _check_bulk_size(holidays)
+    employee_ids = set(session.scalars(select(Employee.employee_id).filter_by(account_id=account_id)))
+    valid, errors = _validate_rows(holidays, lambda row: _check_holiday_row(row, employee_ids))
+    created = _bulk_insert(Holiday, [{'account_id': account_id, **row} for _, row in valid], session=session)
+    log(f'Bulk-created {len(created)} holidays for account ID {account_id} ({len(errors)} failed)', 'db')
+    return {'created': [todict(obj, index=index) for (index, _), obj in zip(valid, created)], 'errors': errors}
+
+
+@dbsession(commit=True)
+def bulk_update_holidays(account_id: int, updates: list[dict[str, Any]], *, session: _SessionType) -> dict[str, list[dict]]:
+    """Updates a batch of holidays of the given account ID. Each item holds a `holiday_id` and the attributes to modify."""
+    _check_account(account_id, session=session)
+    _check_bulk_size(updates)
+    employee_ids = set(session.scalars(select(Employee.employee_id).filter_by(account_id=account_id)))
+    updated, errors = _bulk_update(
+        Holiday, 'holiday', account_id, updates,
+        {'holiday_name', 'assigned_to', 'start_date', 'end_date'},
+        lambda row: _check_holiday_row(row, employee_ids),
+        session=session
+    )
+    log(f'Bulk-updated {len(updated)} holidays for account ID {account_id} ({len(errors)} failed)', 'db')
+    return {'updated': [todict(obj, index=index) for index, obj in updated], 'errors': errors}
+
+
+
+
 ## Settings
-@dbsession()
+@cached('settings', get_data_version)
+@dbsession(replica=True)
 def get_settings(account_id: int, *, session: _SessionType) -> Settings:
     """Returns all settings of an account."""
     return session.query(Settings).filter_by(account_id=account_id).first()
@@ -567,6 +822,7 @@ def create_sub(account_id: int, chkout_session_id: str, *,  session: _SessionTyp
         raise ValueError('Checkout session ID was processed.')
 
     # Retrieve the Stripe Checkout Session
+    stripe = load_stripe()
     stripe_session = stripe.checkout.Session.retrieve(chkout_session_id)
     if stripe_session.mode != 'subscription': raise ValueError('Session is not a subscription.')
 
@@ -586,7 +842,8 @@ def create_sub(account_id: int, chkout_session_id: str, *,  session: _SessionTyp
         plan=plan,
         expires_at=datetime.fromtimestamp(stripe_sub.current_period_end, tz=timezone.utc),
         stripe_subscription_id=stripe_subscription_id,
-        stripe_chkout_session_id=chkout_session_id
+        stripe_chkout_session_id=chkout_session_id,
+        status=stripe_sub.status
     )
     session.add(sub)
     account.stripe_customer_id = stripe_customer_id
@@ -594,9 +851,55 @@ def create_sub(account_id: int, chkout_session_id: str, *,  session: _SessionTyp
     return account, sub
 
 
-@dbsession()
-def get_invoices(account_id: int, *, session: _SessionType) -> list[dict]:
-    """Returns all Stripe invoices associated with the given account."""
+@dbsession(commit=True)
+def handle_stripe_event(event: 'stripe.Event', *, session: _SessionType) -> bool:
+    """
+    Applies a verified Stripe webhook event to the local subscription & invoice state. Returns False for duplicate, irrelevant,
+    or out-of-order events. Events are recorded in the same transaction, so a failed event is processed again on redelivery.
+    """
+    recorded = session.execute(insert(StripeEvent).values(event_id=event.id, event_type=event.type).on_conflict_do_nothing()).rowcount
+    if not recorded: return False
+
+    if event.type in _INVOICE_EVENTS:
+        invoice = event.data.object
+        account = session.query(Account).filter_by(stripe_customer_id=invoice.customer).first()
+        if account is None: return False
+        _upsert_invoices([_invoice_values(invoice, account.account_id)], session=session)
+        return True
+    elif event.type not in _SUB_EVENTS:
+        return False
+
+    stripe_sub = event.data.object
+    sub = session.query(Subscription).filter_by(stripe_subscription_id=stripe_sub.id).first()
+    if sub is None: return False  # Checkout not completed yet; `create_sub` stores the subscription
+    return _apply_stripe_sub(sub, stripe_sub, datetime.fromtimestamp(event.created, tz=timezone.utc))
+
+
+@dbsession(commit=True)
+def reconcile_subs(limit: int = 100, *, session: _SessionType) -> int:
+    """
+    Re-reads from Stripe the active subscriptions whose local period has ended, in case their renewal or cancellation webhook
+    was missed. Rows locked by a concurrent reconciler are skipped. Returns the number of subscriptions updated.
+    """
+    due = session.query(Subscription).filter(
+        Subscription.status.in_(_ACTIVE_SUB_STATUSES),
+        Subscription.expires_at < utcnow()
+    ).order_by(Subscription.expires_at).limit(limit).with_for_update(skip_locked=True).all()
+
+    stripe = load_stripe()
+    updated = 0
+    for sub in due:
+        try:
+            updated += _apply_stripe_sub(sub, stripe.Subscription.retrieve(sub.stripe_subscription_id), utcnow())
+        except stripe.StripeError as e:
+            errlog('reconcile_subs', e, 'subscription')
+    if due: log(f'Reconciled {updated} of {len(due)} due subscription(s)', 'subscription')
+    return updated
+
+
+@dbsession(commit=True)
+def refresh_invoices(account_id: int, *, session: _SessionType) -> list[dict]:
+    """Re-reads the invoices of the account's active subscription from Stripe into the `invoices` table, and returns them."""
     account = _check_account(account_id, session=session)
     customer_id = account.stripe_customer_id
     if customer_id is None: raise LookupError(f'Account ID {account_id} does not have a Stripe customer ID.')
@@ -604,28 +907,55 @@ def get_invoices(account_id: int, *, session: _SessionType) -> list[dict]:
     sub = _get_active_sub(account_id, session=session)
     if not sub: raise LookupError(f'No active subscription found for account ID {account_id}.')
 
-    # List all invoices for the specific subscription & customer
-    invoices = stripe.Invoice.list(customer=customer_id, subscription=sub.stripe_subscription_id)
-    if not invoices.data: raise LookupError(f'No invoices found for Stripe subscription ID "{sub.stripe_subscription_id}".')
-
-    result = [
-        {
-            'invoice_id': invoice.id,
-            'amount_due': invoice.amount_due / 100,
-            'amount_paid': invoice.amount_paid / 100,
-            'currency': invoice.currency.upper(),
-            'status': invoice.status,
-            'invoice_pdf': invoice.invoice_pdf,
-            'hosted_invoice_url': invoice.hosted_invoice_url,
-            'created_at': datetime.fromtimestamp(invoice.created, tz=timezone.utc).isoformat(),
-            'due_date': (
-                datetime.fromtimestamp(invoice.due_date, tz=timezone.utc).isoformat()
-                if invoice.due_date else None
-            ),
-            'description': invoice.description,
-            'subscription_id': invoice.subscription,
-        }
-        for invoice in invoices.data
-    ]
-    result.sort(key=lambda invoice: invoice['created_at'], reverse=True)  # Sort newest firsts
-    return result
\ No newline at end of file
+    invoices = load_stripe().Invoice.list(customer=customer_id, subscription=sub.stripe_subscription_id, limit=100)
+    _upsert_invoices([_invoice_values(invoice, account_id) for invoice in invoices.auto_paging_iter()], session=session)
+    _mark_invoices_synced(account_id, session=session)
+    session.flush()
+    log(f'Refreshed invoices of account ID {account_id}', 'subscription')
+    return _read_invoices(account_id, sub.stripe_subscription_id, session=session)
+
+
+@dbsession()
+def get_invoices(account_id: int, *, session: _SessionType) -> list[dict]:
+    """
+    Returns the Stripe invoices of the account's active subscription, newest first, from the `invoices` table.
+    Stripe is only called when they were last synced over `INVOICE_MAX_STALENESS_SECONDS` ago (or never);
+    webhooks & `refresh_stale_invoices` normally keep them fresh.
+    """
+    sub = _get_active_sub(account_id, session=session)
+    if not sub: raise LookupError(f'No active subscription found for account ID {account_id}.')
+
+    synced_at = session.scalar(select(InvoiceSync.synced_at).where(InvoiceSync.account_id == account_id))
+    if synced_at is None or utcnow() - synced_at > timedelta(seconds=INVOICE_MAX_STALENESS_SECONDS):
+        return refresh_invoices(account_id)
+    return _read_invoices(account_id, sub.stripe_subscription_id, session=session)
+
+
+def refresh_stale_invoices(limit: int = 50) -> int:
+    """
+    Refreshes the invoices of up to `limit` subscribed accounts, least recently synced first, whose invoices were synced
+    over `INVOICE_REFRESH_INTERVAL_SECONDS` ago (or never). Returns the number of accounts refreshed.
+    """
+    with Session() as session:
+        subscribed = select(Subscription.account_id).where(Subscription.status.in_(_ACTIVE_SUB_STATUSES), Subscription.expires_at > utcnow())
+        account_ids = session.scalars(
+            select(Account.account_id)
+            .outerjoin(InvoiceSync, InvoiceSync.account_id == Account.account_id)
+            .where(
+                Account.account_id.in_(subscribed),
+                Account.stripe_customer_id.is_not(None),
+                or_(InvoiceSync.synced_at.is_(None), InvoiceSync.synced_at < utcnow() - timedelta(seconds=INVOICE_REFRESH_INTERVAL_SECONDS))
+            )
+            .order_by(InvoiceSync.synced_at.asc().nulls_first())
+            .limit(limit)
+        ).all()
+
+    stripe = load_stripe()
+    refreshed = 0
+    for account_id in account_ids:
+        try:
+            refresh_invoices(account_id)
+            refreshed += 1
+        except (LookupError, stripe.StripeError) as e:
+            errlog('refresh_stale_invoices', e, 'subscription')
+    return refreshed
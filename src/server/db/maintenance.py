@@ -0,0 +1,56 @@
+from typing import Optional
+from threading import Lock
+from sqlalchemy import text
+from src.server.lib.constants import TOKEN_SWEEP_BATCH_SIZE
+from src.server.lib.utils import log, utcnow
+from .tables import Session
+
+# Each batch is its own short transaction; SKIP LOCKED lets concurrent sweepers (e.g., one per worker) split the work
+_SWEEPS = {
+    'tokens': text('''
+        DELETE FROM tokens WHERE token_id IN (
+            SELECT token_id FROM tokens WHERE expires_at < NOW() LIMIT :batch_size FOR UPDATE SKIP LOCKED
+        )
+    '''),
+    'revoked_tokens': text('''
+        DELETE FROM revoked_tokens WHERE jti IN (
+            SELECT jti FROM revoked_tokens WHERE expires_at < NOW() LIMIT :batch_size FOR UPDATE SKIP LOCKED
+        )
+    ''')
+}
+_stats = {'runs': 0, 'last_run_at': None, **{f'{table}_swept': 0 for table in _SWEEPS}}
+_stats_lock = Lock()
+
+
+def sweep_expired_tokens(batch_size: int = TOKEN_SWEEP_BATCH_SIZE, max_batches: Optional[int] = None) -> dict[str, int]:
+    """
+    Deletes expired auth, reset & verification tokens, and revocations of signed tokens that have expired anyway, in batches of
+    `batch_size` rows. Stops once a batch comes back short or after `max_batches` batches per table. Returns the rows deleted per table.
+    """
+    swept = dict.fromkeys(_SWEEPS, 0)
+    for table, statement in _SWEEPS.items():
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            with Session() as session:
+                deleted = session.execute(statement, {'batch_size': batch_size}).rowcount
+                session.commit()
+            swept[table] += deleted
+            batches += 1
+            if deleted < batch_size: break
+
+    with _stats_lock:
+        _stats['runs'] += 1
+        _stats['last_run_at'] = utcnow().isoformat()
+        for table, deleted in swept.items(): _stats[f'{table}_swept'] += deleted
+    if any(swept.values()): log(f'Swept expired rows: {swept}', 'db')
+    return swept
+
+
+def get_token_table_stats() -> dict[str, int | str | None]:
+    """Returns the rows swept so far by this process, and the current row count & on-disk size of the `tokens` table."""
+    with Session() as session:
+        rows, expired, size = session.execute(text('''
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE expires_at < NOW()), pg_total_relation_size('tokens') FROM tokens
+        ''')).one()
+    with _stats_lock:
+        return {**_stats, 'tokens_rows': rows, 'tokens_expired_rows': expired, 'tokens_size_bytes': size}
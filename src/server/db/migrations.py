@@ -0,0 +1,113 @@
+from typing import Optional
+import os, re, hashlib, psycopg2
+from psycopg2 import errors
+from src.server.lib.constants import MIGRATIONS_DIR, PSQL_DB, PSQL_USER, PSQL_PASSWORD, PSQL_HOST, PSQL_PORT
+from src.server.lib.exceptions import MigrationModified
+
+_MIGRATION_FILENAME = re.compile(r'^(\d+)_\w+\.sql$')
+_ADVISORY_LOCK_KEY = 0x5348_4946_5449  # Arbitrary, shared by every worker
+
+def _connect(dbname: str = PSQL_DB):
+    conn = psycopg2.connect(dbname=dbname, user=PSQL_USER, password=PSQL_PASSWORD, host=PSQL_HOST, port=PSQL_PORT)
+    conn.autocommit = True
+    return conn
+
+
+def _create_db() -> None:
+    """Creates the target DB by connecting to the default 'postgres' DB."""
+    admin_conn = _connect('postgres')
+    try:
+        with admin_conn.cursor() as cur:
+            cur.execute(f'CREATE DATABASE {PSQL_DB}')
+        print(f"📦 Created database '{PSQL_DB}'")
+    except errors.DuplicateDatabase:
+        pass  # Created concurrently by another worker
+    finally:
+        admin_conn.close()
+
+
+def list_migrations() -> list[tuple[int, str, str]]:
+    """Returns the (version, filename, checksum) of every migration file in `MIGRATIONS_DIR`, ordered by version."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _MIGRATION_FILENAME.match(filename)
+        if not match: continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), 'rb') as file:
+            checksum = hashlib.sha256(file.read()).hexdigest()
+        migrations.append((int(match.group(1)), filename, checksum))
+    return sorted(migrations)
+
+
+def _get_applied(cur) -> dict[int, str]:
+    """Returns the checksum of each applied migration by version."""
+    cur.execute("SELECT to_regclass('schema_migrations')")
+    if cur.fetchone()[0] is None: return {}
+    cur.execute('SELECT version, checksum FROM schema_migrations')
+    return dict(cur.fetchall())
+
+
+def migrate(wait: bool = False) -> Optional[int]:
+    """
+    Applies pending migrations from `MIGRATIONS_DIR`, each in its own transaction, and records them in `schema_migrations`.
+    Only one worker applies migrations at a time: if the advisory lock is taken, the others wait for it if `wait` is true
+    (and then apply whatever is still pending), or else skip immediately.
+    Returns the number of applied migrations, or None if another worker holds the lock and `wait` is false.
+    Raises `MigrationModified` if an applied migration's file has changed.
+    """
+    try:
+        conn = _connect()
+    except psycopg2.OperationalError as e:
+        if f'"{PSQL_DB}" does not exist' not in str(e): raise
+        _create_db()
+        conn = _connect()
+
+    try:
+        with conn.cursor() as cur:
+            migrations = list_migrations()
+            applied = _get_applied(cur)
+            pending = [m for m in migrations if m[0] not in applied]
+            for version, filename, checksum in migrations:
+                if version in applied and applied[version] != checksum: raise MigrationModified(filename)
+            if not pending: return 0
+
+            if wait:
+                cur.execute('SELECT pg_advisory_lock(%s)', (_ADVISORY_LOCK_KEY,))
+            else:
+                cur.execute('SELECT pg_try_advisory_lock(%s)', (_ADVISORY_LOCK_KEY,))
+                if not cur.fetchone()[0]:
+                    print('⏭️ Another worker is applying migrations; skipping.')
+                    return None
+
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        filename VARCHAR(256) NOT NULL,
+                        checksum CHAR(64) NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                """)
+                applied = _get_applied(cur)  # Re-read, as another worker may have finished in the meantime
+                count = 0
+
+                for version, filename, checksum in migrations:
+                    if version in applied: continue
+                    with open(os.path.join(MIGRATIONS_DIR, filename), 'r') as file:
+                        sql = file.read()
+                    conn.autocommit = False
+                    try:
+                        cur.execute(sql)
+                        cur.execute('INSERT INTO schema_migrations (version, filename, checksum) VALUES (%s, %s, %s)', (version, filename, checksum))
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    finally:
+                        conn.autocommit = True
+                    print(f'🎉 Applied migration {filename}')
+                    count += 1
+                return count
+            finally:
+                cur.execute('SELECT pg_advisory_unlock(%s)', (_ADVISORY_LOCK_KEY,))
+    finally:
+        conn.close()
@@ -0,0 +1,131 @@
+from typing import Any, Optional, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+import re, random, orjson
+from src.server.lib.constants import SLOW_QUERY_SECONDS, SLOW_QUERY_EXPLAIN_RATE, SLOW_QUERY_MAX_STATEMENTS
+from src.server.lib.utils import log, errlog
+
+_db_function: ContextVar[Optional[str]] = ContextVar('db_function', default=None)
+_offenders: dict[str, dict[str, Any]] = {}  # Normalized SQL -> stats
+_offenders_lock = Lock()
+
+_IN_LIST = re.compile(r'\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+\s*\)')  # Expanded `IN` parameters
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w%])-?\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+_PLAN_CONDITION = re.compile(r'^(\s*(?:[\w-]+ )?(?:Cond|Filter|Key|Output): )(.*)$')  # e.g., `Index Cond: (email = 'x'::text)`
+
+
+@contextmanager
+def calling(func_name: str) -> Iterator[None]:
+    """Attributes the statements executed within the block to a DB function (see `dbsession`)."""
+    token = _db_function.set(func_name)
+    try:
+        yield
+    finally:
+        _db_function.reset(token)
+
+
+def normalize_sql(statement: str) -> str:
+    """Collapses whitespace, literals & expanded `IN` lists, so that executions of the same query are grouped together."""
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    return _IN_LIST.sub('(...)', statement)
+
+
+def parameter_shapes(parameters: Any, executemany: bool = False) -> Any:
+    """Describes bound parameters by type (& length of collections) without logging their values."""
+    if executemany:
+        return {'rows': len(parameters), 'row': parameter_shapes(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: _shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_shape(value) for value in parameters]
+    return _shape(parameters)
+
+
+def _shape(value: Any) -> str:
+    if isinstance(value, (list, tuple, dict, set, str, bytes)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def scrub_plan(plan: str) -> str:
+    """
+    Removes the literals of a plan, which carry the statement's parameter values (e.g., tokens or emails): string literals
+    anywhere, and numbers in conditions & keys. Node types, costs, row counts, timings & buffer counts are kept.
+    """
+    lines = []
+    for line in plan.splitlines():
+        line = _STRING.sub('?', line)
+        if match := _PLAN_CONDITION.match(line):
+            line = match[1] + normalize_sql(match[2])
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _explain(cursor, statement: str, parameters: Any) -> Optional[str]:
+    """
+    Runs `EXPLAIN (ANALYZE, BUFFERS)` of a SELECT on the statement's connection, inside a savepoint so that a failure
+    leaves the caller's transaction intact, & returns the plan without parameter values (see `scrub_plan`).
+    Other statements are not explained, since ANALYZE executes them again.
+    """
+    if not statement.lstrip().upper().startswith('SELECT'): return None
+    with cursor.connection.cursor() as explain_cursor:
+        explain_cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            explain_cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+            plan = scrub_plan('\n'.join(row[0] for row in explain_cursor.fetchall()))
+            explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            return plan
+        except Exception:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            raise
+
+
+def record_query(cursor, statement: str, parameters: Any, executemany: bool, seconds: float) -> None:
+    """Logs a statement that took longer than `SLOW_QUERY_SECONDS` to the slow-query log & adds it to the summary."""
+    if seconds < SLOW_QUERY_SECONDS: return
+    normalized = normalize_sql(statement)
+    func_name = _db_function.get()
+    with _offenders_lock:
+        stats = _offenders.get(normalized)
+        if stats is None and len(_offenders) < SLOW_QUERY_MAX_STATEMENTS:
+            stats = _offenders[normalized] = {'sql': normalized, 'functions': set(), 'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'last_plan': None}
+        if stats is not None:
+            stats['functions'].add(func_name)
+            stats['count'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    plan = None
+    if not executemany and random.random() < SLOW_QUERY_EXPLAIN_RATE:
+        try:
+            plan = _explain(cursor, statement, parameters)
+        except Exception as e:
+            errlog('record_query', e, 'slow_queries')
+        if plan is not None and stats is not None:
+            with _offenders_lock: stats['last_plan'] = plan
+    entry = {
+        'function': func_name,
+        'seconds': round(seconds, 6),
+        'sql': normalized,
+        'parameters': parameter_shapes(parameters, executemany),
+        'plan': plan
+    }
+    log(orjson.dumps(entry).decode(), 'slow_queries', 'WARNING')
+
+
+def get_slow_query_summary(limit: int = 20) -> list[dict[str, Any]]:
+    """Returns the slow statements seen by this process by total time spent in them (descending), with their latest captured plan."""
+    with _offenders_lock:
+        offenders = [dict(stats, functions=sorted(stats['functions'], key=str)) for stats in _offenders.values()]
+    for stats in offenders:
+        stats['mean_seconds'] = stats['total_seconds'] / stats['count']
+    return sorted(offenders, key=lambda stats: stats['total_seconds'], reverse=True)[:limit]
+
+
+def reset_slow_query_summary() -> None:
+    with _offenders_lock: _offenders.clear()
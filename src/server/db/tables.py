@@ -1,11 +1,65 @@
-from sqlalchemy import create_engine, func, Column, Integer, String, Boolean, ForeignKey, Date, DateTime, Time, Enum, ForeignKey
+import time
+from sqlalchemy import create_engine, event, func, Column, Integer, BigInteger, String, Text, Boolean, ForeignKey, Date, DateTime, Time, Enum, ForeignKey, Select
 from sqlalchemy.dialects.postgresql import JSONB, ARRAY
-from sqlalchemy.orm import sessionmaker, declarative_base
-from src.server.lib.constants import ENGINE_URL
+from sqlalchemy.orm import sessionmaker, declarative_base, Session as _BaseSession
+from src.server.lib.constants import ENGINE_URL, REPLICA_ENGINE_URL
 from src.server.lib.types import WeekendDaysEnum, TokenTypeEnum, PricingPlanEnum
+from src.server.lib.tracing import start_span
+from .slow_queries import record_query
+
+class RoutingSession(_BaseSession):
+    """
+    Session that sends SELECTs to the read replica when `info['use_replica']` is set (see `dbsession`).
+    Flushes & any other statement go to the primary, after which the session stays on the primary to read its own writes.
+    """
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get('use_replica'):
+            if not self._flushing and isinstance(clause, Select):
+                return replica_engine
+            self.info['use_replica'] = False
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
 
 engine = create_engine(ENGINE_URL)
-Session = sessionmaker(bind=engine)
+replica_engine = create_engine(REPLICA_ENGINE_URL) if REPLICA_ENGINE_URL else None
+Session = sessionmaker(bind=engine, class_=RoutingSession)
+
+
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    sql_span = start_span('sql', statement=statement[:500], db=conn.engine.url.database or '')
+    if sql_span is not None: conn.info.setdefault('sql_spans', []).append(sql_span)
+
+
+def _end_sql_span(conn, *args):
+    sql_spans = conn.info.get('sql_spans')
+    if sql_spans: sql_spans.pop().end()
+
+
+def _fail_sql_span(exception_context):
+    sql_spans = exception_context.connection.info.get('sql_spans') if exception_context.connection else None
+    if sql_spans:
+        sql_span = sql_spans.pop()
+        sql_span.set('error', type(exception_context.original_exception).__name__)
+        sql_span.end()
+
+
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    context._started_at = time.perf_counter()
+
+
+def _check_slow_query(conn, cursor, statement, parameters, context, executemany):
+    record_query(cursor, statement, parameters, executemany, time.perf_counter() - context._started_at)
+
+
+for _engine in filter(None, (engine, replica_engine)):
+    # Statements of traced requests become `sql` spans, and statements over `SLOW_QUERY_SECONDS` go to the slow-query log
+    event.listen(_engine, 'before_cursor_execute', _start_sql_span)
+    event.listen(_engine, 'after_cursor_execute', _end_sql_span)
+    event.listen(_engine, 'handle_error', _fail_sql_span)
+    event.listen(_engine, 'before_cursor_execute', _start_timer)
+    event.listen(_engine, 'after_cursor_execute', _check_slow_query)
+
+
 Base = declarative_base()
 _values_callable = lambda x: [e.value for e in x]
 
@@ -18,6 +72,8 @@ class Account(Base):
     email_verified = Column(Boolean, nullable=False, server_default='false', default=False)
     password_changed = Column(Boolean, nullable=False, server_default='false', default=False)
     stripe_customer_id = Column(String(128), unique=True, nullable=True)
+    data_version = Column(BigInteger, nullable=False, server_default='0', default=0)  # Bumped by DB triggers on writes to the account's data
+    session_version = Column(BigInteger, nullable=False, server_default='0', default=0)  # Bumped by DB triggers on changes to the account's credentials, tokens & subscriptions
     __repr__ = lambda self: f'Account({self.account_id})'
 
 
@@ -37,6 +93,14 @@ class Token(Base):
     __repr__ = lambda self: f'Token({self.account_id}, {self.token_id})'
 
 
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String(64), primary_key=True)
+    account_id = Column(Integer, nullable=False)  # Not a foreign key: revocations must outlive the account
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    __repr__ = lambda self: f'RevokedToken({self.account_id}, {self.jti})'
+
+
 class Subscription(Base):
     __tablename__ = 'subscriptions'
     subscription_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -49,9 +113,60 @@ class Subscription(Base):
     expires_at = Column(DateTime(timezone=True), nullable=False)
     stripe_subscription_id = Column(String(128), unique=True, nullable=False)
     stripe_chkout_session_id = Column(String(128), unique=True, nullable=False)
+    status = Column(String(32), nullable=False, server_default='active', default='active')  # Stripe's subscription status
+    synced_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), server_default=func.now())
     __repr__ = lambda self: f'Subscription({self.account_id}, {self.subscription_id})'
 
 
+class Invoice(Base):
+    __tablename__ = 'invoices'
+    invoice_id = Column(String(255), primary_key=True)
+    account_id = Column(Integer, ForeignKey('accounts.account_id', ondelete='CASCADE'), nullable=False)
+    stripe_subscription_id = Column(String(128), nullable=True)
+    amount_due = Column(Integer, nullable=False)
+    amount_paid = Column(Integer, nullable=False)
+    currency = Column(String(8), nullable=False)
+    status = Column(String(32), nullable=True)
+    invoice_pdf = Column(Text, nullable=True)
+    hosted_invoice_url = Column(Text, nullable=True)
+    description = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    due_date = Column(DateTime(timezone=True), nullable=True)
+    __repr__ = lambda self: f'Invoice({self.account_id}, {self.invoice_id})'
+
+
+class InvoiceSync(Base):
+    __tablename__ = 'invoice_syncs'
+    account_id = Column(Integer, ForeignKey('accounts.account_id', ondelete='CASCADE'), primary_key=True)
+    synced_at = Column(DateTime(timezone=True), nullable=False)
+    __repr__ = lambda self: f'InvoiceSync({self.account_id})'
+
+
+class OutboxEmail(Base):
+    __tablename__ = 'email_outbox'
+    email_id = Column(Integer, primary_key=True, autoincrement=True)
+    sender = Column(String(256), nullable=False)
+    recipients = Column(ARRAY(Text, dimensions=1), nullable=False)
+    reply_to = Column(ARRAY(Text, dimensions=1), nullable=False, server_default='{}', default=list)
+    subject = Column(Text, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, server_default='pending', default='pending')  # 'pending', 'sent' or 'failed'
+    attempts = Column(Integer, nullable=False, server_default='0', default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    __repr__ = lambda self: f'OutboxEmail({self.email_id}, {self.status})'
+
+
+class StripeEvent(Base):
+    __tablename__ = 'stripe_events'
+    event_id = Column(String(255), primary_key=True)
+    event_type = Column(String(128), nullable=False)
+    received_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), server_default=func.now())
+    __repr__ = lambda self: f'StripeEvent({self.event_id})'
+
+
 class Team(Base):
     __tablename__ = 'teams'
     account_id = Column(Integer, ForeignKey('accounts.account_id', ondelete='CASCADE'), nullable=False)
@@ -0,0 +1,59 @@
+from typing import Optional
+from datetime import datetime
+from threading import Lock
+import time, jwt
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session as _SessionType
+from src.server.lib.constants import TOKEN_SECRET, REVOCATION_SYNC_SECONDS
+from src.server.lib.utils import log, utcnow
+from .tables import RevokedToken
+
+_ALGORITHM = 'HS256'
+_revoked: dict[str, datetime] = {}  # jti -> expiry of the revoked token
+_revoked_lock = Lock()
+_synced_at = float('-inf')
+
+
+def encode_token(account_id: int, jti: str, expires_at: datetime) -> str:
+    """Returns a signed auth token of the account, identified by `jti` (the value stored in the `tokens` table)."""
+    claims = {'sub': str(account_id), 'jti': jti, 'typ': 'auth', 'exp': expires_at}
+    return jwt.encode(claims, TOKEN_SECRET, algorithm=_ALGORITHM)
+
+
+def decode_token(token: str, account_id: int) -> Optional[dict]:
+    """Returns the claims of a correctly signed, unexpired auth token of the account, or None. Does not check revocation."""
+    try:
+        claims = jwt.decode(token, TOKEN_SECRET, algorithms=[_ALGORITHM], options={'require': ['sub', 'jti', 'exp']})
+    except jwt.PyJWTError:
+        return None
+    if claims['sub'] != str(account_id) or claims.get('typ') != 'auth': return None
+    return claims
+
+
+def revoke_token(jti: str, account_id: int, expires_at: datetime, *, session: _SessionType) -> None:
+    """Adds a signed token to the deny-list. Other processes see it after their next sync."""
+    session.execute(insert(RevokedToken).values(jti=jti, account_id=account_id, expires_at=expires_at).on_conflict_do_nothing())
+    with _revoked_lock:
+        _revoked[jti] = expires_at
+    log(f'Revoked token {jti} of account ID {account_id}', 'auth')
+
+
+def is_revoked(jti: str, *, session: _SessionType) -> bool:
+    """Checks the local deny-list, re-reading it from the DB at most once every `REVOCATION_SYNC_SECONDS`."""
+    if time.monotonic() - _synced_at >= REVOCATION_SYNC_SECONDS:
+        sync_revoked_tokens(session=session)
+    return jti in _revoked
+
+
+def sync_revoked_tokens(*, session: _SessionType) -> int:
+    """Merges unexpired revocations from the DB into the local deny-list & drops expired ones. Returns the list's size."""
+    global _synced_at
+    now = utcnow()
+    rows = session.execute(select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > now)).all()
+    with _revoked_lock:
+        _revoked.update(rows)
+        for jti in [jti for jti, expires_at in _revoked.items() if expires_at <= now]:
+            del _revoked[jti]
+        _synced_at = time.monotonic()
+        return len(_revoked)
@@ -1,18 +1,29 @@
 from typing import Optional, Callable, Any
+from reprlib import Repr
 from textwrap import dedent
 from functools import wraps
-from datetime import datetime, timezone
-from sqlalchemy import Boolean, String, Enum
+from datetime import date, time, datetime, timezone, timedelta
+from sqlalchemy import Boolean, String, Enum, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session as _SessionType
-from sqlalchemy.dialects.postgresql import array
-import unicodedata, re, bcrypt, inspect, secrets, stripe
+import unicodedata, re, inspect, secrets
 
-from src.server.lib.constants import MIN_EMAIL_LEN, MAX_EMAIL_LEN, MIN_PASSWORD_LEN, MAX_PASSWORD_LEN
-from src.server.lib.utils import log, errlog, get_token_expiry_datetime, utcnow
+from src.server.lib.constants import MIN_EMAIL_LEN, MAX_EMAIL_LEN, MIN_PASSWORD_LEN, MAX_PASSWORD_LEN, MAX_BULK_ITEMS, REPLICA_STICKY_SECONDS, TOKEN_FORMAT, SUB_GRACE_SECONDS
+from src.server.lib.hashing import hash_password, verify_password, needs_rehash
+from src.server.lib.tracing import span
+from src.server.lib.utils import log, log_enabled, errlog, get_token_expiry_datetime, utcnow, parse_date, parse_time, todict
 from src.server.lib.models import Credentials, Cookies, ContactUsSubmissionData
 from src.server.lib.types import TokenType, SettingValue
 from src.server.lib.exceptions import EmailTaken, NonExistent, InvalidCredentials, CookiesUnavailable, InvalidCookies
-from .tables import Session, Account, Token, Subscription, Team, Employee, Shift, Schedule, Holiday, Settings
+from .tables import Session, replica_engine, Account, Token, Subscription, Invoice, InvoiceSync, Team, Employee, Shift, Schedule, Holiday, Settings
+from .cache import touch, written_within, reading_own_writes
+from .tokens import encode_token, decode_token, revoke_token, is_revoked
+from .slow_queries import calling
+
+_ACTIVE_SUB_STATUSES = ('active', 'trialing')
+_repr = Repr()
+_repr.maxlevel, _repr.maxlist, _repr.maxdict, _repr.maxstring, _repr.maxother = 3, 10, 10, 200, 200
+_short_repr = _repr.repr  # Bounded repr for debug logs
 
 def _handle_args(args: tuple) -> tuple:
     # Sanitize credentials if the first parameter is of type `Credentials`
@@ -23,7 +34,8 @@ def _handle_args(args: tuple) -> tuple:
 
 def _handle_result(commit: bool, func: Callable, result: Any, args: tuple, kwargs: dict[str, Any], *, session: _SessionType) -> None:
     if commit: session.commit()
-    log(f'[{func.__name__}] args={args}\tkwargs={kwargs}\t{result}', 'db', 'DEBUG')
+    if log_enabled('db', 'DEBUG'):  # Arguments & results can be large (e.g., schedules), so only format them when needed
+        log('[%s] args=%s\tkwargs=%s\t%s', 'db', 'DEBUG', func.__name__, _short_repr(args), _short_repr(kwargs), _short_repr(result))
 
     if isinstance(result, (Account, Token, Team, Employee, Shift, Schedule, Holiday, Settings)):
         session.refresh(result)
@@ -37,37 +49,68 @@ def _handle_exception(e: Exception, func: Callable, *, session: _SessionType) ->
     raise e
 
 
-def dbsession(*, commit: bool = False):
+def _routing_account_id(params: list[str], args: tuple, kwargs: dict[str, Any]) -> Optional[int]:
+    """Returns the account ID a DB function is called for (from an `account_id` parameter or cookies), if any."""
+    if 'account_id' in kwargs: return kwargs['account_id']
+    if args and params and params[0] == 'account_id': return args[0]
+    if args and isinstance(args[0], Cookies): return args[0].account_id
+    return None
+
+
+def _open_session(replica: bool = False, account_id: Optional[int] = None) -> _SessionType:
+    """
+    Opens a new session. If `replica` is true, then it reads from the replica (when one is configured), unless the account
+    wrote within the last `REPLICA_STICKY_SECONDS`, so that it can read its own writes. Writes are known from this
+    process's commits, and from the client's `recent_write` cookie for writes handled by other workers (see `endpoint`).
+    """
+    session = Session()
+    if replica and replica_engine is not None and not reading_own_writes():
+        if account_id is None or not written_within(account_id, REPLICA_STICKY_SECONDS):
+            session.info['use_replica'] = True
+    return session
+
+
+def dbsession(*, commit: bool = False, replica: bool = False):
+    """
+    Injects a new session into the wrapped DB function, commits it if `commit` is true, and logs & re-raises errors.
+    Read-only functions with `replica` (reference data only) are routed to the read replica if one is configured.
+    Authentication, tokens & subscriptions are always read from the primary, as they must reflect the latest writes.
+    Each call is recorded as a `db.<function>` span of the current trace.
+    """
     def decorator(func: Callable) -> Callable:
         is_async = inspect.iscoroutinefunction(func)
+        params = [name for name in inspect.signature(func).parameters if name != 'session']
+        span_name = f'db.{func.__name__}'
 
         if is_async:
             @wraps(func)
             async def async_wrapper(*args, **kwargs):
-                session = Session()
-                try:
-                    args = _handle_args(args)
-                    result = await func(*args, session=session, **kwargs)
-                    _handle_result(commit, func, result, args, kwargs, session=session)
-                    return result
-                except Exception as e:
-                    _handle_exception(e, func, session=session)
-                finally:
-                    session.close()
+                with span(span_name), calling(func.__name__):
+                    session = _open_session(replica and not commit, _routing_account_id(params, args, kwargs))
+                    try:
+                        args = _handle_args(args)
+                        result = await func(*args, session=session, **kwargs)
+                        _handle_result(commit, func, result, args, kwargs, session=session)
+                        return result
+                    except Exception as e:
+                        _handle_exception(e, func, session=session)
+                    finally:
+                        session.close()
             return async_wrapper
         else:
             @wraps(func)
             def sync_wrapper(*args, **kwargs):
-                session = Session()
-                try:
-                    args = _handle_args(args)
-                    result = func(*args, session=session, **kwargs) 
-                    _handle_result(commit, func, result, args, kwargs, session=session)
-                    return result
-                except Exception as e:
-                    _handle_exception(e, func, session=session)
-                finally:
-                    session.close()
+                with span(span_name), calling(func.__name__):
+                    session = _open_session(replica and not commit, _routing_account_id(params, args, kwargs))
+                    try:
+                        args = _handle_args(args)
+                        result = func(*args, session=session, **kwargs) 
+                        _handle_result(commit, func, result, args, kwargs, session=session)
+                        return result
+                    except Exception as e:
+                        _handle_exception(e, func, session=session)
+                    finally:
+                        session.close()
             return sync_wrapper
     return decorator
 
@@ -121,12 +164,20 @@ def _check_schedule(schedule_id: int, *, session: _SessionType) -> Schedule:
     return schedule
 
 
+def _check_employees(employee_ids: list[int], *, session: _SessionType) -> None:
+    """Raises an exception if any of the given employee IDs does not exist, using a single query."""
+    if not employee_ids: return
+    existing_ids = set(session.scalars(select(Employee.employee_id).where(Employee.employee_id.in_(employee_ids))))
+    for emp_id in employee_ids:
+        if emp_id not in existing_ids: raise NonExistent('employee', emp_id)
+
+
 def _check_holiday(holiday_id: int, *, session: _SessionType) -> Holiday:
     """Returns an schedule if it exists using its ID."""
     holiday = session.get(Holiday, holiday_id)
     if not holiday: raise NonExistent('holiday', holiday_id)
     assert holiday.start_date <= holiday.end_date, 'Invalid start & end dates'
-    for emp_id in holiday.assigned_to: _check_employee(emp_id, session=session)
+    _check_employees(holiday.assigned_to, session=session)
     return holiday
 
 
@@ -209,14 +260,14 @@ def _sanitize_credentials(cred: Credentials) -> Credentials:
 
 
 def _hash_password(sanitized_password: str) -> str:
-    """Returns the string hash of a given sanitized password."""
-    return bcrypt.hashpw(sanitized_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """Returns the string hash of a given sanitized password. Runs on the bounded hashing pool."""
+    return hash_password(sanitized_password)
 
 
 def _verify_password(input_password: str, stored_hash: str) -> bool:
-    """Compares the input password with its stored hash securely."""
+    """Compares the input password with its stored hash securely. Runs on the bounded hashing pool."""
     input_password = _sanitize_password(input_password)
-    return bcrypt.checkpw(input_password.encode('utf-8'), stored_hash.encode('utf-8'))
+    return verify_password(input_password, stored_hash)
 
 
 def _authenticate_credentials(cred: Credentials, *, session: _SessionType) -> Account:
@@ -244,6 +295,12 @@ def _authenticate_credentials(cred: Credentials, *, session: _SessionType) -> Ac
     if not _verify_password(sanitized_cred.password, account.hashed_password):
         raise InvalidCredentials(cred)
 
+    # Transparently upgrade hashes made with a different cost factor
+    if needs_rehash(account.hashed_password):
+        account.hashed_password = _hash_password(sanitized_cred.password)
+        session.commit()
+        log(f'Rehashed password of account ID {account.account_id}', 'auth')
+
     return account
 
 
@@ -256,13 +313,22 @@ def _generate_new_token(token_type: TokenType = 'auth') -> dict[str, str | datet
     }
 
 
+def _encode_token(token_obj: Token, token_type: Optional[TokenType] = 'auth') -> str:
+    """
+    Returns the token handed to the client. With `TOKEN_FORMAT=signed`, auth tokens are signed & carry the stored token as their ID;
+    reset & verification tokens are always opaque.
+    """
+    if TOKEN_FORMAT != 'signed' or token_type not in (None, 'auth'): return token_obj.token
+    return encode_token(token_obj.account_id, token_obj.token, token_obj.expires_at)
+
+
 def _create_new_token(account_id: int, token_type: Optional[TokenType] = None, *, session: _SessionType) -> str:
-    """Creates a new authentication token for the client."""
+    """Creates a new token for the client. It is only flushed, so it is committed (or rolled back) with the caller's transaction."""
     token_obj = Token(account_id=account_id, **_generate_new_token(token_type))
     session.add(token_obj)
-    session.commit()
+    session.flush()
     log(f'New token created for account ID {account_id}: {token_obj.token}', 'auth')
-    return token_obj.token
+    return _encode_token(token_obj, token_type)
 
 
 def _get_token_from_account(account_id: int, token_type: Optional[TokenType] = None, *, session: _SessionType) -> Optional[Token]:
@@ -271,20 +337,34 @@ def _get_token_from_account(account_id: int, token_type: Optional[TokenType] = N
 
 
 def _renew_token(account_id: int, *, session: _SessionType) -> str:
-    """Renews an existing auth token of an account by generating a new token and updating the expiry date."""
+    """
+    Renews an existing auth token of an account by generating a new token and updating the expiry date.
+    The previous token stops being valid; if signed, it is added to the deny-list, which other processes pick up on their next sync.
+    """
     token_obj = _get_token_from_account(account_id, 'auth', session=session)
     if token_obj is None: raise NonExistent('token', account_id)
+    if TOKEN_FORMAT == 'signed':
+        revoke_token(token_obj.token, account_id, token_obj.expires_at, session=session)
     new_token = _generate_new_token()
     token_obj.token = new_token['token']
     token_obj.expires_at = new_token['expires_at']
     session.commit()
     log(f'Renewed token for account ID {account_id}: {token_obj.token}', 'auth')
-    return token_obj.token
+    return _encode_token(token_obj)
 
 
-def _validate_cookies(cookies: Cookies, *, session: _SessionType) -> Account:
-    """Validates the given cookies. Renews the token if it has expired and `renew_expired_token` is True."""
+def _validate_token(cookies: Cookies, *, session: _SessionType) -> datetime:
+    """
+    Returns the expiry of the valid token in the given cookies, or raises an exception.
+    Signed tokens are checked against their signature & the deny-list only, without reading the `tokens` table.
+    """
     if not cookies.available(): raise CookiesUnavailable(cookies)
+    if TOKEN_FORMAT == 'signed':
+        claims = decode_token(cookies.token, cookies.account_id)
+        if claims is None or is_revoked(claims['jti'], session=session):
+            raise InvalidCookies(cookies)
+        return datetime.fromtimestamp(claims['exp'], timezone.utc)
+
     _check_account(cookies.account_id, session=session)
     token_obj = session.query(Token).filter_by(account_id=cookies.account_id, token=cookies.token).first()
 
@@ -292,8 +372,13 @@ def _validate_cookies(cookies: Cookies, *, session: _SessionType) -> Account:
         raise InvalidCookies(cookies)
     elif utcnow() > token_obj.expires_at:
         raise InvalidCookies(cookies)
+    return token_obj.expires_at
+
 
-    account = _check_account(token_obj.account_id, session=session)
+def _validate_cookies(cookies: Cookies, *, session: _SessionType) -> Account:
+    """Validates the given cookies & returns their account."""
+    _validate_token(cookies, session=session)
+    account = _check_account(cookies.account_id, session=session)
     log(f'Validated cookies: {cookies}', 'auth')
     return account
 
@@ -328,18 +413,81 @@ def _get_email_from_token(token: str, token_type: TokenType, *, session: _Sessio
 
 
 def _get_active_sub(account_id: int, *, session: _SessionType) -> Optional[Subscription]:
-    """Returns the latest active subscription for the given account, or None if no active subscription exists."""
+    """
+    Returns the latest active subscription for the given account, or None if no active subscription exists.
+    Reads local state only; renewals & cancellations arrive via Stripe webhooks (`handle_stripe_event`) or `reconcile_subs`.
+    """
     sub = session.query(Subscription).filter(Subscription.account_id == account_id).order_by(Subscription.expires_at.desc()).first()
-    if not sub: return None
+    if not sub or sub.status not in _ACTIVE_SUB_STATUSES: return None
+    return sub if utcnow() < sub.expires_at + timedelta(seconds=SUB_GRACE_SECONDS) else None
 
-    if utcnow() > sub.expires_at:
-        stripe_sub = stripe.Subscription.retrieve(sub.stripe_subscription_id)
-        if stripe_sub.status not in ('active', 'trialing'):
-            return None  # Subscription truly expired or canceled
-        sub.expires_at = datetime.fromtimestamp(stripe_sub.current_period_end, tz=timezone.utc)
-        session.commit()
 
-    return sub if utcnow() < sub.expires_at else None
+def _apply_stripe_sub(sub: Subscription, stripe_sub: Any, synced_at: datetime) -> bool:
+    """Copies the status, period end & plan of a Stripe subscription unless the local state is newer. Returns whether it was applied."""
+    if sub.synced_at is not None and synced_at < sub.synced_at: return False  # Out-of-order event
+    sub.status = stripe_sub.status
+    sub.expires_at = datetime.fromtimestamp(stripe_sub.current_period_end, tz=timezone.utc)
+    lookup_key = stripe_sub['items']['data'][0]['price'].get('lookup_key')
+    if lookup_key: sub.plan = lookup_key.lower()
+    sub.synced_at = synced_at
+    log(f'Synced {sub} with Stripe: status={sub.status}, expires_at={sub.expires_at}', 'subscription')
+    return True
+
+
+def _invoice_values(invoice: Any, account_id: int) -> dict[str, Any]:
+    """Maps a Stripe invoice to a row of the `invoices` table."""
+    return {
+        'invoice_id': invoice.id,
+        'account_id': account_id,
+        'stripe_subscription_id': invoice.subscription,
+        'amount_due': invoice.amount_due,
+        'amount_paid': invoice.amount_paid,
+        'currency': invoice.currency.upper(),
+        'status': invoice.status,
+        'invoice_pdf': invoice.invoice_pdf,
+        'hosted_invoice_url': invoice.hosted_invoice_url,
+        'description': invoice.description,
+        'created_at': datetime.fromtimestamp(invoice.created, tz=timezone.utc),
+        'due_date': datetime.fromtimestamp(invoice.due_date, tz=timezone.utc) if invoice.due_date else None
+    }
+
+
+def _upsert_invoices(rows: list[dict[str, Any]], *, session: _SessionType) -> None:
+    """Inserts the given invoice rows, overwriting stored invoices with the same IDs."""
+    if not rows: return
+    stmt = pg_insert(Invoice).values(rows)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[Invoice.invoice_id],
+        set_={col: stmt.excluded[col] for col in rows[0] if col != 'invoice_id'}
+    ))
+
+
+def _mark_invoices_synced(account_id: int, *, session: _SessionType) -> None:
+    stmt = pg_insert(InvoiceSync).values(account_id=account_id, synced_at=utcnow())
+    session.execute(stmt.on_conflict_do_update(index_elements=[InvoiceSync.account_id], set_={'synced_at': stmt.excluded.synced_at}))
+
+
+def _invoice_to_dict(invoice: Invoice) -> dict[str, Any]:
+    """Returns a stored invoice in the shape the dashboard expects (amounts in major units, ISO dates)."""
+    return {
+        'invoice_id': invoice.invoice_id,
+        'amount_due': invoice.amount_due / 100,
+        'amount_paid': invoice.amount_paid / 100,
+        'currency': invoice.currency,
+        'status': invoice.status,
+        'invoice_pdf': invoice.invoice_pdf,
+        'hosted_invoice_url': invoice.hosted_invoice_url,
+        'created_at': invoice.created_at.isoformat(),
+        'due_date': invoice.due_date.isoformat() if invoice.due_date else None,
+        'description': invoice.description,
+        'subscription_id': invoice.stripe_subscription_id
+    }
+
+
+def _read_invoices(account_id: int, stripe_subscription_id: str, *, session: _SessionType) -> list[dict[str, Any]]:
+    """Returns the stored invoices of one of the account's subscriptions, newest first."""
+    invoices = session.query(Invoice).filter_by(account_id=account_id, stripe_subscription_id=stripe_subscription_id).order_by(Invoice.created_at.desc()).all()
+    return [_invoice_to_dict(invoice) for invoice in invoices]
 
 
 def _validate_and_cast(setting: str, value: SettingValue, column_type: Boolean | Enum | String) -> SettingValue:
@@ -385,9 +533,175 @@ def _validate_and_cast(setting: str, value: SettingValue, column_type: Boolean |
     raise TypeError(f"Unsupported column type: {type(column_type)}")
 
 
-def _delete_all_holidays_of_employee(employee_id: int, *, session: _SessionType) -> None:
-    holidays = session.query(Holiday).filter(Holiday.assigned_to.any(employee_id)).all()
-    for holiday in holidays:
-        holiday.assigned_to = array([id for id in holiday.assigned_to if id != employee_id])
-        if len(holiday.assigned_to) == 0:
-            session.delete(holiday)
\ No newline at end of file
+def _remove_employees_from_holidays(employee_ids: list[int], *, session: _SessionType) -> None:
+    """
+    Removes the given employee IDs from every holiday assigned to them, and deletes holidays that end up with no employees.
+    Runs as two set-based statements regardless of how many employees or holidays are affected.
+    """
+    if not employee_ids: return
+    emptied_ids = session.scalars(
+        text("""
+            UPDATE holidays
+            SET assigned_to = ARRAY(SELECT emp_id FROM unnest(assigned_to) AS emp_id WHERE emp_id <> ALL(:employee_ids))
+            WHERE assigned_to && CAST(:employee_ids AS INT[])
+            RETURNING CASE WHEN cardinality(assigned_to) = 0 THEN holiday_id END
+        """),
+        {'employee_ids': list(employee_ids)}
+    ).all()
+    emptied_ids = [holiday_id for holiday_id in emptied_ids if holiday_id is not None]
+    if emptied_ids:
+        session.execute(text('DELETE FROM holidays WHERE holiday_id = ANY(:holiday_ids)'), {'holiday_ids': emptied_ids})
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Holiday): session.expire(obj)  # Holidays loaded into the session are now stale
+
+
+def _check_bulk_size(items: list) -> None:
+    """Checks that a bulk request is not empty and does not exceed `MAX_BULK_ITEMS`."""
+    if not items: raise ValueError('No items were given.')
+    if len(items) > MAX_BULK_ITEMS: raise ValueError(f'Too many items in one request (maximum is {MAX_BULK_ITEMS}).')
+
+
+def _check_name(name: Any, entity: str, max_len: int = 40) -> str:
+    """Checks & returns a valid name of an entity."""
+    if not isinstance(name, str) or not (0 < len(name) <= max_len):
+        raise ValueError(f'{entity.title()} name must be between 1 and {max_len} characters long.')
+    return name
+
+
+def _check_employee_row(row: dict[str, Any], team_ids: set[int]) -> dict[str, Any]:
+    """Checks & returns a valid employee row of a bulk request, given the team IDs of the account."""
+    team_id = row.get('team_id')
+    if team_id not in team_ids: raise ValueError(f'Team with ID "{team_id}" does not exist in your account.')
+    min_work_hours, max_work_hours = _check_work_hours(row.get('min_work_hours'), row.get('max_work_hours'))
+    return {
+        'employee_name': _check_name(row.get('employee_name'), 'employee'),
+        'team_id': team_id,
+        'min_work_hours': min_work_hours,
+        'max_work_hours': max_work_hours
+    }
+
+
+def _check_shift_row(row: dict[str, Any], taken_names: set[str]) -> dict[str, Any]:
+    """Checks & returns a valid shift row of a bulk request. `taken_names` is updated with the name of the valid shift."""
+    shift_name = _check_name(row.get('shift_name'), 'shift')
+    if shift_name in taken_names: raise ValueError(f'Shift with name {shift_name} was already created in your account.')
+    start_time, end_time = row.get('start_time'), row.get('end_time')
+    if type(start_time) is str: start_time = parse_time(start_time)
+    if type(end_time) is str: end_time = parse_time(end_time)
+    if not (isinstance(start_time, time) and isinstance(end_time, time)): raise ValueError('Invalid start & end times')
+    taken_names.add(shift_name)
+    return {'shift_name': shift_name, 'start_time': start_time, 'end_time': end_time}
+
+
+def _check_holiday_row(row: dict[str, Any], employee_ids: set[int]) -> dict[str, Any]:
+    """Checks & returns a valid holiday row of a bulk request, given the employee IDs of the account."""
+    assigned_to = row.get('assigned_to')
+    if not (isinstance(assigned_to, list) and assigned_to): raise ValueError('A holiday must be assigned to at least one employee.')
+    for emp_id in assigned_to:
+        if emp_id not in employee_ids: raise NonExistent('employee', emp_id)
+
+    start_date, end_date = row.get('start_date'), row.get('end_date')
+    if type(start_date) is str: start_date = parse_date(start_date)
+    if type(end_date) is str: end_date = parse_date(end_date)
+    if not (isinstance(start_date, date) and isinstance(end_date, date)): raise ValueError('Invalid start & end dates')
+    assert start_date <= end_date, 'Invalid start & end dates'
+    return {
+        'holiday_name': _check_name(row.get('holiday_name'), 'holiday'),
+        'assigned_to': assigned_to,
+        'start_date': start_date,
+        'end_date': end_date
+    }
+
+
+def _validate_rows(rows: list[dict[str, Any]], check: Callable[[dict[str, Any]], dict[str, Any]]) -> tuple[list[tuple[int, dict[str, Any]]], list[dict[str, Any]]]:
+    """
+    Validates every row of a bulk request up front.
+    Returns the valid rows paired with their index in the request, and a per-item list of errors.
+    """
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, check(row)))
+        except Exception as e:
+            errors.append({'index': index, 'error': str(e) or type(e).__name__})
+    return valid, errors
+
+
+def _bulk_insert(model: type, rows: list[dict[str, Any]], *, session: _SessionType) -> list:
+    """Inserts the given rows with a single multi-row `INSERT ... RETURNING`, and returns the created objects in the same order."""
+    if not rows: return []
+    for account_id in {row['account_id'] for row in rows}: touch(account_id, session=session)
+    return list(session.scalars(insert(model).returning(model, sort_by_parameter_order=True), rows))
+
+
+def _bulk_update(
+    model: type,
+    entity: str,
+    account_id: int,
+    items: list[dict[str, Any]],
+    allowed_fields: set[str],
+    check: Callable[[dict[str, Any]], dict[str, Any]],
+    *,
+    unique_field: Optional[str] = None,
+    session: _SessionType
+) -> tuple[list[tuple[int, Any]], list[dict[str, Any]]]:
+    """
+    Validates & applies a batch of updates to rows of `model` that belong to the given account.
+    Each item holds the row's ID (e.g., `employee_id`) and the attributes to modify. The rows are fetched with one query,
+    and each item is validated by `check` against the row merged with its updates.
+    If `unique_field` is given, its new values are checked against the account's rows as they stand after the whole batch,
+    so that rows may swap values (e.g., two shifts swapping names).
+    Returns the updated objects paired with their index in the request, and a per-item list of errors.
+    """
+    id_key = f'{entity}_id'
+    id_column = getattr(model, id_key)
+    ids = [item.get(id_key) for item in items if isinstance(item.get(id_key), int)]
+    objs = {getattr(obj, id_key): obj for obj in session.query(model).filter(model.account_id == account_id, id_column.in_(ids))}
+
+    def check_item(item: dict[str, Any]) -> tuple[Any, dict[str, Any]]:
+        obj = objs.get(item.get(id_key))
+        if obj is None: raise NonExistent(entity, item.get(id_key))
+        updates = {key: value for key, value in item.items() if key != id_key}
+        for key in updates:
+            if key not in allowed_fields: raise ValueError(f'"{key}" is not a valid attribute to modify.')
+        row = check(todict(obj) | updates)
+        return obj, {key: row[key] for key in updates}
+
+    valid, errors = _validate_rows(items, check_item)
+    if unique_field is not None:
+        valid, errors = _reject_duplicates(model, entity, account_id, unique_field, valid, errors, session=session)
+    for _, (obj, updates) in valid:
+        for key, value in updates.items(): setattr(obj, key, value)
+    session.flush()
+    return [(index, obj) for index, (obj, _) in valid], errors
+
+
+def _reject_duplicates(
+    model: type,
+    entity: str,
+    account_id: int,
+    field: str,
+    valid: list[tuple[int, tuple[Any, dict[str, Any]]]],
+    errors: list[dict[str, Any]],
+    *,
+    session: _SessionType
+) -> tuple[list[tuple[int, tuple[Any, dict[str, Any]]]], list[dict[str, Any]]]:
+    """
+    Rejects the valid updates of a bulk request that would leave two rows of the account with the same `field` value.
+    Values are compared as they stand after the whole batch, and a rejected update keeps its row's current value,
+    which may in turn collide with another update, so this repeats until the final values are unique.
+    """
+    id_key = f'{entity}_id'
+    final = dict(session.execute(select(getattr(model, id_key), getattr(model, field)).filter(model.account_id == account_id)).all())
+    final |= {getattr(obj, id_key): updates[field] for _, (obj, updates) in valid if field in updates}
+    while True:
+        holders: dict[Any, list[Any]] = {}
+        for row_id, value in final.items(): holders.setdefault(value, []).append(row_id)
+        rejected = [(index, obj, updates[field]) for index, (obj, updates) in valid
+                    if field in updates and updates[field] != getattr(obj, field) and len(holders[updates[field]]) > 1]
+        if not rejected: return valid, sorted(errors, key=lambda error: error['index'])
+        rejected_indexes = {index for index, _, _ in rejected}
+        for index, obj, value in rejected:
+            final[getattr(obj, id_key)] = getattr(obj, field)
+            errors.append({'index': index, 'error': f'{entity.capitalize()} with {field.removeprefix(entity + "_")} {value} was already created in your account.'})
+        valid = [entry for entry in valid if entry[0] not in rejected_indexes]
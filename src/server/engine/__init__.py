@@ -1,11 +1,53 @@
 from datetime import datetime, timedelta
+from functools import wraps
+from threading import Lock
+import time, jpype
 from jpype import java, JPackage, JInt, JString, JArray
+from src.server.lib.constants import SCHEDULE_ENGINE_PATH
 from src.server.lib.models import ScheduleType
+from src.server.lib.tracing import traced
 from src.server.db.tables import Employee, Shift, Holiday
 
+_stats_lock = Lock()
+_stats = {'in_progress': 0, 'completed': 0, 'failed': 0, 'seconds': 0.0}
+_jvm_lock = Lock()
+
+
+def start_jvm() -> None:
+    """Starts the JVM with the schedule engine on its classpath, unless it is already running. Safe to call from any thread."""
+    with _jvm_lock:
+        if not jpype.isJVMStarted():
+            jpype.startJVM(classpath=SCHEDULE_ENGINE_PATH)
+
+
+def _track(func):
+    """Counts schedule generations that are in progress & finished, and the time spent in them."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        with _stats_lock: _stats['in_progress'] += 1
+        outcome = 'failed'
+        try:
+            result = func(*args, **kwargs)
+            outcome = 'completed'
+            return result
+        finally:
+            with _stats_lock:
+                _stats['in_progress'] -= 1
+                _stats[outcome] += 1
+                _stats['seconds'] += time.perf_counter() - started_at
+    return wrapper
+
+
+def get_engine_stats() -> dict[str, int | float]:
+    """Returns the number of schedule generations in progress, completed & failed, and the total seconds spent generating."""
+    with _stats_lock: return dict(_stats)
+
+
 class Engine:
     """Class for the schedule generator engine API."""
     def __init__(self, account_id: int, team_id: int):
+        start_jvm()  # Waits for a background start, or starts it on first use (see `JVM_STARTUP`)
         algorithms = JPackage('server.engine.algorithms')
         common = JPackage('server.engine.common')
         self.Employee = common.Employee
@@ -23,6 +65,8 @@ class Engine:
             raise NotImplementedError(f'Team {team_id} algorithm for account {account_id} was not yet implemented.') from e 
 
 
+    @traced('engine.generate')
+    @_track
     def generate(self, employees: list[Employee], shifts: list[Shift], holidays: list[Holiday], num_days: int, year: int, month: int) -> ScheduleType:
         """Generates the Java Schedule object, and then converts and returns it as a Pythonic list."""
         raw_schedule = self._generate(
@@ -0,0 +1,128 @@
+from typing import Callable, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass, field
+import asyncio, time
+from src.server.lib.constants import ENGINE_WORKERS, ENGINE_MAX_QUEUED_PER_ACCOUNT
+from src.server.lib.types import PricingPlanEnum
+from src.server.lib.exceptions import EngineBusy
+from src.server.lib.metrics import Histogram
+
+# Per plan: (weight in the fair queue, max. concurrent generations per account)
+PLAN_POLICIES: dict[PricingPlanEnum, tuple[int, int]] = {
+    PricingPlanEnum.STARTER: (1, 1),
+    PricingPlanEnum.GROWTH: (2, 1),
+    PricingPlanEnum.ADVANCED: (3, 2),
+    PricingPlanEnum.ENTERPRISE: (4, 2)
+}
+queue_wait = Histogram('shiftiatrics_engine_queue_wait_seconds', 'Time schedule generations waited for an engine worker, by plan.', ('plan',))
+
+
+@dataclass(order=True)
+class _Job:
+    finish_tag: float
+    seq: int
+    account_id: int = field(compare=False)
+    plan: PricingPlanEnum = field(compare=False)
+    run: Callable[[], Any] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    queued_at: float = field(compare=False)
+
+
+class AdmissionController:
+    """
+    Admits schedule generations to a pool of `ENGINE_WORKERS` engine threads using weighted fair queuing across accounts:
+    each job is tagged with a virtual finish time that advances by 1/weight of its account's plan, and the free worker
+    takes the job with the earliest tag whose account is under its plan's concurrency quota. An account submitting many
+    jobs therefore only delays others by its fair share. All state is owned by the event loop's thread.
+    """
+    def __init__(self, workers: int = ENGINE_WORKERS, max_queued_per_account: int = ENGINE_MAX_QUEUED_PER_ACCOUNT):
+        self.workers = workers
+        self.max_queued_per_account = max_queued_per_account
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: list[_Job] = []
+        self._seq = 0
+        self._virtual_time = 0.0
+        self._last_finish: dict[int, float] = {}  # account ID -> finish tag of its latest job
+        self._running: dict[int, int] = {}  # account ID -> running jobs
+        self._queued: dict[int, int] = {}  # account ID -> queued jobs
+        self._running_by_plan: dict[PricingPlanEnum, int] = {}
+        self._busy_workers = 0
+
+
+    async def run(self, account_id: int, plan: PricingPlanEnum, func: Callable, *args) -> Any:
+        """Runs `func(*args)` on an engine worker once admitted, and returns its result. Raises `EngineBusy` if the account's queue is full."""
+        if self._queued.get(account_id, 0) >= self.max_queued_per_account: raise EngineBusy(account_id)
+        weight = PLAN_POLICIES[plan][0]
+        finish_tag = max(self._virtual_time, self._last_finish.get(account_id, 0.0)) + 1 / weight
+        self._last_finish[account_id] = finish_tag
+        self._seq += 1
+
+        context = copy_context()  # Keeps the request's trace for the engine's spans
+        job = _Job(finish_tag, self._seq, account_id, plan, lambda: context.run(func, *args), asyncio.get_running_loop().create_future(), time.perf_counter())
+        self._queue.append(job)
+        self._queued[account_id] = self._queued.get(account_id, 0) + 1
+        self._dispatch()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            if job in self._queue: self._remove(job)  # Client went away before its job started
+            raise
+
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Returns the number of queued & running generations by plan."""
+        stats = {plan.value: {'queued': 0, 'running': 0} for plan in PricingPlanEnum}
+        for job in self._queue: stats[job.plan.value]['queued'] += 1
+        for plan, running in self._running_by_plan.items(): stats[plan.value]['running'] = running
+        return stats
+
+
+    def shutdown(self) -> None:
+        """Waits for running generations to finish & stops the engine workers."""
+        if self._executor is not None: self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+
+    def _remove(self, job: _Job) -> None:
+        self._queue.remove(job)
+        self._queued[job.account_id] -= 1
+        if not self._queued[job.account_id]: del self._queued[job.account_id]
+
+
+    def _dispatch(self) -> None:
+        """Starts the earliest-tagged eligible jobs while workers are free."""
+        while self._busy_workers < self.workers:
+            eligible = [job for job in self._queue if self._running.get(job.account_id, 0) < PLAN_POLICIES[job.plan][1]]
+            if not eligible: return
+            job = min(eligible)
+            self._remove(job)
+            self._virtual_time = max(self._virtual_time, job.finish_tag - 1 / PLAN_POLICIES[job.plan][0])
+            self._start(job)
+
+
+    def _start(self, job: _Job) -> None:
+        queue_wait.observe(time.perf_counter() - job.queued_at, job.plan.value)
+        self._busy_workers += 1
+        self._running[job.account_id] = self._running.get(job.account_id, 0) + 1
+        self._running_by_plan[job.plan] = self._running_by_plan.get(job.plan, 0) + 1
+        if self._executor is None: self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='engine')
+        task = asyncio.get_running_loop().run_in_executor(self._executor, job.run)
+        task.add_done_callback(lambda task: self._finish(job, task))
+
+
+    def _finish(self, job: _Job, task: asyncio.Future) -> None:
+        self._busy_workers -= 1
+        self._running[job.account_id] -= 1
+        if not self._running[job.account_id]: del self._running[job.account_id]
+        self._running_by_plan[job.plan] -= 1
+        if not self._queued.get(job.account_id) and not self._running.get(job.account_id):
+            self._last_finish.pop(job.account_id, None)  # Idle accounts restart from the current virtual time
+        if job.future.done(): pass  # The request was cancelled while its job ran
+        elif task.cancelled(): job.future.cancel()
+        elif task.exception() is not None: job.future.set_exception(task.exception())
+        else: job.future.set_result(task.result())
+        self._dispatch()
+
+
+admission = AdmissionController()
@@ -1,18 +1,26 @@
 from typing import Any, Optional
 from functools import wraps
+import hashlib, math
 from fastapi import Request, Response
-from src.server.db import Account, Subscription, Employee, Shift, Schedule, Holiday, Settings, log_in_account_with_cookies, check_sub_expired
-from src.server.lib.constants import COOKIE_DOMAIN, TOKEN_EXPIRY_SECONDS
+from fastapi.responses import ORJSONResponse
+from src.server.db import Account, Subscription, replica_engine, log_in_account_with_cookies, check_sub_expired, get_data_version, at_data_version, own_writes
+from src.server.lib.constants import COOKIE_DOMAIN, TOKEN_EXPIRY_SECONDS, REPLICA_STICKY_SECONDS
 from src.server.lib.models import Cookies
-from src.server.lib.utils import log, errlog, todict, todicts
+from src.server.lib.utils import log, errlog, todict, todicts, is_model
+from src.server.lib.tracing import span
+from src.server.lib.metrics import endpoint_errors
 from src.server.lib.exceptions import CookiesUnavailable, InvalidCookies, EndpointAuthError, NonExistent, EmailTaken
 
 ## Private
 def _authenticate(kwargs: dict[str, Any]) -> Optional[dict[str, str]]:
-    """Requires credentials (in cookies) to prevent unauthorized clients from accessing sensitive endpoints."""
+    """
+    Requires credentials (in cookies) to prevent unauthorized clients from accessing sensitive endpoints.
+    The account & its active subscription are kept on `request.state`, so that endpoints do not authenticate again.
+    """
     try:
         cookies = get_cookies(kwargs['request'])
-        account = log_in_account_with_cookies(cookies)[0]
+        account, sub = log_in_account_with_cookies(cookies)
+        kwargs['request'].state.account, kwargs['request'].state.sub = account, sub
         if 'account_id' in kwargs:
             if account.account_id != kwargs['account_id']:
                 raise EndpointAuthError()
@@ -22,14 +30,59 @@ def _authenticate(kwargs: dict[str, Any]) -> Optional[dict[str, str]]:
 
 def _handle_return_type(result: Any) -> dict | list[dict] | Any:
     """Converts a given type to a data type that is suitable to be an API response."""
-    if type(result) in (Account, Subscription, Employee, Shift, Schedule, Holiday, Settings):
+    if is_model(result):
         return todict(result)
-    elif type(result) is list:
-        try: return todicts(result)
-        except: return result
+    elif type(result) is list and result and is_model(result[0]):
+        return todicts(result)
     return result
 
 
+def _to_response(result: Any, kwargs: dict[str, Any]) -> Response:
+    """
+    Encodes an endpoint's result with orjson, which handles dates & times natively, skipping FastAPI's `jsonable_encoder`.
+    Headers & status code set on the endpoint's injected `response` parameter (e.g., cookies) are carried over.
+    """
+    if isinstance(result, Response): return result
+    response = ORJSONResponse(_handle_return_type(result))
+    sub_response = kwargs.get('response')
+    if isinstance(sub_response, Response):
+        response.raw_headers.extend(sub_response.raw_headers)
+        if sub_response.status_code: response.status_code = sub_response.status_code
+    request = kwargs.get('request')
+    if replica_engine is not None and isinstance(request, Request) and request.method not in ('GET', 'HEAD'):
+        # Sends the client's reads to the primary for a while, whichever worker serves them (see `_open_session`)
+        response.set_cookie('recent_write', '1', max_age=math.ceil(REPLICA_STICKY_SECONDS), httponly=True, samesite='strict', domain=COOKIE_DOMAIN)
+    return response
+
+
+def _version_etag(version: int, request: Request) -> str:
+    """Strong ETag of a response derived from the account's data version, distinct for each endpoint & query."""
+    digest = hashlib.blake2b(f'{request.url.path}?{request.url.query}'.encode(), digest_size=8).hexdigest()
+    return f'"{version}-{digest}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's `If-None-Match` header lists the given ETag (compared weakly, as the header requires)."""
+    header = request.headers.get('if-none-match')
+    if not header: return False
+    if header.strip() == '*': return True
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+
+def _with_etag(response: Response, request: Request, etag: Optional[str]) -> Response:
+    """Tags a successful response with the given ETag, or else a hash of its body, and replaces it with a 304 if the client has it already."""
+    if response.status_code != 200 or not hasattr(response, 'body'): return response
+    etag = etag or f'"{hashlib.blake2b(response.body, digest_size=16).hexdigest()}"'
+    if _etag_matches(request, etag): return _not_modified(etag)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'  # Cached by the browser, but revalidated on every use
+    return response
+
+
 def _set_cookie(key: str, value: str, response: Response) -> None:
     """Stores a cookie with a given value."""
     response.set_cookie(
@@ -44,22 +97,39 @@ def _set_cookie(key: str, value: str, response: Response) -> None:
 
 
 ## Public
-def endpoint(*, auth: bool = True):
-    """If `auth` is true, then the wrapped endpoint requires credentials via cookies."""
+def endpoint(*, auth: bool = True, etag: bool = False):
+    """
+    If `auth` is true, then the wrapped endpoint requires credentials via cookies.
+    If `etag` is true, then responses carry an ETag, and requests whose `If-None-Match` matches it get a bodiless 304.
+    For endpoints that take an `account_id`, the ETag is derived from the account's data version, which is looked up
+    before the endpoint runs, so unchanged data is neither read nor serialized. Others are tagged with a hash of the body.
+    """
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            try:
-                if auth: _authenticate(kwargs)
-                result = await func(*args, **kwargs)
-                return _handle_return_type(result)
-            except Exception as e:
-                errlog(func.__name__, e, 'api')
-                if type(e) is NonExistent and e.entity == 'account':
-                    return {'error': 'Invalid credentials'}
-                elif type(e) is EmailTaken:
-                    return {'error': 'Something went wrong. Please try again or use a different email.'}
-                return {'error': str(e)}
+            request = kwargs.get('request')
+            with own_writes(isinstance(request, Request) and 'recent_write' in request.cookies):
+                try:
+                    if auth:
+                        with span('auth'): _authenticate(kwargs)
+                    version = tag = None
+                    if etag and 'account_id' in kwargs:
+                        with span('etag'): version = get_data_version(kwargs['account_id'])
+                        tag = _version_etag(version, kwargs['request'])
+                        if _etag_matches(kwargs['request'], tag): return _not_modified(tag)
+                    with span(f'endpoint.{func.__name__}'), at_data_version(version):
+                        result = await func(*args, **kwargs)
+                    response = _to_response(result, kwargs)
+                    return _with_etag(response, kwargs['request'], tag) if etag else response
+                except Exception as e:
+                    errlog(func.__name__, e, 'api')
+                    endpoint_errors.inc(func.__name__, type(e).__name__)
+                    # Errors go through `_to_response` too, so headers & cookies set before the error (e.g., `clear_cookies`) are kept
+                    if type(e) is NonExistent and e.entity == 'account':
+                        return _to_response({'error': 'Invalid credentials'}, kwargs)
+                    elif type(e) is EmailTaken:
+                        return _to_response({'error': 'Something went wrong. Please try again or use a different email.'}, kwargs)
+                    return _to_response({'error': str(e)}, kwargs)
         return wrapper
     return decorator
 
@@ -1,5 +1,5 @@
 from dotenv import load_dotenv; load_dotenv()
-import os, bcrypt, stripe
+import os
 
 _CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))  # path with respect to this file
 _locate = lambda x: os.path.join(_CURRENT_DIR, x)
@@ -18,17 +18,46 @@ PSQL_DB = os.getenv('POSTGRES_DB')
 PSQL_USER = os.getenv('POSTGRES_USER')
 PSQL_PASSWORD = os.getenv('POSTGRES_PASSWORD')
 ENGINE_URL = f'postgresql+psycopg2://{PSQL_USER}:{PSQL_PASSWORD}@{PSQL_HOST}:{PSQL_PORT}/{PSQL_DB}'
+PSQL_REPLICA_HOST = os.getenv('POSTGRES_REPLICA_HOST')  # Optional read replica
+PSQL_REPLICA_PORT = os.getenv('POSTGRES_REPLICA_PORT', PSQL_PORT)
+REPLICA_ENGINE_URL = f'postgresql+psycopg2://{PSQL_USER}:{PSQL_PASSWORD}@{PSQL_REPLICA_HOST}:{PSQL_REPLICA_PORT}/{PSQL_DB}' if PSQL_REPLICA_HOST else None
+REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '5'))  # Reference data reads of an account (or client, via a cookie) go to the primary for this long after it writes
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0.2'))  # Statements taking longer are written to the slow-query log
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', '0.1'))  # Fraction of slow SELECTs whose plan is captured with EXPLAIN ANALYZE
+SLOW_QUERY_MAX_STATEMENTS = int(os.getenv('SLOW_QUERY_MAX_STATEMENTS', '500'))  # Distinct statements kept in the top-offenders summary
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '30'))  # 0 disables the reference data cache
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
 
 # Security
 MIN_EMAIL_LEN = int(os.getenv('MIN_EMAIL_LEN'))
 MAX_EMAIL_LEN = int(os.getenv('MAX_EMAIL_LEN'))
 MIN_PASSWORD_LEN = int(os.getenv('MIN_PASSWORD_LEN'))
 MAX_PASSWORD_LEN = int(os.getenv('MAX_PASSWORD_LEN'))
-FAKE_HASH = bcrypt.hashpw(b'fake_password', bcrypt.gensalt()).decode('utf-8')
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))  # Existing hashes with a different cost are rehashed on login
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(min(4, os.cpu_count() or 1))))  # Max. concurrent password hashes
 TOKEN_EXPIRY_SECONDS = int(os.getenv('TOKEN_EXPIRY_SECONDS'))
 DEFAULT_RATE_LIMIT = os.getenv('DEFAULT_RATE_LIMIT')
+RATE_LIMIT_STORAGE_URI = os.getenv('RATE_LIMIT_STORAGE_URI', 'leased+memory://')  # e.g., 'leased+redis://redis:6379' to share limits across workers
+RATE_LIMIT_LEASE_FRACTION = float(os.getenv('RATE_LIMIT_LEASE_FRACTION', '0.1'))  # Share of a limit a worker may reserve & grant without the shared storage
+TRUSTED_PROXIES = frozenset(filter(None, os.getenv('TRUSTED_PROXIES', '127.0.0.1,::1').split(',')))  # Peers whose `X-Forwarded-For` is trusted
+AUTH_CACHE_TTL_SECONDS = float(os.getenv('AUTH_CACHE_TTL_SECONDS', '30'))  # 0 disables the authenticated-session cache
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000'))
+TOKEN_FORMAT = os.getenv('TOKEN_FORMAT', 'opaque')  # 'opaque' (looked up in the DB) or 'signed' (HMAC-signed & validated without the DB)
+TOKEN_SECRET = os.getenv('TOKEN_SECRET')
+REVOCATION_SYNC_SECONDS = float(os.getenv('REVOCATION_SYNC_SECONDS', '10'))  # How often the deny-list of signed tokens is re-read from the DB
+TOKEN_SWEEP_INTERVAL_SECONDS = float(os.getenv('TOKEN_SWEEP_INTERVAL_SECONDS', '3600'))  # 0 disables the background sweeper of expired tokens
+TOKEN_SWEEP_BATCH_SIZE = int(os.getenv('TOKEN_SWEEP_BATCH_SIZE', '1000'))
 COOKIE_DOMAIN = None
 
+if TOKEN_FORMAT not in ('opaque', 'signed'):
+    raise ValueError(f'Invalid TOKEN_FORMAT: {TOKEN_FORMAT}')
+elif TOKEN_FORMAT == 'signed' and not TOKEN_SECRET:
+    raise ValueError('TOKEN_SECRET must be defined to issue signed tokens.')
+
+# Bulk & pagination
+MAX_BULK_ITEMS = int(os.getenv('MAX_BULK_ITEMS', '5000'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
 # Email
 MAIL_USERNAME = os.getenv('MAIL_USERNAME')
 MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
@@ -40,23 +69,55 @@ MAIL_SSL = bool(int(os.getenv('MAIL_SSL', '0')))
 SUPPORT_EMAIL = os.getenv('SUPPORT_EMAIL')
 NOREPLY_EMAIL = os.getenv('NOREPLY_EMAIL')
 SYSTEM_EMAIL = os.getenv('SYSTEM_EMAIL')
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '50'))  # Emails sent per batch over one SMTP connection
+EMAIL_POLL_SECONDS = float(os.getenv('EMAIL_POLL_SECONDS', '2'))  # How often an idle sender checks the outbox
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '8'))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv('EMAIL_RETRY_BASE_SECONDS', '30'))  # Doubled after every failed attempt, up to an hour
+EMAIL_CLAIM_SECONDS = float(os.getenv('EMAIL_CLAIM_SECONDS', '120'))  # Claimed emails are retried after this long if their sender died
 
 # Subscription
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 PLAN_NAMES = ['starter', 'growth', 'advanced', 'enterprise']
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+SUB_GRACE_SECONDS = float(os.getenv('SUB_GRACE_SECONDS', '3600'))  # How long an active subscription stays usable past its period end, awaiting its renewal
+SUB_RECONCILE_INTERVAL_SECONDS = float(os.getenv('SUB_RECONCILE_INTERVAL_SECONDS', '900'))  # 0 disables the reconciler of missed webhooks
+INVOICE_MAX_STALENESS_SECONDS = float(os.getenv('INVOICE_MAX_STALENESS_SECONDS', '86400'))  # Older stored invoices are re-read from Stripe before being served
+INVOICE_REFRESH_INTERVAL_SECONDS = float(os.getenv('INVOICE_REFRESH_INTERVAL_SECONDS', '3600'))  # 0 disables the background invoice refresher
 
 if STRIPE_SECRET_KEY is None:
     raise ValueError('Stripe API keys are not defined.')
-else:
-    stripe.api_key = STRIPE_SECRET_KEY
 
 # Misc
 PROD_URL = 'https://shiftiatrics.com'
 
 TEMPLATES_DIR = _locate('../templates/')
+TEMPLATES_AUTO_RELOAD = bool(int(os.getenv('TEMPLATES_AUTO_RELOAD', '0')))  # Recompile edited templates without restarting (development)
 SCHEDULE_ENGINE_PATH = _locate('../engine/engine.jar')
-DB_SCHEMA_PATH = _locate('../../db/schema.sql')
+JVM_STARTUP = os.getenv('JVM_STARTUP', 'background')  # 'eager' (before serving), 'background' (while serving), or 'lazy' (on the first schedule generation)
+MIGRATE_ON_STARTUP = bool(int(os.getenv('MIGRATE_ON_STARTUP', '1')))  # Disable when migrations are applied once per deploy (`scripts.migrate`)
+if JVM_STARTUP not in ('eager', 'background', 'lazy'):
+    raise ValueError(f'Invalid JVM_STARTUP: {JVM_STARTUP}')
+ENGINE_WORKERS = int(os.getenv('ENGINE_WORKERS', str(min(4, os.cpu_count() or 1))))  # Max. concurrent schedule generations
+ENGINE_MAX_QUEUED_PER_ACCOUNT = int(os.getenv('ENGINE_MAX_QUEUED_PER_ACCOUNT', '20'))  # Further generations of the account are rejected
+MIGRATIONS_DIR = _locate('../../db/migrations/')
 
 ENABLE_LOGGING = bool(int(os.getenv('ENABLE_LOGGING', '0')))
-LOG_DIR = _locate('../logs/')
-os.makedirs(LOG_DIR, exist_ok=True)
\ No newline at end of file
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json' (one JSON object per line)
+LOG_DIR = _locate('../logs/')  # Created on the first write, so that importing the server does not touch the disk
+
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none')  # 'none', 'jsonl' (spans appended to `TRACE_FILE`), or 'otlp' (OTLP/HTTP JSON posted to `TRACE_OTLP_ENDPOINT`)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))  # Fraction of requests traced, unless a trusted proxy's `traceparent` decides
+TRACE_FILE = os.path.join(LOG_DIR, 'traces.jsonl')
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_QUEUE_MAX = int(os.getenv('TRACE_QUEUE_MAX', '1000'))  # Finished traces waiting for export; further ones are dropped
+if TRACE_EXPORTER not in ('none', 'jsonl', 'otlp'):
+    raise ValueError(f'Invalid TRACE_EXPORTER: {TRACE_EXPORTER}')
+
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN')  # Requests sending it in `X-Profile` are profiled; unset disables on-demand profiling
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # Fraction of all requests profiled (Python side only)
+PROFILE_INTERVAL_SECONDS = float(os.getenv('PROFILE_INTERVAL_SECONDS', '0.005'))
+PROFILE_MAX_ARTIFACTS = int(os.getenv('PROFILE_MAX_ARTIFACTS', '20'))  # Profiles kept on disk; the oldest are deleted first
+PROFILE_DIR = os.path.join(LOG_DIR, 'profiles')
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer token required to scrape `/metrics`; if unset, metrics are not served
\ No newline at end of file
@@ -1,47 +1,179 @@
-from typing import LiteralString
-from textwrap import dedent
-from fastapi_mail import FastMail, ConnectionConfig, MessageSchema
-from src.server.lib.utils import errlog, format_template
+from typing import Optional
+from email.message import EmailMessage
+from datetime import timedelta
+import asyncio, aiosmtplib
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session as _SessionType
+from src.server.lib.utils import log, errlog, utcnow, format_template
 from src.server.lib.models import ContactUsSubmissionData, Cookies
-from src.server.lib.constants import MAIL_USERNAME, MAIL_PASSWORD, MAIL_PORT, MAIL_SERVER, MAIL_TLS, MAIL_SSL, SUPPORT_EMAIL, SYSTEM_EMAIL
+from src.server.lib.constants import (
+    MAIL_USERNAME, MAIL_PASSWORD, MAIL_PORT, MAIL_SERVER, MAIL_TLS, MAIL_SSL, SUPPORT_EMAIL, SYSTEM_EMAIL,
+    EMAIL_BATCH_SIZE, EMAIL_POLL_SECONDS, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE_SECONDS, EMAIL_CLAIM_SECONDS
+)
+from src.server.db.tables import OutboxEmail
 from src.server.db.utils import dbsession, _check_account, _validate_cookies
 
-async def send_email(subject: str, body: str, sender: LiteralString, recipients: list[str], reply_to: list[str] = []) -> None:
-    """Makes the server send an email to receipent(s)."""
+## Outbox
+def queue_email(subject: str, body: str, sender: str, recipients: list[str], reply_to: list[str] = [], *, session: _SessionType) -> OutboxEmail:
+    """Adds an email to the outbox in the caller's transaction. The sender worker delivers it once the transaction commits."""
+    email = OutboxEmail(subject=f'Shiftiatrics: {subject}', body=body, sender=sender, recipients=recipients, reply_to=reply_to)
+    session.add(email)
+    return email
+
+
+@dbsession(commit=True)
+def _claim_due_emails(batch_size: int, *, session: _SessionType) -> list[OutboxEmail]:
+    """
+    Claims up to `batch_size` due emails by pushing their next attempt `EMAIL_CLAIM_SECONDS` ahead, so concurrent senders
+    skip them and they are retried if this sender dies mid-batch.
+    """
+    due = (
+        select(OutboxEmail.email_id)
+        .where(OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= utcnow())
+        .order_by(OutboxEmail.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    claimed = session.scalars(
+        update(OutboxEmail)
+        .where(OutboxEmail.email_id.in_(due))
+        .values(attempts=OutboxEmail.attempts + 1, next_attempt_at=utcnow() + timedelta(seconds=EMAIL_CLAIM_SECONDS))
+        .returning(OutboxEmail)
+    ).all()
+    session.expunge_all()
+    return claimed
+
+
+@dbsession(commit=True)
+def _record_results(results: list[tuple[OutboxEmail, Optional[str]]], *, session: _SessionType) -> None:
+    """Marks emails as sent, or schedules their retry with exponential backoff (failing them after `EMAIL_MAX_ATTEMPTS`)."""
+    for email, error in results:
+        if error is None:
+            values = {'status': 'sent', 'sent_at': utcnow(), 'last_error': None}
+        elif email.attempts >= EMAIL_MAX_ATTEMPTS:
+            values = {'status': 'failed', 'last_error': error}
+        else:
+            backoff = min(EMAIL_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1), 3600)
+            values = {'next_attempt_at': utcnow() + timedelta(seconds=backoff), 'last_error': error}
+        session.execute(update(OutboxEmail).where(OutboxEmail.email_id == email.email_id).values(**values))
+
+
+@dbsession(commit=True)
+def _release_emails(emails: list[OutboxEmail], error: str, *, session: _SessionType) -> None:
+    """Gives claimed emails back without counting their attempt (e.g., after the SMTP connection failed), retrying them after `EMAIL_RETRY_BASE_SECONDS`."""
+    session.execute(
+        update(OutboxEmail)
+        .where(OutboxEmail.email_id.in_([email.email_id for email in emails]))
+        .values(attempts=OutboxEmail.attempts - 1, next_attempt_at=utcnow() + timedelta(seconds=EMAIL_RETRY_BASE_SECONDS), last_error=error)
+    )
+
+
+
+## Sender
+class _SMTPConnection:
+    """One SMTP connection kept open across batches, and reopened when the server has dropped it."""
+    def __init__(self):
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+
+
+    async def get(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.noop()
+                return self._smtp
+            except aiosmtplib.SMTPException:
+                await self.close()
+
+        smtp = aiosmtplib.SMTP(hostname=MAIL_SERVER, port=MAIL_PORT, use_tls=MAIL_SSL, start_tls=MAIL_TLS)
+        await smtp.connect()
+        if MAIL_USERNAME: await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+        self._smtp = smtp
+        return smtp
+
+
+    async def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is None or not smtp.is_connected: return
+        try:
+            await smtp.quit()
+        except aiosmtplib.SMTPException:
+            smtp.close()
+
+
+_connection = _SMTPConnection()
+_CONNECTION_ERRORS = (aiosmtplib.SMTPConnectError, aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError, OSError)
+
+
+def _build_message(email: OutboxEmail) -> EmailMessage:
+    message = EmailMessage()
+    message['Subject'] = email.subject
+    message['From'] = email.sender
+    message['To'] = ', '.join(email.recipients)
+    if email.reply_to: message['Reply-To'] = ', '.join(email.reply_to)
+    message.set_content(email.body, subtype='html')
+    return message
+
+
+async def send_pending_emails(batch_size: int = EMAIL_BATCH_SIZE) -> int:
+    """
+    Sends a batch of due emails from the outbox over the persistent SMTP connection. Returns the number sent.
+    If the connection fails, the batch stops: the email being sent counts the failed attempt, and the rest are released.
+    """
+    emails = await asyncio.to_thread(_claim_due_emails, batch_size)
+    if not emails: return 0
+
+    results = []
+    for i, email in enumerate(emails):
+        smtp = None
+        try:
+            smtp = await _connection.get()
+            await smtp.send_message(_build_message(email))
+            results.append((email, None))
+        except Exception as e:
+            errlog('send_pending_emails', e, 'emails')
+            await _connection.close()
+            results.append((email, str(e)))
+            if smtp is None or isinstance(e, _CONNECTION_ERRORS):
+                if emails[i + 1:]: await asyncio.to_thread(_release_emails, emails[i + 1:], str(e))
+                break
+
+    await asyncio.to_thread(_record_results, results)
+    sent = sum(error is None for _, error in results)
+    log(f'Sent {sent} of {len(emails)} email(s)', 'emails')
+    return sent
+
+
+async def close_email_connection() -> None:
+    """Closes the persistent SMTP connection, if open."""
+    await _connection.close()
+
+
+async def run_email_sender() -> None:
+    """Delivers queued emails until cancelled. Full batches are followed immediately by the next; otherwise the outbox is polled."""
     try:
-        conf = ConnectionConfig(
-            MAIL_USERNAME=MAIL_USERNAME,
-            MAIL_PASSWORD=MAIL_PASSWORD,
-            MAIL_FROM=sender,
-            MAIL_PORT=MAIL_PORT,
-            MAIL_SERVER=MAIL_SERVER,
-            MAIL_STARTTLS=MAIL_TLS,
-            MAIL_SSL_TLS=MAIL_SSL,
-            USE_CREDENTIALS=True
-        )
-        fm = FastMail(conf)
-        message = MessageSchema(
-            subject=f'Shiftiatrics: {subject}',
-            recipients=recipients,
-            body=body,
-            subtype='html',
-            reply_to=reply_to
-        )
-        await fm.send_message(message)
-    except Exception as e:
-        errlog('send_email', e, 'emails')
-
-
-@dbsession()
-async def contact(data: ContactUsSubmissionData, cookies: Cookies, *, session) -> None:
-    """Sends an email message that includes the user's email, query type, and query description to the company."""
+        while True:
+            try:
+                sent = await send_pending_emails()
+            except Exception as e:
+                errlog('run_email_sender', e, 'emails')
+                sent = 0
+            if sent < EMAIL_BATCH_SIZE: await asyncio.sleep(EMAIL_POLL_SECONDS)
+    finally:
+        await _connection.close()
+
+
+
+## Emails
+@dbsession(commit=True)
+def contact(data: ContactUsSubmissionData, cookies: Cookies, *, session) -> None:
+    """Queues an email message that includes the user's email, query type, and query description to the company."""
     if data.email is None:
         cookies = _validate_cookies(cookies, session=session)
         account = _check_account(cookies.account_id, session=session)
         data.account_id = account.account_id
         data.email = account.email
 
-    await send_email(
+    queue_email(
         subject='New Contact Us Submission',
         body=format_template(
             'contact_us_submission.html',
@@ -53,5 +185,6 @@ async def contact(data: ContactUsSubmissionData, cookies: Cookies, *, session) -
         ),
         sender=SYSTEM_EMAIL,
         recipients=[SUPPORT_EMAIL],
-        reply_to=[data.email]
-    )
\ No newline at end of file
+        reply_to=[data.email],
+        session=session
+    )
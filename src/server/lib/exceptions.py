@@ -43,4 +43,16 @@ class EndpointAuthError(Exception):
 
 class NotFoundForEngineInput(ValueError):
     def __init__(self, entity: Literal['schedule', 'shift'], account_id: int, team_id: int, year: int, month: int):
-        super().__init__(f'No {entity} found, given {account_id=}, {year=}, {month=}, {team_id=}.')
\ No newline at end of file
+        super().__init__(f'No {entity} found, given {account_id=}, {year=}, {month=}, {team_id=}.')
+
+
+class EngineBusy(Exception):
+    """Exception for schedule generations rejected because the account already has too many queued."""
+    def __init__(self, account_id: int):
+        super().__init__(f'Too many schedule generations are queued for account ID {account_id}. Please try again shortly.')
+
+
+class MigrationModified(Exception):
+    """Exception for a migration file that was modified after being applied."""
+    def __init__(self, filename: str):
+        super().__init__(f'Migration {filename} was modified after being applied. Add a new migration instead.')
@@ -0,0 +1,61 @@
+from typing import Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import time, bcrypt
+from src.server.lib.constants import BCRYPT_ROUNDS, BCRYPT_WORKERS
+
+_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')  # bcrypt releases the GIL while hashing
+_stats_lock = Lock()
+_stats = {'queued': 0, 'running': 0, 'completed': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'hash_seconds': 0.0}
+
+
+def _run(func: Callable, *args) -> Any:
+    """Runs a bcrypt call on the pool & waits for it, recording how long it queued and how long it took."""
+    submitted_at = time.perf_counter()
+    with _stats_lock: _stats['queued'] += 1
+
+    def task():
+        started_at = time.perf_counter()
+        wait = started_at - submitted_at
+        with _stats_lock:
+            _stats['queued'] -= 1
+            _stats['running'] += 1
+            _stats['wait_seconds'] += wait
+            _stats['max_wait_seconds'] = max(_stats['max_wait_seconds'], wait)
+        try:
+            return func(*args)
+        finally:
+            with _stats_lock:
+                _stats['running'] -= 1
+                _stats['completed'] += 1
+                _stats['hash_seconds'] += time.perf_counter() - started_at
+
+    return _pool.submit(task).result()
+
+
+def hash_password(password: str) -> str:
+    """Hashes a password with the configured cost factor (`BCRYPT_ROUNDS`)."""
+    return _run(lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8'))
+
+
+def verify_password(password: str, stored_hash: str) -> bool:
+    """Checks a password against its stored hash."""
+    return _run(lambda: bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8')))
+
+
+def needs_rehash(stored_hash: str) -> bool:
+    """Whether a hash was made with a cost factor other than `BCRYPT_ROUNDS` (hashes look like `$2b$<cost>$<salt & hash>`)."""
+    try:
+        return int(stored_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def get_hashing_stats() -> dict[str, int | float]:
+    """Returns the pool's queue length, number of running & completed hashes, and their average wait & hash times in seconds."""
+    with _stats_lock:
+        stats = dict(_stats, workers=BCRYPT_WORKERS, rounds=BCRYPT_ROUNDS)
+    completed = stats['completed']
+    stats['avg_wait_seconds'] = stats.pop('wait_seconds') / completed if completed else 0.0
+    stats['avg_hash_seconds'] = stats.pop('hash_seconds') / completed if completed else 0.0
+    return stats
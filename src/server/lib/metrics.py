@@ -0,0 +1,117 @@
+from typing import Callable, Iterable
+from bisect import bisect_left
+from threading import Lock
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+Sample = tuple[str, dict[str, str], float]  # (metric name, labels, value)
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels: return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+class _Metric:
+    """A metric family in the Prometheus text format, with one series per combination of label values."""
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = Lock()
+        _registry.append(self)
+
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock: values = list(self._values.items())
+        for label_values, value in values:
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = _LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        self._series: dict[tuple[str, ...], list] = {}  # label values -> [bucket counts (non-cumulative, last is +Inf), sum]
+
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None: series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock: series = [(label_values, list(counts), total) for label_values, (counts, total) in self._series.items()]
+        for label_values, counts, total in series:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': str(bound)}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Gauge(_Metric):
+    """
+    A metric whose samples are read at scrape time from `collect`, which returns {label values: value}.
+    `metric_type` is 'counter' for running totals kept elsewhere (e.g., JVM GC counts).
+    """
+    def __init__(self, name: str, help: str, collect: Callable[[], dict[tuple[str, ...], float]], labels: tuple[str, ...] = (), metric_type: str = 'gauge'):
+        super().__init__(name, help, labels)
+        self.type = metric_type
+        self._collect = collect
+
+
+    def samples(self) -> Iterable[Sample]:
+        for label_values, value in self._collect().items():
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+_registry: list[_Metric] = []
+
+
+def render_metrics() -> str:
+    """Renders every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        try:
+            samples = list(metric.samples())
+        except Exception:
+            continue  # A failing collector (e.g., the DB is down) must not hide the other metrics
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(f'{name}{_format_labels(labels)} {float(value)!r}' for name, labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+
+## Request metrics (recorded by the API layer)
+request_latency = Histogram('shiftiatrics_request_duration_seconds', 'Request latency by route, method & status code.', ('route', 'method', 'status'))
+endpoint_errors = Counter('shiftiatrics_endpoint_errors_total', 'Errors returned by endpoints as error dicts, by endpoint & exception type.', ('endpoint', 'error'))
+rate_limit_rejections = Counter('shiftiatrics_rate_limit_rejections_total', 'Requests rejected by the rate limiter, by route.', ('route',))
@@ -0,0 +1,126 @@
+from typing import Optional, Mapping
+from collections import Counter
+from threading import Thread, Event, Lock, enumerate as enumerate_threads
+import os, sys, time, random, secrets, jpype
+from src.server.lib.constants import PROFILE_ADMIN_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_SECONDS, PROFILE_MAX_ARTIFACTS, PROFILE_DIR
+from src.server.lib.utils import log, errlog
+
+_busy = Lock()  # One profile at a time: held from the start of a profile until its artifacts are written
+
+
+class _Profiler(Thread):
+    """
+    Samples the stacks of every thread in the process until stopped, optionally recording a JFR profile of the JVM
+    over the same window, and then writes the artifacts to `PROFILE_DIR` & prunes the oldest ones.
+    """
+    def __init__(self, profile_id: str, jvm: bool):
+        super().__init__(name='profiler', daemon=True)
+        self.profile_id = profile_id
+        self.jvm = jvm
+        self._stopped = Event()
+        self._stacks: Counter[str] = Counter()
+        self._samples = 0
+
+
+    def run(self) -> None:
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            recording = self._start_jfr() if self.jvm else None
+            started_at = time.perf_counter()
+            while not self._stopped.wait(PROFILE_INTERVAL_SECONDS):
+                self._sample()
+            elapsed = time.perf_counter() - started_at
+            if recording is not None: self._stop_jfr(recording)
+            self._write(elapsed)
+        except Exception as e:
+            errlog('profiler', e, 'profiling')
+        finally:
+            _busy.release()
+
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+    def _sample(self) -> None:
+        """Adds the current stack of each thread (except this one) in the collapsed format: `thread;outer;...;inner`."""
+        names = {thread.ident: thread.name for thread in enumerate_threads()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident: continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            frames.append(names.get(thread_id, str(thread_id)))
+            self._stacks[';'.join(reversed(frames))] += 1
+        self._samples += 1
+
+
+    def _start_jfr(self):
+        if not jpype.isJVMStarted(): return None
+        recording = jpype.JClass('jdk.jfr.Recording')(jpype.JClass('jdk.jfr.Configuration').getConfiguration('profile'))
+        recording.start()
+        return recording
+
+
+    def _stop_jfr(self, recording) -> None:
+        recording.stop()
+        recording.dump(jpype.JClass('java.io.File')(_artifact_path(self.profile_id, 'jfr')).toPath())
+        recording.close()
+
+
+    def _write(self, elapsed: float) -> None:
+        with open(_artifact_path(self.profile_id, 'collapsed'), 'w') as file:
+            file.writelines(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+        log(f'Profile {self.profile_id}: {self._samples} samples over {elapsed:.3f}s (JFR: {self.jvm})', 'profiling')
+        _prune_artifacts()
+
+
+def _artifact_path(profile_id: str, extension: str) -> str:
+    return os.path.join(PROFILE_DIR, f'{profile_id}.{extension}')
+
+
+def _prune_artifacts() -> None:
+    """Deletes the oldest profiles (all artifacts sharing a profile ID) beyond `PROFILE_MAX_ARTIFACTS`."""
+    profiles: dict[str, list[os.DirEntry]] = {}
+    for entry in os.scandir(PROFILE_DIR):
+        profiles.setdefault(entry.name.rsplit('.', 1)[0], []).append(entry)
+    oldest_first = sorted(profiles.values(), key=lambda entries: min(entry.stat().st_mtime for entry in entries))
+    for entries in oldest_first[:max(len(profiles) - PROFILE_MAX_ARTIFACTS, 0)]:
+        for entry in entries:
+            os.remove(entry.path)
+
+
+
+## Public
+def profile_mode(headers: Mapping[str, str]) -> Optional[bool]:
+    """
+    Decides whether to profile a request: returns None to skip it, or whether to also record the JVM.
+    Admins request a profile with `X-Profile: <PROFILE_ADMIN_TOKEN>` (plus `X-Profile-JVM: 1` for JFR);
+    otherwise a `PROFILE_SAMPLE_RATE` fraction of requests is profiled on the Python side.
+    """
+    token = headers.get('x-profile')
+    if token and PROFILE_ADMIN_TOKEN and secrets.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode()):
+        return headers.get('x-profile-jvm') == '1'
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return False
+    return None
+
+
+def start_profile(label: str, jvm: bool = False) -> Optional[_Profiler]:
+    """Starts profiling, unless another profile is in progress. Stop the returned profiler when the request is done."""
+    if not _busy.acquire(blocking=False): return None
+    safe_label = ''.join(c if c.isalnum() else '_' for c in label).strip('_')[:60]
+    profiler = _Profiler(f'{time.strftime("%Y%m%dT%H%M%S")}-{secrets.token_hex(4)}-{safe_label}', jvm)
+    try:
+        profiler.start()
+    except Exception:
+        _busy.release()
+        raise
+    return profiler
+
+
+def wait_for_profiles(timeout: float = 10) -> None:
+    """Blocks until the profile in progress (if any) has written its artifacts."""
+    if _busy.acquire(timeout=timeout): _busy.release()
@@ -0,0 +1,39 @@
+from typing import Any, Iterable
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template, select_autoescape
+from src.server.lib.constants import TEMPLATES_DIR, TEMPLATES_AUTO_RELOAD
+
+class TemplateRegistry:
+    """
+    Loads & compiles every template under a directory once. Values are HTML-escaped, and missing ones raise an error.
+    With `auto_reload`, templates whose files changed on disk are recompiled when next rendered (for development).
+    """
+    def __init__(self, directory: str, auto_reload: bool = False):
+        self.auto_reload = auto_reload
+        self._env = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(['html']),
+            undefined=StrictUndefined,
+            auto_reload=auto_reload,
+            cache_size=-1
+        )
+        self._templates = {name: self._env.get_template(name) for name in self._env.list_templates()}
+
+
+    def get(self, name: str) -> Template:
+        """Returns a compiled template by its filename. Raises KeyError for unknown templates."""
+        if self.auto_reload: return self._env.get_template(name)
+        return self._templates[name]
+
+
+    def render(self, name: str, **context: Any) -> str:
+        """Renders a template with the given values."""
+        return self.get(name).render(**context)
+
+
+    def render_many(self, name: str, contexts: Iterable[dict[str, Any]]) -> list[str]:
+        """Renders one template once per context, e.g., to send the same email to many recipients."""
+        template = self.get(name)
+        return [template.render(**context) for context in contexts]
+
+
+templates = TemplateRegistry(TEMPLATES_DIR, TEMPLATES_AUTO_RELOAD)
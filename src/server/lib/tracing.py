@@ -0,0 +1,192 @@
+from typing import Any, Optional, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from queue import Queue, Full
+from threading import Thread, Event
+from functools import wraps
+import os, re, random, time, urllib.request, orjson
+from src.server.lib.constants import TRACE_EXPORTER, TRACE_SAMPLE_RATE, TRACE_FILE, TRACE_OTLP_ENDPOINT, TRACE_QUEUE_MAX
+
+class Span:
+    """A timed operation within a trace. Finished spans are collected on their trace & exported together when the root span ends."""
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'end_ns')
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: Optional[str], attributes: dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+
+
+class Trace:
+    """Spans of one request. Unsampled traces keep only their ID (for logs) and record no spans."""
+    __slots__ = ('trace_id', 'sampled', 'spans')
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list[Span] = []
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+_export_queue: Queue = Queue(TRACE_QUEUE_MAX)
+_TRACEPARENT = re.compile(r'00-(?!0{32})([0-9a-f]{32})-(?!0{16})([0-9a-f]{16})-([0-9a-f]{2})')
+_exporter_thread: Optional[Thread] = None
+
+
+## Exporters
+def _span_to_dict(span: Span) -> dict[str, Any]:
+    return {
+        'trace_id': span.trace.trace_id,
+        'span_id': span.span_id,
+        'parent_id': span.parent_id,
+        'name': span.name,
+        'start_ns': span.start_ns,
+        'duration_ms': (span.end_ns - span.start_ns) / 1e6,
+        'attributes': span.attributes
+    }
+
+
+def _to_otlp(spans: list[Span]) -> dict[str, Any]:
+    """Encodes spans as an OTLP/HTTP JSON `ExportTraceServiceRequest`."""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'shiftiatrics'}}]},
+        'scopeSpans': [{
+            'scope': {'name': 'shiftiatrics'},
+            'spans': [{
+                'traceId': span.trace.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'kind': 2 if span.parent_id is None else 1,  # SERVER for the request, INTERNAL otherwise
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [{'key': key, 'value': {'stringValue': str(value)}} for key, value in span.attributes.items()]
+            } for span in spans]
+        }]
+    }]}
+
+
+def _export(spans: list[Span]) -> None:
+    if TRACE_EXPORTER == 'jsonl':
+        os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+        with open(TRACE_FILE, 'ab') as file:
+            file.write(b''.join(orjson.dumps(_span_to_dict(span)) + b'\n' for span in spans))
+    elif TRACE_EXPORTER == 'otlp':
+        request = urllib.request.Request(TRACE_OTLP_ENDPOINT, data=orjson.dumps(_to_otlp(spans)), headers={'Content-Type': 'application/json'})
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+def _run_exporter() -> None:
+    """Exports finished traces off the request path. Callables on the queue are flush markers (see `flush_traces`)."""
+    while True:
+        item = _export_queue.get()
+        if isinstance(item, list):
+            try: _export(item)
+            except Exception: pass  # Tracing must never break requests; a failed export only loses that trace
+        else:
+            item()
+
+
+def flush_traces(timeout: float = 5) -> None:
+    """Blocks until every trace finished so far has been exported."""
+    if _exporter_thread is None: return
+    done = Event()
+    _export_queue.put(done.set)
+    done.wait(timeout)
+
+
+def _submit(spans: list[Span]) -> None:
+    """Queues a finished trace for export, or drops it if the exporter is `TRACE_QUEUE_MAX` traces behind."""
+    global _exporter_thread
+    if _exporter_thread is None:
+        _exporter_thread = Thread(target=_run_exporter, name='trace-exporter', daemon=True)
+        _exporter_thread.start()
+    try: _export_queue.put_nowait(spans)
+    except Full: pass
+
+
+
+## Public
+def current_trace_id() -> Optional[str]:
+    """Returns the ID of the current request's trace (also set on unsampled traces, for log correlation)."""
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def trace(name: str, traceparent: Optional[str] = None, trusted: bool = False, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Opens the root span of a request. A valid W3C `traceparent` header continues the caller's trace; its sampling decision
+    is only followed if the caller is `trusted` (e.g., a proxy in `TRUSTED_PROXIES`), and otherwise `TRACE_SAMPLE_RATE` decides.
+    Malformed headers start a new trace. Yields None for unsampled traces.
+    """
+    match = _TRACEPARENT.fullmatch(traceparent) if traceparent else None
+    trace_id, parent_id = (match[1], match[2]) if match else (os.urandom(16).hex(), None)
+    if match and trusted:
+        sampled = bool(int(match[3], 16) & 1)
+    else:
+        sampled = random.random() < TRACE_SAMPLE_RATE
+
+    trace_obj = Trace(trace_id, sampled and TRACE_EXPORTER != 'none')
+    trace_token = _current_trace.set(trace_obj)
+    root = Span(trace_obj, name, parent_id, attributes) if trace_obj.sampled else None
+    span_token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if root is not None:
+            root.end()
+            _submit(trace_obj.spans)
+
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """Starts a child of the current span, or returns None when there is no sampled trace. The caller must call `end`."""
+    parent = _current_span.get()
+    if parent is None: return None
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Records the enclosed block as a child of the current span. Costs a single context variable lookup when not sampled."""
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set('error', f'{type(e).__name__}: {e}')
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def traced(name: str):
+    """Decorator form of `span` for sync functions."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,36 +1,134 @@
-from typing import Optional
+from typing import Optional, Callable
+from operator import attrgetter
 from datetime import date, time, datetime, timezone, timedelta
-import logging, os
-from src.server.lib.constants import ENABLE_LOGGING, LOG_DIR, TOKEN_EXPIRY_SECONDS, TEMPLATES_DIR
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+import logging, os, atexit, orjson
+from src.server.lib.constants import ENABLE_LOGGING, LOG_DIR, LOG_LEVEL, LOG_FORMAT, TOKEN_EXPIRY_SECONDS, STRIPE_SECRET_KEY
+from src.server.lib.templates import templates
+from src.server.lib.tracing import current_trace_id
 
-def get_logger(name: str, filename: str, level: str = 'INFO') -> logging.Logger:
-    """Get a logger with a specific name and file handler."""
+_LEVELS = logging.getLevelNamesMapping()
+_LOGGER_PREFIX = 'shiftiatrics.'
+_loggers: dict[str, logging.Logger] = {}
+_loggers_lock = Lock()
+_listener: Optional[QueueListener] = None
+_queue_handler = QueueHandler(SimpleQueue())
+
+
+def _add_trace_id(record: logging.LogRecord) -> bool:
+    """Tags records with the current request's trace ID. Runs in the caller's thread, before the record is queued."""
+    record.trace_id = current_trace_id() or '-'
+    return True
+
+
+_queue_handler.addFilter(_add_trace_id)
+
+
+class _JSONFormatter(logging.Formatter):
+    """Formats records as JSON lines, including the trace ID when one is attached."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name.removeprefix(_LOGGER_PREFIX),
+            'message': record.getMessage()
+        }
+        if getattr(record, 'trace_id', '-') != '-': entry['trace_id'] = record.trace_id
+        if record.exc_info: entry['exc_info'] = self.formatException(record.exc_info)
+        return orjson.dumps(entry).decode()
+
+
+class _FileRouter(logging.Handler):
+    """Runs on the listener thread & writes each record to `LOG_DIR/{logger name}.log`, opening files on first use."""
+    def __init__(self, formatter: logging.Formatter):
+        super().__init__()
+        self.formatter = formatter
+        self._handlers: dict[str, logging.FileHandler] = {}
+
+
+    def emit(self, record: logging.LogRecord) -> None:
+        filename = record.name.removeprefix(_LOGGER_PREFIX)
+        handler = self._handlers.get(filename)
+        if handler is None:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            handler = self._handlers[filename] = logging.FileHandler(os.path.join(LOG_DIR, f'{filename}.log'))
+            handler.setFormatter(self.formatter)
+        handler.emit(record)
+
+
+    def close(self) -> None:
+        for handler in self._handlers.values(): handler.close()
+        super().close()
+
+
+def _start_listener() -> None:
+    """Starts the thread that drains the log queue into files. It is stopped (flushing the queue) at exit."""
+    global _listener
+    formatter = _JSONFormatter() if LOG_FORMAT == 'json' else logging.Formatter('%(asctime)s - %(levelname)s - %(trace_id)s - %(message)s')
+    _listener = QueueListener(_queue_handler.queue, _FileRouter(formatter))
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    """Stops the listener thread once the queued records are written."""
+    global _listener
+    with _loggers_lock:
+        if _listener is None: return
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def flush_logs() -> None:
+    """Blocks until every record logged so far has been written, by restarting the listener (stopping it drains the queue)."""
+    with _loggers_lock:
+        if _listener is None: return
+        _listener.stop()
+        _listener.start()
+
+
+def get_logger(name: str, filename: Optional[str] = None) -> Optional[logging.Logger]:
+    """
+    Returns the cached logger of a log file (`filename` defaults to `name`), or None if logging is disabled.
+    Records are put on a queue & written by a background thread, so logging never blocks on file I/O.
+    """
     if not ENABLE_LOGGING: return None
-    logger = logging.getLogger(name)
-
-    if not logger.hasHandlers():  # Avoid adding duplicate handlers
-        level = logging._nameToLevel[level.upper()]
-        log_file = os.path.join(LOG_DIR, f"{filename}.log")
-        
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(level)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-
-        logger.setLevel(level)
-        logger.addHandler(file_handler)
+    filename = filename or name
+    logger = _loggers.get(filename)
+    if logger is not None: return logger
+
+    with _loggers_lock:
+        if _listener is None: _start_listener()
+        logger = logging.getLogger(_LOGGER_PREFIX + filename)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+        if _queue_handler not in logger.handlers: logger.addHandler(_queue_handler)
+        _loggers[filename] = logger
     return logger
 
 
-def log(msg: str, filename: str, level: str = 'INFO') -> None:
-    """Write a log message with the specified file and level."""
-    logger = get_logger(name=filename, filename=filename, level=level)
-    if logger: logger.log(logging._nameToLevel[level.upper()], msg)
+def log_enabled(filename: str, level: str = 'INFO') -> bool:
+    """Whether a message of the given level would be written, so that callers can skip building expensive messages."""
+    logger = get_logger(filename)
+    return logger is not None and logger.isEnabledFor(_LEVELS[level.upper()])
+
+
+def log(msg: str, filename: str, level: str = 'INFO', *args) -> None:
+    """Write a log message with the specified file and level. `args` are %-formatted into `msg` only if the message is written."""
+    logger = get_logger(filename)
+    if logger is None: return
+    levelno = _LEVELS[level.upper()]
+    if logger.isEnabledFor(levelno): logger.log(levelno, msg, *args)
 
 
 def errlog(func_name: str, e: Exception, filename: str) -> None:
     """Log an exception to the specified file."""
     err_name = str(type(e)).split("'")[1]
-    log(f"[{func_name}] {err_name}: {e}", filename, 'ERROR')
+    log('[%s] %s: %s', filename, 'ERROR', func_name, err_name, e)
 
 
 def parse_date(date_str: str):
@@ -51,6 +149,21 @@ def parse_time(time_str: str) -> time:
         raise ValueError(f'Invalid time format: "{time_str}". Expected format is "HH:MM".')
 
 
+def parse_cursor(cursor: str) -> tuple[int, int, int]:
+    """Turns a schedule keyset cursor to a tuple (e.g., "2024.11.42" -> `(2024, 11, 42)`)."""
+    try:
+        year, month, schedule_id = map(int, cursor.split('.'))
+        return year, month, schedule_id
+    except ValueError:
+        raise ValueError(f'Invalid cursor: "{cursor}". Expected format is "YEAR.MONTH.SCHEDULE_ID".')
+
+
+def make_cursor(schedule: object | dict) -> str:
+    """Returns the keyset cursor that points right after the given schedule (either an object or a dictionary)."""
+    get = schedule.get if isinstance(schedule, dict) else lambda key: getattr(schedule, key)
+    return f"{get('year')}.{get('month')}.{get('schedule_id')}"
+
+
 def utcnow() -> datetime:
     """Returns UTC date & time of now."""
     return datetime.now(timezone.utc)
@@ -61,12 +174,24 @@ def get_token_expiry_datetime() -> datetime:
     return utcnow() + timedelta(seconds=TOKEN_EXPIRY_SECONDS)
 
 
+_serializers: dict[type, Callable[[object], dict]] = {}
+_HIDDEN_COLUMNS = {'hashed_password', 'data_version', 'session_version'}
+
+def _compile_serializer(model: type) -> Callable[[object], dict]:
+    """Builds a serializer for a SQLAlchemy model that reads all of its (non-hidden) columns with a single `attrgetter` call."""
+    keys = tuple(col.key for col in model.__table__.columns if col.key not in _HIDDEN_COLUMNS)
+    getter = attrgetter(*keys)
+    if len(keys) == 1: return lambda obj: {keys[0]: getter(obj)}
+    return lambda obj: dict(zip(keys, getter(obj)))
+
+
 def todict(obj: object, **additional_info) -> Optional[dict]:
-    """Converts a SQLAlchemy object to a dictionary."""
+    """Converts a SQLAlchemy object to a dictionary, using a serializer compiled once per model."""
     if obj is None: return None
-    result = {col.name: getattr(obj, col.name) for col in obj.__table__.columns}
-    result |= additional_info
-    if 'hashed_password' in result: del result['hashed_password']
+    serializer = _serializers.get(type(obj))
+    if serializer is None: serializer = _serializers[type(obj)] = _compile_serializer(type(obj))
+    result = serializer(obj)
+    if additional_info: result |= additional_info
     return result
 
 
@@ -75,8 +200,18 @@ def todicts(objs: list[object]) -> list[Optional[dict]]:
     return [todict(obj) for obj in objs]
 
 
+def is_model(obj: object) -> bool:
+    """Returns whether the given object is an instance of a SQLAlchemy model."""
+    return hasattr(type(obj), '__table__')
+
+
 def format_template(filename: str, **kwargs) -> str:
-    """Formats a template file (`src/server/templates/{filename}`) with the given keyword arguments."""
-    with open(os.path.join(TEMPLATES_DIR, filename), 'r') as file:
-        template = file.read()
-    return template.format(**kwargs)
\ No newline at end of file
+    """Renders a template (`src/server/templates/{filename}`) with the given keyword arguments, using the precompiled registry."""
+    return templates.render(filename, **kwargs)
+
+
+def load_stripe():
+    """Returns the configured `stripe` module. It is imported on first use, as importing it is a large share of the server's startup."""
+    import stripe
+    if stripe.api_key != STRIPE_SECRET_KEY: stripe.api_key = STRIPE_SECRET_KEY
+    return stripe
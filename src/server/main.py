@@ -1,99 +1,127 @@
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from typing import Callable, Any, AsyncIterator
+from contextlib import asynccontextmanager, suppress
+import asyncio, time, gc, jpype
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from slowapi.errors import RateLimitExceeded
-import os, jpype, psycopg2
 from src.server.rate_limit import limiter, rate_limit_handler
-from src.server.lib.constants import BACKEND_SERVER_URL, WEB_SERVER_URL, SCHEDULE_ENGINE_PATH, DB_SCHEMA_PATH, PSQL_DB, PSQL_USER, PSQL_PASSWORD, PSQL_HOST, PSQL_PORT
+from src.server.lib.constants import TRUSTED_PROXIES, BACKEND_SERVER_URL, WEB_SERVER_URL, JVM_STARTUP, MIGRATE_ON_STARTUP, TOKEN_SWEEP_INTERVAL_SECONDS, SUB_RECONCILE_INTERVAL_SECONDS, INVOICE_REFRESH_INTERVAL_SECONDS
+from src.server.lib.utils import errlog, load_stripe
+from src.server.lib.tracing import trace
+from src.server.lib.metrics import request_latency
+from src.server.lib.profiling import profile_mode, start_profile
+from src.server.lib.emails import run_email_sender
+from src.server.db.migrations import migrate
+from src.server.db import reconcile_subs, refresh_stale_invoices
+from src.server.db.maintenance import sweep_expired_tokens
+from src.server.engine import start_jvm
+from src.server.engine.admission import admission
 from src.server.routers.auth import auth_router
 from src.server.routers.db import account_router, team_router, employee_router, shift_router, schedule_router, holiday_router, settings_router, sub_router
 from src.server.routers.engine import engine_router
 from src.server.routers.contact import contact_router
+from src.server.routers.metrics import metrics_router
 
-def _create_db_if_not_exists():
-     # Connect to default 'postgres' DB to check/create the target DB
+def _apply_migrations() -> None:
+    """Applies pending migrations, waiting for another worker that is applying them. Failures abort startup, so no worker serves an unmigrated schema."""
     try:
-        admin_conn = psycopg2.connect(
-            dbname="postgres",  # This must exist
-            user=PSQL_USER,
-            password=PSQL_PASSWORD,
-            host=PSQL_HOST,
-            port=PSQL_PORT
-        )
-        admin_conn.autocommit = True
-        admin_cur = admin_conn.cursor()
-
-        admin_cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (PSQL_DB,))
-        exists = admin_cur.fetchone()
-
-        if not exists:
-            print(f"📦 Creating database '{PSQL_DB}'...")
-            admin_cur.execute(f"CREATE DATABASE {PSQL_DB}")
-        else:
-            print(f"✅ Database '{PSQL_DB}' already exists")
-
-        admin_cur.close()
-        admin_conn.close()
+        migrate(wait=True)
     except Exception as e:
-        print(f"❌ Failed to connect to admin DB or create target DB: {e}")
-        return
+        print(f"❌ Failed to apply migrations: {e}")
+        raise
 
 
-def _apply_schema():
-    if not os.path.exists(DB_SCHEMA_PATH):
-        print('❌ schema.sql not found!')
-        return
-
-    # Now connect to the actual target DB and apply schema.sql
-    try:
-        with open(DB_SCHEMA_PATH, 'r') as f:
-            schema = f.read()
-
-        conn = psycopg2.connect(
-            dbname=PSQL_DB,
-            user=PSQL_USER,
-            password=PSQL_PASSWORD,
-            host=PSQL_HOST,
-            port=PSQL_PORT
-        )
-        conn.autocommit = True
-        cur = conn.cursor()
-        cur.execute(schema)
-        cur.close()
-        conn.close()
-        print("🎉 schema.sql applied successfully.")
-    except Exception as e:
-        print(f"❌ Failed to apply schema.sql: {e}")
+async def _run_periodically(func: Callable[[], Any], interval_seconds: float) -> None:
+    """Runs a blocking maintenance function every `interval_seconds`, off the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(func)
+        except Exception as e:
+            errlog(func.__name__, e, 'db')
+        await asyncio.sleep(interval_seconds)
 
 
 @asynccontextmanager
 async def _lifespan(app: FastAPI):
     """Defines the application lifespan to manage JVM startup and shutdown."""
-    _create_db_if_not_exists()
-    _apply_schema()
+    if MIGRATE_ON_STARTUP: _apply_migrations()
 
     app.state.limiter = limiter
     app.add_exception_handler(RateLimitExceeded, rate_limit_handler) 
 
-    if not jpype.isJVMStarted():
-        jpype.startJVM(classpath=SCHEDULE_ENGINE_PATH)
+    # The JVM takes seconds to start, so by default it starts while requests are already being served (see `JVM_STARTUP`)
+    if JVM_STARTUP == 'eager': start_jvm()
+    warmups = [asyncio.create_task(asyncio.to_thread(load_stripe))]
+    if JVM_STARTUP == 'background': warmups.append(asyncio.create_task(asyncio.to_thread(start_jvm)))
+    tasks = [
+        asyncio.create_task(_run_periodically(func, interval))
+        for func, interval in (
+            (sweep_expired_tokens, TOKEN_SWEEP_INTERVAL_SECONDS),
+            (reconcile_subs, SUB_RECONCILE_INTERVAL_SECONDS),
+            (refresh_stale_invoices, INVOICE_REFRESH_INTERVAL_SECONDS)
+        )
+        if interval > 0
+    ]
+    tasks.append(asyncio.create_task(run_email_sender()))
     try:
         yield
     finally:
+        for task in tasks:
+            task.cancel()
+            with suppress(asyncio.CancelledError): await task
+        for warmup in warmups:
+            with suppress(Exception): await warmup  # Threads cannot be interrupted, so a JVM still starting is waited for
+        await asyncio.to_thread(admission.shutdown)
         if jpype.isJVMStarted():
             jpype.shutdownJVM()
 
 
-app = FastAPI(lifespan=_lifespan)
+app = FastAPI(lifespan=_lifespan, default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[BACKEND_SERVER_URL, WEB_SERVER_URL],
     allow_methods=['GET', 'POST', 'PATCH', 'DELETE'],
     allow_headers=['*'],
+    expose_headers=['X-Next-Cursor', 'ETag'],
     allow_credentials=True
 )
 
 
+async def _stop_after_body(body_iterator: AsyncIterator[bytes], profiler) -> AsyncIterator[bytes]:
+    """Passes the response body through, and then stops the profiler, so that streamed bodies are profiled too. Artifacts are written by the profiler's thread."""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        profiler.stop()
+
+
+@app.middleware('http')
+async def _instrument_request(request: Request, call_next):
+    """
+    Opens the root span of each request (continuing the caller's trace if a `traceparent` header is sent),
+    profiles it if requested (see `profile_mode`), and records its latency under the matched route's path template.
+    """
+    started_at = time.perf_counter()
+    jvm = profile_mode(request.headers)
+    profiler = start_profile(f'{request.method} {request.url.path}', jvm) if jvm is not None else None
+    trusted = request.client is not None and request.client.host in TRUSTED_PROXIES
+    with trace(f'{request.method} {request.url.path}', request.headers.get('traceparent'), trusted) as root:
+        try:
+            response = await call_next(request)
+        except BaseException:
+            if profiler is not None: profiler.stop()
+            raise
+        if root is not None: root.set('status_code', response.status_code)
+    if profiler is not None:
+        response.body_iterator = _stop_after_body(response.body_iterator, profiler)
+        response.headers['X-Profile-Id'] = profiler.profile_id
+    route = request.scope.get('route')  # Set by the router on the shared scope
+    request_latency.observe(time.perf_counter() - started_at, route.path if route else 'unmatched', request.method, str(response.status_code))
+    return response
+
+
 for r in (
     auth_router,
     account_router,
@@ -105,5 +133,12 @@ for r in (
     settings_router,
     sub_router,
     engine_router,
-    contact_router
-): app.include_router(r)
\ No newline at end of file
+    contact_router,
+    metrics_router
+): app.include_router(r)
+
+
+# Objects created while importing the app are never freed, so they are moved out of the GC's tracking: collections get
+# cheaper, and workers forked from a preloading master (`gunicorn --preload`) keep sharing these pages instead of copying them
+gc.collect()
+gc.freeze()
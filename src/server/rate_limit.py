@@ -1,9 +1,115 @@
+from typing import Optional
+from threading import Lock
+import time
+from fastapi import Request
 from fastapi.responses import JSONResponse
+from limits.storage import Storage, MovingWindowSupport, storage_from_string
 from slowapi import Limiter
-from slowapi.util import get_remote_address
+from src.server.lib.constants import RATE_LIMIT_STORAGE_URI, RATE_LIMIT_LEASE_FRACTION, TRUSTED_PROXIES, TOKEN_FORMAT
+from src.server.lib.metrics import rate_limit_rejections
+from src.server.db.tokens import decode_token
 
-limiter = Limiter(key_func=get_remote_address)
+class LeasedStorage(Storage, MovingWindowSupport):
+    """
+    Moving-window storage shared by all workers (e.g., `leased+redis://host:6379`, or `leased+memory://` for a single process),
+    with a per-process fast path: while a window has room to spare, a worker reserves a lease of several entries in one
+    round trip & grants them locally. Leases are only taken when `RATE_LIMIT_LEASE_FRACTION` of the limit fits in the window,
+    and expire after that fraction of the window, so requests near the limit are always checked against the shared window.
+    Unused leased entries still count until they leave the window, which errs on the side of limiting.
+    """
+    STORAGE_SCHEME = ['leased+memory', 'leased+redis', 'leased+rediss', 'leased+redis+unix']
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        self._backend = storage_from_string(uri.split('+', 1)[1], wrap_exceptions=wrap_exceptions, **options)
+        self._leases: dict[str, list] = {}  # key -> [entries left, expires at (monotonic)]
+        self._leases_lock = Lock()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+
+    @property
+    def base_exceptions(self):
+        return self._backend.base_exceptions
+
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        now = time.monotonic()
+        with self._leases_lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[1] > now and lease[0] >= amount:
+                lease[0] -= amount
+                return True
+
+        lease_size = int(limit * RATE_LIMIT_LEASE_FRACTION)
+        if lease_size > amount and self._backend.acquire_entry(key, limit, expiry, lease_size):
+            with self._leases_lock:
+                self._leases[key] = [lease_size - amount, now + expiry * RATE_LIMIT_LEASE_FRACTION]
+            return True
+        return self._backend.acquire_entry(key, limit, expiry, amount)
+
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> tuple[float, int]:
+        return self._backend.get_moving_window(key, limit, expiry)
+
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        return self._backend.incr(key, expiry, elastic_expiry, amount)
+
+
+    def get(self, key: str) -> int:
+        return self._backend.get(key)
+
+
+    def get_expiry(self, key: str) -> float:
+        return self._backend.get_expiry(key)
+
+
+    def check(self) -> bool:
+        return self._backend.check()
+
+
+    def reset(self) -> Optional[int]:
+        with self._leases_lock: self._leases.clear()
+        return self._backend.reset()
+
+
+    def clear(self, key: str) -> None:
+        with self._leases_lock: self._leases.pop(key, None)
+        self._backend.clear(key)
+
+
+def client_ip(request: Request) -> str:
+    """
+    Returns the client's address. Behind a trusted proxy (`TRUSTED_PROXIES`), it is the right-most untrusted address
+    in `X-Forwarded-For`, since addresses to its left are supplied by the client & can be forged.
+    """
+    peer = request.client.host if request.client else ''
+    if peer not in TRUSTED_PROXIES: return peer
+    for address in reversed(request.headers.get('x-forwarded-for', '').split(',')):
+        address = address.strip()
+        if address and address not in TRUSTED_PROXIES: return address
+    return peer
+
+
+def rate_limit_key(request: Request) -> str:
+    """
+    Limits clients with a correctly signed auth token (`TOKEN_FORMAT=signed`) per account, and others per address.
+    The key only depends on the request, so every worker counts a client under the same key. Opaque tokens cannot be
+    verified without the DB, and unverified account cookies could be varied to dodge the per-address limit.
+    """
+    if TOKEN_FORMAT == 'signed':
+        try:
+            account_id, token = int(request.cookies.get('account_id')), request.cookies.get('auth_token')
+        except (TypeError, ValueError):
+            account_id, token = None, None
+        if token and decode_token(token, account_id) is not None:
+            return f'account:{account_id}'
+    return f'ip:{client_ip(request)}'
+
+
+limiter = Limiter(key_func=rate_limit_key, storage_uri=RATE_LIMIT_STORAGE_URI, strategy='moving-window')
 
 async def rate_limit_handler(request, exc):
     """Handles rate limits from a specific client."""
-    return JSONResponse(status_code=429, content={'message': 'Too many requests. Please try again later.'})
\ No newline at end of file
+    route = request.scope.get('route')
+    rate_limit_rejections.inc(route.path if route else request.url.path)
+    return JSONResponse(status_code=429, content={'message': 'Too many requests. Please try again later.'})
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Request, Response, Body
+from fastapi.concurrency import run_in_threadpool
 from src.server.rate_limit import limiter
 from src.server.lib.models import Credentials, Cookies
 from src.server.lib.api import endpoint, get_cookies, store_cookies, clear_cookies, return_account_and_sub
-from src.server.db import log_in_account, log_in_account_with_cookies, request_reset_password, reset_password, request_verify_email, verify_email
+from src.server.db import log_in_account, log_in_account_with_cookies, request_reset_password, reset_password, request_verify_email, verify_email, log_out_account
 
 auth_router = APIRouter(prefix='/auth')
 
@@ -24,7 +25,7 @@ async def log_in_account_with_cookies_(request: Request) -> dict:
 @limiter.limit('5/minute')
 @endpoint(auth=False)
 async def login_account(cred: Credentials, response: Response, request: Request) -> dict:
-    account, sub, token = log_in_account(cred)
+    account, sub, token = await run_in_threadpool(log_in_account, cred)  # Waits on the hashing pool off the event loop
     store_cookies(Cookies(account_id=account.account_id, token=token), response)
     return return_account_and_sub(account, sub)
 
@@ -33,6 +34,7 @@ async def login_account(cred: Credentials, response: Response, request: Request)
 @limiter.limit('5/minute')
 @endpoint(auth=False)
 async def logout_account(response: Response, request: Request) -> dict:
+    log_out_account(get_cookies(request))
     clear_cookies(response)
     return {'detail': 'Logged out successfully'}
 
@@ -41,21 +43,21 @@ async def logout_account(response: Response, request: Request) -> dict:
 @limiter.limit('3/minute')
 @endpoint(auth=False)
 async def request_reset_password_(request: Request, email: str = Body(..., embed=True)) -> dict:
-    return {'detail': await request_reset_password(email)}
+    return {'detail': request_reset_password(email)}
 
 
 @auth_router.patch('/reset_password')
 @limiter.limit('3/minute')
 @endpoint(auth=False)
 async def reset_password_(request: Request, new_password: str = Body(..., embed=True), reset_token: str = Body(..., embed=True)) -> dict:
-    return {'detail': reset_password(new_password, reset_token)}
+    return {'detail': await run_in_threadpool(reset_password, new_password, reset_token)}
 
 
 @auth_router.post('/request_verify_email')
 @limiter.limit('3/minute')
 @endpoint()
 async def request_verify_email_(request: Request, email: str = Body(..., embed=True)) -> dict:
-    return {'detail': await request_verify_email(email)}
+    return {'detail': request_verify_email(email)}
 
 
 @auth_router.patch('/verify_email')
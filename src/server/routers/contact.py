@@ -10,5 +10,5 @@ contact_router = APIRouter()
 @limiter.limit('4/minute')
 @endpoint(auth=False)
 async def contact_us(data: ContactUsSubmissionData, request: Request) -> dict:
-    await contact(data, get_cookies(request))
+    contact(data, get_cookies(request))
     return {'detail': 'Submission successful'}
\ No newline at end of file
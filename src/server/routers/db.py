@@ -1,13 +1,18 @@
+from typing import Optional
 from fastapi import APIRouter, Request, Response, Body
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 from src.server.rate_limit import limiter
-from src.server.lib.constants import DEFAULT_RATE_LIMIT
+from src.server.lib.constants import DEFAULT_RATE_LIMIT, STRIPE_WEBHOOK_SECRET
 from src.server.lib.models import Credentials, Cookies, HolidayInfo
 from src.server.lib.api import endpoint, get_cookies, store_cookies, clear_cookies, return_account_and_sub, check_legal_agree
 from src.server.lib.types import SettingValue
+from src.server.lib.utils import errlog, parse_cursor, make_cursor, load_stripe
 from src.server.db import (
-    create_account, change_email, change_password, request_delete_account, get_account_data,
+    create_account, change_email, change_password, request_delete_account, get_account_data, iter_account_data,
     get_teams, get_employees, get_shifts, get_schedules, delete_schedule, get_settings, 
-    update_setting, get_holidays, create_holiday, update_holiday, delete_holiday, create_sub
+    update_setting, get_holidays, create_holiday, update_holiday, delete_holiday, create_sub, handle_stripe_event, refresh_invoices,
+    bulk_create_employees, bulk_update_employees, bulk_create_shifts, bulk_update_shifts, bulk_create_holidays, bulk_update_holidays
 )
 
 # Init
@@ -28,7 +33,7 @@ sub_router = APIRouter(prefix='/sub')
 @endpoint(auth=False)
 async def create_new_account(cred: Credentials, response: Response, request: Request, legal_agree: bool = Body(..., embed=True)) -> dict:
     check_legal_agree(legal_agree)
-    account, token = create_account(cred)
+    account, token = await run_in_threadpool(create_account, cred)  # Waits on the hashing pool off the event loop
     store_cookies(Cookies(account_id=account.account_id, token=token), response)
     return return_account_and_sub(account)
 
@@ -43,23 +48,27 @@ async def change_email_endpoint(request: Request, email: str = Body(..., embed=T
 @account_router.patch('/password')
 @limiter.limit(DEFAULT_RATE_LIMIT)
 @endpoint()
-async def change_password_endpoint(request: Request, current_password: str = Body(None, embed=True), new_password: str = Body(..., embed=True)) -> dict:
-    return change_password(get_cookies(request), new_password, current_password)
+async def change_password_endpoint(request: Request, response: Response, current_password: str = Body(None, embed=True), new_password: str = Body(..., embed=True)) -> dict:
+    account, token = await run_in_threadpool(change_password, get_cookies(request), new_password, current_password)
+    store_cookies(Cookies(account_id=account.account_id, token=token), response)
+    return account
 
 
 @account_router.patch('/password_upon_signup')
 @limiter.limit(DEFAULT_RATE_LIMIT)
 @endpoint()
-async def change_password_upon_signup(request: Request, new_password: str = Body(..., embed=True), legal_agree: bool = Body(..., embed=True)) -> dict:
+async def change_password_upon_signup(request: Request, response: Response, new_password: str = Body(..., embed=True), legal_agree: bool = Body(..., embed=True)) -> dict:
     check_legal_agree(legal_agree)
-    return change_password(get_cookies(request), new_password, require_current=False)
+    account, token = await run_in_threadpool(change_password, get_cookies(request), new_password, require_current=False)
+    store_cookies(Cookies(account_id=account.account_id, token=token), response)
+    return account
 
 
 @account_router.delete('')
 @limiter.limit(DEFAULT_RATE_LIMIT)
 @endpoint()
 async def delete_existing_account(request: Request, response: Response) -> dict:
-    await request_delete_account(get_cookies(request))
+    request_delete_account(get_cookies(request))
     clear_cookies(response)
     return {'detail': 'Account deletion request sent'}
 
@@ -67,15 +76,18 @@ async def delete_existing_account(request: Request, response: Response) -> dict:
 @account_router.get('/data')
 @limiter.limit(DEFAULT_RATE_LIMIT)
 @endpoint()
-async def get_all_data_of_account(request: Request) -> dict:
-    return get_account_data(get_cookies(request))
+async def get_all_data_of_account(request: Request, schedules_from_year: Optional[int] = None, schedules_from_month: int = 0, stream: bool = False) -> dict:
+    schedules_since = (schedules_from_year, schedules_from_month) if schedules_from_year is not None else None
+    if stream:  # Already authenticated by `endpoint`
+        return StreamingResponse(iter_account_data(get_cookies(request).account_id, schedules_since), media_type='application/json')
+    return get_account_data(get_cookies(request), schedules_since)
 
 
 
 ## Team
 @team_router.get('/{account_id}')
 @limiter.limit(DEFAULT_RATE_LIMIT)
-@endpoint()
+@endpoint(etag=True)
 async def read_teams(account_id: int, request: Request) -> list[dict] | dict:
     return get_teams(account_id)
 
@@ -84,27 +96,76 @@ async def read_teams(account_id: int, request: Request) -> list[dict] | dict:
 ## Employee
 @employee_router.get('/{account_id}')
 @limiter.limit(DEFAULT_RATE_LIMIT)
-@endpoint()
+@endpoint(etag=True)
 async def read_employees(account_id: int, request: Request) -> list[dict] | dict:
     return get_employees(account_id)
 
 
+@employee_router.post('/{account_id}/bulk')
+@limiter.limit(DEFAULT_RATE_LIMIT)
+@endpoint()
+async def create_employees_in_bulk(account_id: int, employees: list[dict], request: Request) -> dict:
+    return bulk_create_employees(account_id, employees)
+
+
+@employee_router.patch('/{account_id}/bulk')
+@limiter.limit(DEFAULT_RATE_LIMIT)
+@endpoint()
+async def update_employees_in_bulk(account_id: int, updates: list[dict], request: Request) -> dict:
+    return bulk_update_employees(account_id, updates)
+
+
 
 ## Shift
 @shift_router.get('/{account_id}')
 @limiter.limit(DEFAULT_RATE_LIMIT)
-@endpoint()
+@endpoint(etag=True)
 async def read_shifts(account_id: int, request: Request) -> list[dict] | dict:
     return get_shifts(account_id)
 
 
+@shift_router.post('/{account_id}/bulk')
+@limiter.limit(DEFAULT_RATE_LIMIT)
+@endpoint()
+async def create_shifts_in_bulk(account_id: int, shifts: list[dict], request: Request) -> dict:
+    return bulk_create_shifts(account_id, shifts)
+
+
+@shift_router.patch('/{account_id}/bulk')
+@limiter.limit(DEFAULT_RATE_LIMIT)
+@endpoint()
+async def update_shifts_in_bulk(account_id: int, updates: list[dict], request: Request) -> dict:
+    return bulk_update_shifts(account_id, updates)
+
+
 
 ## Schedule
 @schedule_router.get('/{account_id}')
 @limiter.limit(DEFAULT_RATE_LIMIT)
-@endpoint()
-async def read_schedules(account_id: int, request: Request) -> list[dict] | dict:
-    return get_schedules(account_id)
+@endpoint(etag=True)
+async def read_schedules(
+    account_id: int,
+    request: Request,
+    response: Response,
+    from_year: Optional[int] = None,
+    from_month: int = 0,
+    to_year: Optional[int] = None,
+    to_month: int = 11,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None
+) -> list[dict] | dict:
+    schedules = get_schedules(
+        account_id,
+        since=(from_year, from_month) if from_year is not None else None,
+        until=(to_year, to_month) if to_year is not None else None,
+        after=parse_cursor(after) if after else None,
+        limit=limit,
+        fields=fields.split(',') if fields else None
+    )
+    if limit is not None and len(schedules) == limit:
+        response.headers['X-Next-Cursor'] = make_cursor(schedules[-1])
+    return schedules
 
 
 @schedule_router.delete('/{schedule_id}')
@@ -119,7 +180,7 @@ async def delete_existing_schedule(schedule_id: int, request: Request) -> dict:
 ## Holiday
 @holiday_router.get('/{account_id}')
 @limiter.limit(DEFAULT_RATE_LIMIT)
-@endpoint()
+@endpoint(etag=True)
 async def read_holidays(account_id: int, request: Request) -> list[dict] | dict:
     return get_holidays(account_id)
 
@@ -131,6 +192,20 @@ async def create_new_holiday(account_id: int, info: HolidayInfo, request: Reques
     return create_holiday(account_id, info.holiday_name, info.assigned_to, info.start_date, info.end_date)
 
 
+@holiday_router.post('/{account_id}/bulk')
+@limiter.limit(DEFAULT_RATE_LIMIT)
+@endpoint()
+async def create_holidays_in_bulk(account_id: int, holidays: list[dict], request: Request) -> dict:
+    return bulk_create_holidays(account_id, holidays)
+
+
+@holiday_router.patch('/{account_id}/bulk')
+@limiter.limit(DEFAULT_RATE_LIMIT)
+@endpoint()
+async def update_holidays_in_bulk(account_id: int, updates: list[dict], request: Request) -> dict:
+    return bulk_update_holidays(account_id, updates)
+
+
 @holiday_router.patch('/{holiday_id}')
 @limiter.limit(DEFAULT_RATE_LIMIT)
 @endpoint()
@@ -150,7 +225,7 @@ async def delete_existing_holiday(holiday_id: int, request: Request) -> dict:
 ## Settings
 @settings_router.get('/{account_id}')
 @limiter.limit(DEFAULT_RATE_LIMIT)
-@endpoint()
+@endpoint(etag=True)
 async def read_settings(account_id: int, request: Request) -> dict:
     return get_settings(account_id)
 
@@ -168,4 +243,34 @@ async def update_one_setting(account_id: int, request: Request, setting: str = B
 @limiter.limit('10/minute')
 @endpoint()
 async def create_subscription(account_id: int, request: Request, chkout_session_id: str = Body(..., embed=True)) -> dict:
-    return create_sub(account_id, chkout_session_id)[1]
\ No newline at end of file
+    return create_sub(account_id, chkout_session_id)[1]
+
+
+@sub_router.post('/invoices/{account_id}/refresh')
+@limiter.limit('5/minute')
+@endpoint()
+async def refresh_invoices_(account_id: int, request: Request) -> list[dict]:
+    return await run_in_threadpool(refresh_invoices, account_id)
+
+
+@sub_router.post('/webhook')
+@limiter.exempt
+async def stripe_webhook(request: Request) -> ORJSONResponse:
+    """
+    Receives Stripe subscription events. Not wrapped by `endpoint`, since Stripe relies on the status code:
+    events that fail to be processed get a 500 and are redelivered.
+    """
+    if not STRIPE_WEBHOOK_SECRET:
+        return ORJSONResponse({'error': 'Webhooks are not configured'}, status_code=503)
+    stripe = load_stripe()
+    try:
+        event = stripe.Webhook.construct_event(await request.body(), request.headers.get('stripe-signature', ''), STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.SignatureVerificationError) as e:
+        errlog('stripe_webhook', e, 'subscription')
+        return ORJSONResponse({'error': 'Invalid payload or signature'}, status_code=400)
+    try:
+        handled = await run_in_threadpool(handle_stripe_event, event)
+    except Exception as e:
+        errlog('stripe_webhook', e, 'subscription')
+        return ORJSONResponse({'error': 'Failed to process event'}, status_code=500)
+    return ORJSONResponse({'received': True, 'handled': handled})
@@ -1,32 +1,44 @@
 from fastapi import APIRouter, Request
 from src.server.engine import Engine
+from src.server.engine.admission import admission
 from src.server.rate_limit import limiter
 from src.server.lib.constants import DEFAULT_RATE_LIMIT
 from src.server.lib.utils import todicts, log
 from src.server.lib.api import endpoint
+from src.server.lib.types import PricingPlanEnum
+from src.server.lib.models import ScheduleType
 from src.server.lib.exceptions import NotFoundForEngineInput
-from src.server.db import get_employees_of_team, get_teams, get_shifts, get_schedules, get_holidays, get_schedules, create_schedule, update_schedule
+from src.server.db import get_employees, get_teams, get_shifts, get_schedules, get_holidays, create_schedule, update_schedule
 
 engine_router = APIRouter(prefix='/engine')
 
+def _generate(account_id: int, team_id: int, *args) -> ScheduleType:
+    return Engine(account_id, team_id).generate(*args)
+
+
 @engine_router.get('/generate_schedule')
 @limiter.limit(DEFAULT_RATE_LIMIT)
 @endpoint()
 async def generate_schedule(account_id: int, num_days: int, year: int, month: int, request: Request) -> list[dict] | dict[str, str]:
     # month is in range [0, 11]
+    sub = request.state.sub  # Set by the authentication in `endpoint`
+    plan = sub.plan if sub is not None else PricingPlanEnum.STARTER
     teams = get_teams(account_id)
+    shifts = get_shifts(account_id)
+    holidays = get_holidays(account_id)
+    employees_of_team = {}
+    for employee in get_employees(account_id):
+        employees_of_team.setdefault(employee.team_id, []).append(employee)
     result = []
 
     for team in teams:
         team_id = team.team_id
-        employees = get_employees_of_team(team_id)
-        shifts = get_shifts(account_id)
-        holidays = get_holidays(account_id)
+        employees = employees_of_team.get(team_id, [])
         if not employees: raise ValueError('No employees registered by the account.')
         if not shifts: raise ValueError('No shifts registered by the account.')
 
-        engine = Engine(account_id, team_id)
-        schedule_of_ids = engine.generate(employees, shifts, holidays, num_days, year, month)
+        # Queued fairly with other accounts' generations & run off the event loop (see `AdmissionController`)
+        schedule_of_ids = await admission.run(account_id, plan, _generate, account_id, team_id, employees, shifts, holidays, num_days, year, month)
         existing_schedule = get_schedules(account_id, year=year, month=month, team_id=team_id)
 
         if existing_schedule:
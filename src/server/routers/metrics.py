@@ -0,0 +1,105 @@
+import secrets, jpype
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse, ORJSONResponse
+from src.server.rate_limit import limiter
+from src.server.lib.constants import METRICS_TOKEN
+from src.server.lib.metrics import Gauge, render_metrics
+from src.server.lib.hashing import get_hashing_stats
+from src.server.db import get_cache_stats, get_session_cache_stats
+from src.server.db.tables import engine, replica_engine
+from src.server.db.slow_queries import get_slow_query_summary
+from src.server.engine import get_engine_stats
+from src.server.engine.admission import admission
+
+metrics_router = APIRouter()
+
+
+## Collectors
+def _pool_stats() -> dict[tuple[str, str], float]:
+    stats = {}
+    for name, db_engine in (('primary', engine), ('replica', replica_engine)):
+        if db_engine is None: continue
+        pool = db_engine.pool
+        for state, value in (('size', pool.size()), ('checked_out', pool.checkedout()), ('checked_in', pool.checkedin()), ('overflow', pool.overflow())):
+            stats[(name, state)] = value
+    return stats
+
+
+def _cache_stats() -> dict[tuple[str, str], float]:
+    stats = {}
+    for cache, cache_stats in (('data', get_cache_stats()), ('sessions', get_session_cache_stats())):
+        for stat, value in cache_stats.items():
+            stats[(cache, stat)] = value
+    return stats
+
+
+def _management_factory():
+    """Returns Java's `ManagementFactory`, or None before the JVM is started."""
+    return jpype.JClass('java.lang.management.ManagementFactory') if jpype.isJVMStarted() else None
+
+
+def _jvm_memory() -> dict[tuple[str, str], float]:
+    if (factory := _management_factory()) is None: return {}
+    bean = factory.getMemoryMXBean()
+    stats = {}
+    for area, usage in (('heap', bean.getHeapMemoryUsage()), ('nonheap', bean.getNonHeapMemoryUsage())):
+        stats[(area, 'used')] = usage.getUsed()
+        stats[(area, 'committed')] = usage.getCommitted()
+        stats[(area, 'max')] = usage.getMax()  # -1 if undefined
+    return stats
+
+
+def _jvm_gc(stat: str) -> dict[tuple[str], float]:
+    if (factory := _management_factory()) is None: return {}
+    beans = factory.getGarbageCollectorMXBeans()
+    if stat == 'count':
+        return {(str(bean.getName()),): bean.getCollectionCount() for bean in beans}
+    return {(str(bean.getName()),): bean.getCollectionTime() / 1000 for bean in beans}
+
+
+def _jvm_threads() -> dict[tuple[str], float]:
+    if (factory := _management_factory()) is None: return {}
+    bean = factory.getThreadMXBean()
+    return {('live',): bean.getThreadCount(), ('daemon',): bean.getDaemonThreadCount(), ('peak',): bean.getPeakThreadCount()}
+
+
+Gauge('shiftiatrics_db_pool_connections', 'DB connection pool state, by pool (primary or replica).', _pool_stats, ('pool', 'state'))
+Gauge('shiftiatrics_cache', 'Hits, misses, evictions, entries & memory use of the in-process caches.', _cache_stats, ('cache', 'stat'))
+Gauge('shiftiatrics_bcrypt_pool', 'Queue length, running & completed hashes, and average wait & hash seconds of the bcrypt pool.', lambda: {(stat,): value for stat, value in get_hashing_stats().items()}, ('stat',))
+Gauge('shiftiatrics_engine_generations_in_progress', 'Schedule generations currently running.', lambda: {(): get_engine_stats()['in_progress']})
+Gauge('shiftiatrics_engine_generations_total', 'Finished schedule generations, by outcome.', lambda: {(outcome,): get_engine_stats()[outcome] for outcome in ('completed', 'failed')}, ('outcome',), 'counter')
+Gauge('shiftiatrics_engine_generation_seconds_total', 'Total time spent generating schedules.', lambda: {(): get_engine_stats()['seconds']}, metric_type='counter')
+Gauge('shiftiatrics_engine_queue', 'Schedule generations queued & running in the admission controller, by plan.', lambda: {(plan, state): count for plan, counts in admission.stats().items() for state, count in counts.items()}, ('plan', 'state'))
+Gauge('shiftiatrics_jvm_memory_bytes', 'JVM memory usage, by area & kind.', _jvm_memory, ('area', 'kind'))
+Gauge('shiftiatrics_jvm_gc_collections_total', 'JVM garbage collections, by collector.', lambda: _jvm_gc('count'), ('collector',), 'counter')
+Gauge('shiftiatrics_jvm_gc_seconds_total', 'Time spent in JVM garbage collection, by collector.', lambda: _jvm_gc('time'), ('collector',), 'counter')
+Gauge('shiftiatrics_jvm_threads', 'JVM thread counts.', _jvm_threads, ('kind',))
+
+
+
+## Endpoint
+def _authorized(request: Request) -> bool:
+    """
+    Allows clients presenting `METRICS_TOKEN` as a bearer token, and none if it is unset. Loopback peers are not trusted,
+    since behind a local reverse proxy every public request comes from one.
+    """
+    if not METRICS_TOKEN: return False
+    return secrets.compare_digest(request.headers.get('authorization', '').encode(), f'Bearer {METRICS_TOKEN}'.encode())
+
+
+@metrics_router.get('/metrics', include_in_schema=False)
+@limiter.exempt
+async def metrics(request: Request) -> PlainTextResponse:
+    """Serves metrics in the Prometheus text format. Unauthorized clients get a 404, so the endpoint is not advertised."""
+    if not _authorized(request):
+        return PlainTextResponse('Not Found', status_code=404)
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4')
+
+
+@metrics_router.get('/metrics/slow_queries', include_in_schema=False)
+@limiter.exempt
+async def slow_queries(request: Request, limit: int = 20) -> ORJSONResponse:
+    """Lists this worker's slowest statements by total time, with the calling DB functions & latest captured plan."""
+    if not _authorized(request):
+        return ORJSONResponse({'error': 'Not Found'}, status_code=404)
+    return ORJSONResponse(get_slow_query_summary(limit))
@@ -0,0 +1,32 @@
+from argparse import ArgumentParser
+from datetime import date, time
+import json, timeit, orjson
+from fastapi.encoders import jsonable_encoder
+from src.server.lib.utils import todicts
+from src.server.db import Employee, Shift, Holiday
+
+def _legacy_todicts(objs: list[object]) -> list[dict]:
+    """The per-column `getattr` loop that `todict` used before serializers were compiled per model."""
+    return [{col.name: getattr(obj, col.name) for col in obj.__table__.columns} for obj in objs]
+
+
+def _make_rows(model: type, n: int) -> list[object]:
+    """Creates `n` transient objects of the given model (no DB access needed)."""
+    if model is Employee:
+        return [Employee(account_id=1, employee_id=i, team_id=1, employee_name=f'Employee {i}', min_work_hours=120, max_work_hours=160) for i in range(n)]
+    if model is Shift:
+        return [Shift(account_id=1, shift_id=i, shift_name=f'Shift {i}', start_time=time(8), end_time=time(16)) for i in range(n)]
+    return [Holiday(account_id=1, holiday_id=i, holiday_name=f'Holiday {i}', assigned_to=[1, 2, 3], start_date=date(2024, 12, 24), end_date=date(2024, 12, 26)) for i in range(n)]
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the serialization of large API responses')
+    parser.add_argument('--rows', type=int, default=10_000, help='Number of rows per response')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs to take the best time of')
+    args = parser.parse_args()
+
+    for model in (Employee, Shift, Holiday):
+        rows = _make_rows(model, args.rows)
+        legacy = min(timeit.repeat(lambda: json.dumps(jsonable_encoder(_legacy_todicts(rows))).encode(), number=1, repeat=args.repeat))
+        compiled = min(timeit.repeat(lambda: orjson.dumps(todicts(rows)), number=1, repeat=args.repeat))
+        print(f'{model.__name__:<10} {args.rows} rows: legacy {legacy * 1000:8.1f} ms | compiled + orjson {compiled * 1000:8.1f} ms | {legacy / compiled:5.1f}x')
@@ -0,0 +1,42 @@
+from argparse import ArgumentParser
+import subprocess, sys, os
+
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', '2000'))  # Importing `src.server.main` measured ~1.4 s; raise it on slower CI machines
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    """Imports `module` in a fresh interpreter with `-X importtime`, and returns each imported module's (self, cumulative) microseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Failed to import {module}:\n{result.stderr}')
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line: continue
+        self_us, cumulative_us, name = line.removeprefix('import time:').split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the import time of the server, and fail if it exceeds a budget')
+    parser.add_argument('--module', default='src.server.main', help='Module to import')
+    parser.add_argument('--budget_ms', type=float, default=IMPORT_BUDGET_MS, help='Max. total import time in milliseconds')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest modules to list')
+    args = parser.parse_args()
+
+    try:
+        times = import_times(args.module)
+    except RuntimeError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
+
+    total_ms = sum(self_us for self_us, _ in times.values()) / 1000
+    print(f'{"Module":<60} {"self":>10} {"cumulative":>12}')
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: item[1][1], reverse=True)[:args.top]:
+        print(f'{name:<60} {self_us / 1000:8.1f}ms {cumulative_us / 1000:10.1f}ms')
+
+    if total_ms > args.budget_ms:
+        print(f'❌ Importing {args.module} took {total_ms:.1f} ms ({len(times)} modules), over the budget of {args.budget_ms:.1f} ms')
+        sys.exit(1)
+    print(f'✅ Importing {args.module} took {total_ms:.1f} ms ({len(times)} modules)')
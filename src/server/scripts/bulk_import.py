@@ -0,0 +1,33 @@
+from argparse import ArgumentParser
+import csv
+from src.server.db import bulk_create_employees, bulk_create_shifts, bulk_create_holidays
+
+def _parse_row(entity: str, row: dict[str, str]) -> dict:
+    """Casts the string values of a CSV row to the types expected by the bulk functions."""
+    row = {key: value for key, value in row.items() if value not in (None, '')}
+    if entity == 'employees':
+        for key in ('team_id', 'min_work_hours', 'max_work_hours'):
+            if key in row: row[key] = int(row[key])
+    elif entity == 'holidays':
+        row['assigned_to'] = [int(emp_id) for emp_id in row.get('assigned_to', '').split(';') if emp_id]
+    return row
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Create many employees, shifts, or holidays at once from a CSV file')
+    parser.add_argument('--account_id', type=int, required=True, help='Account ID')
+    parser.add_argument('--entity', required=True, choices=['employees', 'shifts', 'holidays'], help='Type of the rows in the CSV file')
+    parser.add_argument('--csv', required=True, help='Path to a CSV file whose header holds the column names (holiday employee IDs are separated by ";")')
+    args = parser.parse_args()
+
+    try:
+        with open(args.csv, newline='') as file:
+            rows = [_parse_row(args.entity, row) for row in csv.DictReader(file)]
+
+        bulk_create = {'employees': bulk_create_employees, 'shifts': bulk_create_shifts, 'holidays': bulk_create_holidays}[args.entity]
+        result = bulk_create(args.account_id, rows)
+        print(f"✅ Created {len(result['created'])} {args.entity}")
+        for error in result['errors']:
+            print(f"❌ Row {error['index'] + 1}: {error['error']}")
+    except Exception as e:
+        print(f"❌ Error creating {args.entity}: {e}")
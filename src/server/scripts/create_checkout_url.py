@@ -1,6 +1,6 @@
 from argparse import ArgumentParser
-import stripe
 from src.server.lib.constants import WEB_SERVER_URL
+from src.server.lib.utils import load_stripe
 
 if __name__ == '__main__':
     parser = ArgumentParser(description='Generate a Stripe Checkout link for a subscription')
@@ -8,7 +8,7 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     try:
-        session = stripe.checkout.Session.create(
+        session = load_stripe().checkout.Session.create(
             mode='subscription',
             line_items=[{'price': args.price_id, 'quantity': 1}],
             success_url=f'{WEB_SERVER_URL}/dashboard?chkout_session_id={{CHECKOUT_SESSION_ID}}',
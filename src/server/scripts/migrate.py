@@ -0,0 +1,18 @@
+from argparse import ArgumentParser
+import sys
+from src.server.db.migrations import migrate
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Apply pending DB migrations')
+    parser.add_argument('--wait', action='store_true', help='Wait for another process applying migrations, instead of failing')
+    args = parser.parse_args()
+
+    try:
+        count = migrate(wait=args.wait)
+    except Exception as e:
+        print(f'❌ Error applying migrations: {e}')
+        sys.exit(1)
+    if count is None:
+        print('❌ Another process is applying migrations. Please try again later.')
+        sys.exit(1)
+    print(f'✅ Applied {count} migration(s)')
@@ -0,0 +1,16 @@
+from argparse import ArgumentParser
+from src.server.lib.constants import TOKEN_SWEEP_BATCH_SIZE
+from src.server.db.maintenance import sweep_expired_tokens, get_token_table_stats
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Delete expired tokens in bounded batches')
+    parser.add_argument('--batch_size', type=int, default=TOKEN_SWEEP_BATCH_SIZE, help='Rows deleted per transaction')
+    parser.add_argument('--max_batches', type=int, default=None, help='Max. batches per table (default: until none are left)')
+    args = parser.parse_args()
+
+    try:
+        swept = sweep_expired_tokens(args.batch_size, args.max_batches)
+        stats = get_token_table_stats()
+        print(f"✅ Swept {swept['tokens']} token(s) & {swept['revoked_tokens']} revocation(s); {stats['tokens_rows']} token(s) left ({stats['tokens_size_bytes']} bytes)")
+    except Exception as e:
+        print(f"❌ Error sweeping tokens: {e}")
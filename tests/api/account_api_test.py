@@ -1,7 +1,10 @@
+from fastapi import Response
 from fastapi.testclient import TestClient
+import asyncio
 from src.server.main import app
+from src.server.lib.api import endpoint, clear_cookies
 from src.server.lib.models import Credentials
-from src.server.db import log_in_account
+from src.server.db import log_in_account, create_team, create_employee, create_shift
 from tests.utils import ctxtest, login, signup, CRED
 
 # Init
@@ -68,4 +71,29 @@ def test_request_delete_account():
     assert response.status_code == 200
     assert response.cookies.get('account_id') == None
     assert response.cookies.get('auth_token') == None
-    assert response.json()['detail'] == 'Account deletion request sent'
\ No newline at end of file
+    assert response.json()['detail'] == 'Account deletion request sent'
+
+
+def test_get_account_data_streamed():
+    create_team(1, 'Test Team')
+    create_employee(1, 'John', 1, 120, 160)
+    create_shift(1, 'Morning', '06:00', '12:00')
+    regular = client.get('/accounts/data')
+    streamed = client.get('/accounts/data?stream=true')
+    assert streamed.status_code == 200
+    assert streamed.headers['content-type'] == 'application/json'
+    assert streamed.json() == regular.json()
+    assert streamed.json()['shifts'][0]['start_time'] == '06:00:00'
+
+
+def test_error_response_keeps_headers():
+    @endpoint(auth=False)
+    async def failing(request, response: Response) -> dict:
+        clear_cookies(response)
+        response.headers['X-Next-Cursor'] = 'cursor'
+        raise ValueError('Failed after setting headers')
+
+    response = asyncio.run(failing(request=None, response=Response()))
+    assert response.body == b'{"error":"Failed after setting headers"}'
+    assert response.headers['x-next-cursor'] == 'cursor'
+    assert len(response.headers.getlist('set-cookie')) == 2
@@ -1,6 +1,6 @@
 from fastapi.testclient import TestClient
 from src.server.main import app
-from src.server.db import create_team, create_employee
+from src.server.db import create_team, create_employee, get_employees
 from tests.utils import ctxtest, signup, EMPLOYEE
 
 # Init
@@ -20,4 +20,21 @@ def test_read_employees(setup_and_teardown):
     response = client.get(f'/employees/{account_id}')
     assert response.status_code == 200
     assert isinstance(response.json(), list)
-    assert response.json()[0]['employee_name'] == EMPLOYEE['employee_name']
\ No newline at end of file
+    assert response.json()[0]['employee_name'] == EMPLOYEE['employee_name']
+
+
+def test_create_employees_in_bulk(setup_and_teardown):
+    account_id = setup_and_teardown
+    employees = [{**EMPLOYEE, 'employee_name': f'Employee {i}'} for i in range(50)] + [{'employee_name': 'No Team'}]
+    response = client.post(f'/employees/{account_id}/bulk', json=employees)
+    assert response.status_code == 200
+    assert len(response.json()['created']) == 50
+    assert response.json()['errors'][0]['index'] == 50
+    assert len(get_employees(account_id)) == 51
+
+
+def test_update_employees_in_bulk(setup_and_teardown):
+    account_id = setup_and_teardown
+    response = client.patch(f'/employees/{account_id}/bulk', json=[{'employee_id': 1, 'max_work_hours': 200}])
+    assert response.status_code == 200
+    assert response.json()['updated'][0]['max_work_hours'] == 200
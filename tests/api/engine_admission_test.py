@@ -0,0 +1,82 @@
+from threading import Lock, Event
+import asyncio, time, pytest
+from src.server.engine.admission import AdmissionController, queue_wait
+from src.server.lib.types import PricingPlanEnum
+from src.server.lib.exceptions import EngineBusy
+
+# Init
+class Recorder:
+    """Engine stand-in that records the order & concurrency of the jobs it runs."""
+    def __init__(self):
+        self.order: list[str] = []
+        self.running: dict[str, int] = {}
+        self.max_running: dict[str, int] = {}
+        self._lock = Lock()
+
+    def job(self, name: str, seconds: float = 0.01) -> str:
+        account = name.split('-')[0]
+        with self._lock:
+            self.order.append(name)
+            self.running[account] = self.running.get(account, 0) + 1
+            self.max_running[account] = max(self.max_running.get(account, 0), self.running[account])
+        time.sleep(seconds)
+        with self._lock: self.running[account] -= 1
+        return name
+
+
+# Tests
+def test_fair_queuing_across_accounts():
+    async def scenario():
+        controller, recorder = AdmissionController(workers=1), Recorder()
+        jobs = [controller.run(1, PricingPlanEnum.ENTERPRISE, recorder.job, f'big-{i}') for i in range(8)]
+        jobs += [controller.run(2, PricingPlanEnum.STARTER, recorder.job, f'small-{i}') for i in range(2)]
+        results = await asyncio.gather(*jobs)
+        controller.shutdown()
+        return results, recorder.order
+
+    results, order = asyncio.run(scenario())
+    assert results == [f'big-{i}' for i in range(8)] + ['small-0', 'small-1']
+    # The starter account gets 1 slot for every 4 of the enterprise account (weights 1:4), instead of waiting for all 8
+    assert order == ['big-0', 'big-1', 'big-2', 'big-3', 'small-0', 'big-4', 'big-5', 'big-6', 'big-7', 'small-1']
+
+
+def test_plan_concurrency_quota():
+    async def scenario():
+        controller, recorder = AdmissionController(workers=4), Recorder()
+        await asyncio.gather(
+            *(controller.run(1, PricingPlanEnum.STARTER, recorder.job, f'starter-{i}', 0.05) for i in range(3)),
+            *(controller.run(2, PricingPlanEnum.ENTERPRISE, recorder.job, f'enterprise-{i}', 0.05) for i in range(3))
+        )
+        controller.shutdown()
+        return recorder.max_running
+
+    max_running = asyncio.run(scenario())
+    assert max_running == {'starter': 1, 'enterprise': 2}
+
+
+def test_queue_limit_per_account():
+    async def scenario():
+        controller, gate = AdmissionController(workers=1, max_queued_per_account=2), Event()
+        running = asyncio.ensure_future(controller.run(1, PricingPlanEnum.STARTER, gate.wait))
+        await asyncio.sleep(0)
+        queued = [asyncio.ensure_future(controller.run(1, PricingPlanEnum.STARTER, lambda: None)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(EngineBusy):
+            await controller.run(1, PricingPlanEnum.STARTER, lambda: None)
+        assert controller.stats()['starter'] == {'queued': 2, 'running': 1}
+        gate.set()
+        await asyncio.gather(running, *queued)
+        controller.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_queue_wait_is_reported_by_plan():
+    async def scenario():
+        controller = AdmissionController(workers=1)
+        await asyncio.gather(*(controller.run(3, PricingPlanEnum.GROWTH, time.sleep, 0.01) for _ in range(3)))
+        controller.shutdown()
+
+    asyncio.run(scenario())
+    growth = [value for name, labels, value in queue_wait.samples() if name.endswith('_count') and labels['plan'] == 'growth']
+    assert growth and growth[0] >= 3
@@ -2,7 +2,7 @@ import jpype
 from fastapi.testclient import TestClient
 from src.server.main import app
 from src.server.lib.constants import SCHEDULE_ENGINE_PATH
-from src.server.db import create_team, create_schedule, create_employee, create_shift
+from src.server.db import create_team, create_schedule, create_employee, create_shift, log_in_account_with_cookies
 from tests.utils import ctxtest, signup, EMPLOYEE, SCHEDULE, SHIFT1, SHIFT2
 
 # Init
@@ -29,6 +29,15 @@ def test_generate_schedule(setup_and_teardown):
     assert isinstance(response.json(), list)
 
 
+def test_generate_schedule_authenticates_once(setup_and_teardown, monkeypatch):
+    account_id, _ = setup_and_teardown
+    calls = []
+    monkeypatch.setattr('src.server.lib.api.log_in_account_with_cookies', lambda cookies: calls.append(cookies) or log_in_account_with_cookies(cookies))
+    response = client.get(f'/engine/generate_schedule?account_id={account_id}&num_days=25&year={SCHEDULE["year"]}&month={SCHEDULE["month"]}')
+    assert isinstance(response.json(), list)
+    assert len(calls) == 1
+
+
 def test_get_shift_counts(setup_and_teardown):
     account_id, team_id = setup_and_teardown
     response = client.get(f'/engine/get_shift_counts_of_employees?account_id={account_id}&team_id={team_id}&year={SCHEDULE["year"]}&month={SCHEDULE["month"]}')
@@ -0,0 +1,90 @@
+from fastapi.testclient import TestClient
+from fastapi.responses import ORJSONResponse
+from starlette.requests import Request
+from sqlalchemy import text
+from src.server.main import app
+from src.server.lib.api import _with_etag
+from src.server.db import Session, create_team, create_employee, bulk_create_employees, get_data_version
+from tests.utils import ctxtest, signup, EMPLOYEE
+
+# Init
+client = TestClient(app)
+
+@ctxtest()
+def setup_and_teardown():
+    account_id = signup(client).json()['account']['account_id']
+    create_team(account_id, 'Test Team')
+    create_employee(account_id, **EMPLOYEE)
+    yield account_id
+
+
+def _request(if_none_match: str = None) -> Request:
+    headers = [(b'if-none-match', if_none_match.encode())] if if_none_match else []
+    return Request({'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'headers': headers})
+
+
+# Tests
+def test_matching_etag_gets_304(setup_and_teardown):
+    account_id = setup_and_teardown
+    response = client.get(f'/employees/{account_id}')
+    etag = response.headers['etag']
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == 'private, no-cache'
+
+    response = client.get(f'/employees/{account_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+
+
+def test_write_changes_etag(setup_and_teardown):
+    account_id = setup_and_teardown
+    etag = client.get(f'/employees/{account_id}').headers['etag']
+    create_employee(account_id, **{**EMPLOYEE, 'employee_name': 'Dr. Bob'})
+
+    response = client.get(f'/employees/{account_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    assert len(response.json()) == 2
+
+
+def test_etags_differ_by_endpoint_and_query(setup_and_teardown):
+    account_id = setup_and_teardown
+    etags = {
+        client.get(f'/employees/{account_id}').headers['etag'],
+        client.get(f'/shifts/{account_id}').headers['etag'],
+        client.get(f'/schedules/{account_id}').headers['etag'],
+        client.get(f'/schedules/{account_id}?from_year=2025').headers['etag']
+    }
+    assert len(etags) == 4
+
+
+def test_writes_outside_the_orm_bump_version(setup_and_teardown):
+    account_id = setup_and_teardown
+    etag = client.get(f'/employees/{account_id}').headers['etag']
+    version = get_data_version(account_id)
+
+    # Like another worker or script writing with raw SQL, which this process's cache does not see
+    with Session() as session:
+        session.execute(text("UPDATE employees SET employee_name = 'Dr. Carol' WHERE account_id = :account_id"), {'account_id': account_id})
+        session.commit()
+    assert get_data_version(account_id) == version + 1
+
+    response = client.get(f'/employees/{account_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()[0]['employee_name'] == 'Dr. Carol'
+
+
+def test_bulk_write_bumps_version_once(setup_and_teardown):
+    account_id = setup_and_teardown
+    version = get_data_version(account_id)
+    bulk_create_employees(account_id, [{**EMPLOYEE, 'employee_name': f'Employee {i}'} for i in range(20)])
+    assert get_data_version(account_id) == version + 1
+
+
+def test_body_hash_etag():
+    response = _with_etag(ORJSONResponse({'a': 1}), _request(), None)
+    etag = response.headers['etag']
+    assert _with_etag(ORJSONResponse({'a': 1}), _request(etag), None).status_code == 304
+    assert _with_etag(ORJSONResponse({'a': 2}), _request(etag), None).status_code == 200
+    assert _with_etag(ORJSONResponse({'a': 1}), _request(f'"other", W/{etag}'), None).status_code == 304
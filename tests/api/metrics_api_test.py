@@ -0,0 +1,75 @@
+import re, pytest
+from fastapi.testclient import TestClient
+from src.server.main import app
+from src.server.rate_limit import limiter
+from tests.utils import ctxtest, signup
+
+# Init
+client = TestClient(app)
+AUTH = {'Authorization': 'Bearer test-metrics-token'}
+
+@ctxtest()
+def setup_and_teardown():
+    yield signup(client).json()['account']['account_id']
+
+
+@pytest.fixture
+def metrics_token(monkeypatch):
+    monkeypatch.setattr('src.server.routers.metrics.METRICS_TOKEN', 'test-metrics-token')
+
+
+def _sample(text: str, name: str, **labels: str) -> float:
+    """Returns the value of the sample with the given name & (a subset of its) labels."""
+    for line in text.splitlines():
+        match = re.fullmatch(r'(\w+)(?:\{(.*)\})? (\S+)', line)
+        if not match or match[1] != name: continue
+        sample_labels = dict(re.findall(r'(\w+)="([^"]*)"', match[2] or ''))
+        if all(sample_labels.get(key) == value for key, value in labels.items()):
+            return float(match[3])
+    raise KeyError(name)
+
+
+# Tests
+def test_metrics_require_token(setup_and_teardown, metrics_token):
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 404
+
+
+def test_metrics_disabled_without_token(setup_and_teardown, monkeypatch):
+    monkeypatch.setattr('src.server.routers.metrics.METRICS_TOKEN', None)
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics/slow_queries', headers={'X-Forwarded-For': '127.0.0.1'}).status_code == 404
+    assert client.get('/metrics', headers={'Authorization': 'Bearer None'}).status_code == 404
+
+
+def test_route_latency_and_errors(setup_and_teardown, metrics_token):
+    account_id = setup_and_teardown
+    client.get(f'/teams/{account_id}')
+    client.get(f'/teams/{account_id + 1}')  # Another account's teams, so an error dict is returned
+
+    response = client.get('/metrics', headers=AUTH)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    text = response.text
+    assert _sample(text, 'shiftiatrics_request_duration_seconds_count', route='/teams/{account_id}', method='GET', status='200') >= 2
+    assert _sample(text, 'shiftiatrics_request_duration_seconds_bucket', route='/teams/{account_id}', le='+Inf') >= 2
+    assert _sample(text, 'shiftiatrics_endpoint_errors_total', endpoint='read_teams', error='EndpointAuthError') >= 1
+
+
+def test_runtime_gauges(setup_and_teardown, metrics_token):
+    text = client.get('/metrics', headers=AUTH).text
+    assert _sample(text, 'shiftiatrics_db_pool_connections', pool='primary', state='size') >= 1
+    assert _sample(text, 'shiftiatrics_cache', cache='sessions', stat='entries') >= 0
+    assert _sample(text, 'shiftiatrics_bcrypt_pool', stat='workers') >= 1
+    assert _sample(text, 'shiftiatrics_engine_generations_in_progress') == 0
+    assert '# TYPE shiftiatrics_jvm_memory_bytes gauge' in text
+
+
+def test_rate_limit_rejections(setup_and_teardown, metrics_token):
+    limiter.enabled = True
+    try:
+        for _ in range(11):
+            client.post('/accounts/signup', json={'cred': {'email': 'x', 'password': 'y'}, 'legal_agree': True})
+    finally:
+        limiter.enabled = False
+    assert _sample(client.get('/metrics', headers=AUTH).text, 'shiftiatrics_rate_limit_rejections_total', route='/accounts/signup') >= 1
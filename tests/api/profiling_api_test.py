@@ -0,0 +1,85 @@
+import os, time, pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from src.server.main import app, _instrument_request
+from src.server.lib.profiling import start_profile, wait_for_profiles
+from tests.utils import ctxtest, signup
+
+# Init
+client = TestClient(app)
+
+@ctxtest()
+def setup_and_teardown():
+    yield signup(client).json()['account']['account_id']
+
+
+@pytest.fixture
+def profile_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr('src.server.lib.profiling.PROFILE_ADMIN_TOKEN', 'test-profile-token')
+    monkeypatch.setattr('src.server.lib.profiling.PROFILE_DIR', str(tmp_path))
+    yield tmp_path
+
+
+# Tests
+def test_profile_requested_by_admin(setup_and_teardown, profile_dir):
+    account_id = setup_and_teardown
+    response = client.get(f'/teams/{account_id}', headers={'X-Profile': 'test-profile-token'})
+    assert response.status_code == 200
+    wait_for_profiles()
+    assert os.path.exists(profile_dir / f"{response.headers['X-Profile-Id']}.collapsed")
+
+
+def test_profile_requires_admin_token(setup_and_teardown, profile_dir):
+    account_id = setup_and_teardown
+    response = client.get(f'/teams/{account_id}', headers={'X-Profile': 'wrong-token'})
+    assert 'X-Profile-Id' not in response.headers
+    wait_for_profiles()
+    assert list(profile_dir.iterdir()) == []
+
+
+def test_profile_covers_streamed_body(profile_dir):
+    def slow_body():
+        for chunk in (b'a', b'b'):
+            time.sleep(0.05)
+            yield chunk
+
+    streaming_app = FastAPI()
+    streaming_app.middleware('http')(_instrument_request)
+    streaming_app.get('/stream')(lambda: StreamingResponse(slow_body()))
+
+    response = TestClient(streaming_app).get('/stream', headers={'X-Profile': 'test-profile-token'})
+    assert response.content == b'ab'
+    wait_for_profiles()
+    lines = (profile_dir / f"{response.headers['X-Profile-Id']}.collapsed").read_text().splitlines()
+    assert any('slow_body' in line for line in lines)
+
+
+def test_profile_samples_stacks(profile_dir):
+    profiler = start_profile('GET /slow')
+    time.sleep(0.1)
+    profiler.stop()
+    wait_for_profiles()
+
+    lines = (profile_dir / f'{profiler.profile_id}.collapsed').read_text().splitlines()
+    assert any('MainThread;' in line and 'test_profile_samples_stacks' in line for line in lines)
+    assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+
+
+def test_one_profile_at_a_time(profile_dir):
+    profiler = start_profile('first')
+    assert start_profile('second') is None
+    profiler.stop()
+    wait_for_profiles()
+
+
+def test_artifacts_are_bounded(profile_dir, monkeypatch):
+    monkeypatch.setattr('src.server.lib.profiling.PROFILE_MAX_ARTIFACTS', 2)
+    ids = []
+    for i in range(4):
+        profiler = start_profile(f'request {i}')
+        profiler.stop()
+        wait_for_profiles()
+        ids.append(profiler.profile_id)
+        time.sleep(0.01)  # Distinct modification times
+    assert sorted(path.stem for path in profile_dir.iterdir()) == sorted(ids[-2:])
@@ -27,6 +27,21 @@ def test_read_schedules(setup_and_teardown):
     assert isinstance(response.json(), list)
 
 
+def test_read_schedules_paginated(setup_and_teardown):
+    account_id, team_id, _ = setup_and_teardown
+    create_schedule(account_id, team_id=team_id, **{**SCHEDULE, 'month': 6})
+
+    response = client.get(f'/schedules/{account_id}?limit=1&fields=team_id')
+    assert response.status_code == 200
+    assert 'schedule' not in response.json()[0]
+    cursor = response.headers['X-Next-Cursor']
+
+    response = client.get(f'/schedules/{account_id}?limit=1&after={cursor}')
+    assert response.json()[0]['month'] == 6
+    assert 'X-Next-Cursor' in response.headers
+    assert client.get(f'/schedules/{account_id}?limit=1&after={response.headers["X-Next-Cursor"]}').json() == []
+
+
 def test_create_new_schedule(setup_and_teardown):
     account_id, team_id, _ = setup_and_teardown
     new_data = {'schedule': [[[5, 6], [7]]], 'year': 2025, 'month': 7}
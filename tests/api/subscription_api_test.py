@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import pytest
+from src.server.main import app
+from src.server.lib.utils import utcnow
+from src.server.db import Session, Subscription, Invoice, create_sub
+from tests.utils import ctxtest, signup, FakeStripeCheckoutSession, FakeStripeSubscription, stripe_sub_json, stripe_event, sign_stripe_payload
+
+# Init
+client = TestClient(app)
+WEBHOOK_SECRET = 'whsec_test'
+
+@ctxtest()
+def setup_and_teardown():
+    signup(client)
+    with patch('stripe.checkout.Session.retrieve', return_value=FakeStripeCheckoutSession()), \
+         patch('stripe.Subscription.retrieve', return_value=FakeStripeSubscription(lookup_key='starter', period_end=utcnow() + timedelta(days=1))):
+        create_sub(1, chkout_session_id='cs_test_123')
+    yield
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(monkeypatch):
+    monkeypatch.setattr('src.server.routers.db.STRIPE_WEBHOOK_SECRET', WEBHOOK_SECRET)
+
+
+def _post_event(payload: bytes, secret: str = WEBHOOK_SECRET):
+    return client.post('/sub/webhook', content=payload, headers={'Stripe-Signature': sign_stripe_payload(payload, secret), 'Content-Type': 'application/json'})
+
+
+def _get_sub() -> Subscription:
+    with Session() as session:
+        return session.query(Subscription).filter_by(stripe_subscription_id=FakeStripeCheckoutSession.subscription).one()
+
+
+# Tests
+def test_webhook_applies_renewal():
+    renewed_until = utcnow() + timedelta(days=31)
+    payload = stripe_event('evt_1', 'customer.subscription.updated', stripe_sub_json(FakeStripeCheckoutSession.subscription, renewed_until, lookup_key='growth'))
+    response = _post_event(payload)
+    assert response.status_code == 200
+    assert response.json() == {'received': True, 'handled': True}
+
+    sub = _get_sub()
+    assert sub.plan.value == 'growth'
+    assert sub.expires_at.replace(microsecond=0) == renewed_until.replace(microsecond=0)
+
+
+def test_webhook_applies_cancellation():
+    payload = stripe_event('evt_2', 'customer.subscription.deleted', stripe_sub_json(FakeStripeCheckoutSession.subscription, utcnow(), status='canceled'))
+    assert _post_event(payload).json()['handled'] is True
+    assert _get_sub().status == 'canceled'
+    assert client.get('/auth/log_in_account_with_cookies').json()['subscription'] is None
+
+
+def test_webhook_ignores_duplicate_and_out_of_order_events():
+    newer = stripe_event('evt_3', 'customer.subscription.updated', stripe_sub_json(FakeStripeCheckoutSession.subscription, utcnow() + timedelta(days=60)))
+    older = stripe_event('evt_4', 'customer.subscription.updated', stripe_sub_json(FakeStripeCheckoutSession.subscription, utcnow() + timedelta(days=30)), created=utcnow() - timedelta(hours=1))
+    assert _post_event(newer).json()['handled'] is True
+    assert _post_event(newer).json()['handled'] is False
+    assert _post_event(older).json()['handled'] is False
+    assert (_get_sub().expires_at - utcnow()).days >= 59
+
+
+def test_webhook_rejects_bad_signature():
+    payload = stripe_event('evt_5', 'customer.subscription.deleted', stripe_sub_json(FakeStripeCheckoutSession.subscription, utcnow(), status='canceled'))
+    assert _post_event(payload, secret='whsec_wrong').status_code == 400
+    assert _get_sub().status == 'active'
+
+
+def test_webhook_stores_invoice():
+    invoice = {
+        'id': 'in_webhook', 'object': 'invoice', 'customer': FakeStripeCheckoutSession.customer, 'subscription': FakeStripeCheckoutSession.subscription,
+        'amount_due': 4900, 'amount_paid': 4900, 'currency': 'usd', 'status': 'paid', 'invoice_pdf': None, 'hosted_invoice_url': None,
+        'created': int(utcnow().timestamp()), 'due_date': None, 'description': None
+    }
+    assert _post_event(stripe_event('evt_6', 'invoice.paid', invoice)).json()['handled'] is True
+    with Session() as session:
+        assert session.get(Invoice, 'in_webhook').amount_paid == 4900
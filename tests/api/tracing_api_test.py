@@ -0,0 +1,149 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from queue import Queue
+import json, pytest
+from fastapi.testclient import TestClient
+from src.server.main import app
+from src.server.db import create_team
+from src.server.db.cache import clear_cache
+from src.server.lib import tracing
+from src.server.lib.tracing import flush_traces, _submit
+from tests.utils import ctxtest, signup
+
+# Init
+client = TestClient(app)
+
+@ctxtest()
+def setup_and_teardown():
+    account_id = signup(client).json()['account']['account_id']
+    create_team(account_id, 'Test Team')
+    clear_cache()
+    yield account_id
+
+
+@pytest.fixture
+def jsonl_traces(monkeypatch, tmp_path):
+    trace_file = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_EXPORTER', 'jsonl')
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_FILE', str(trace_file))
+
+    def read_spans() -> list[dict]:
+        flush_traces()
+        return [json.loads(line) for line in trace_file.read_text().splitlines()] if trace_file.exists() else []
+    yield read_spans
+
+
+@pytest.fixture
+def otlp_collector(monkeypatch):
+    """Local stand-in for an OTLP/HTTP collector, recording the JSON bodies posted to it."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args): pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_EXPORTER', 'otlp')
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_OTLP_ENDPOINT', f'http://127.0.0.1:{httpd.server_port}/v1/traces')
+    yield received
+    httpd.shutdown()
+    httpd.server_close()
+
+
+# Tests
+def test_request_spans_form_one_tree(setup_and_teardown, jsonl_traces):
+    account_id = setup_and_teardown
+    assert client.get(f'/teams/{account_id}').status_code == 200
+
+    spans = jsonl_traces()
+    by_name = {span['name']: span for span in spans}
+    root = by_name[f'GET /teams/{account_id}']
+    assert root['parent_id'] is None
+    assert root['attributes']['status_code'] == 200
+    assert len({span['trace_id'] for span in spans}) == 1
+
+    endpoint_span = by_name['endpoint.read_teams']
+    db_span = by_name['db.get_teams']
+    assert by_name['auth']['parent_id'] == root['span_id']
+    assert endpoint_span['parent_id'] == root['span_id']
+    assert db_span['parent_id'] == endpoint_span['span_id']
+    sql_spans = [span for span in spans if span['name'] == 'sql' and span['parent_id'] == db_span['span_id']]
+    assert sql_spans and all(span['attributes']['statement'] for span in sql_spans)
+
+
+def test_traceparent_continues_callers_trace(setup_and_teardown, jsonl_traces):
+    account_id = setup_and_teardown
+    trace_id, parent_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+    client.get(f'/teams/{account_id}', headers={'traceparent': f'00-{trace_id}-{parent_id}-01'})
+
+    spans = jsonl_traces()
+    assert spans and all(span['trace_id'] == trace_id for span in spans)
+    assert next(span for span in spans if span['name'].startswith('GET '))['parent_id'] == parent_id
+
+
+def test_trusted_proxy_decides_sampling(setup_and_teardown, jsonl_traces, monkeypatch):
+    account_id = setup_and_teardown
+    traceparent = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00'
+    client.get(f'/teams/{account_id}', headers={'traceparent': traceparent})
+    exported = len(jsonl_traces())
+    assert exported > 0  # Untrusted callers cannot opt out of (or into) sampling
+
+    monkeypatch.setattr('src.server.main.TRUSTED_PROXIES', frozenset({'testclient'}))
+    client.get(f'/teams/{account_id}', headers={'traceparent': traceparent})
+    assert len(jsonl_traces()) == exported
+
+
+def test_untrusted_traceparent_cannot_force_sampling(setup_and_teardown, jsonl_traces, monkeypatch):
+    account_id = setup_and_teardown
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_SAMPLE_RATE', 0.0)
+    client.get(f'/teams/{account_id}', headers={'traceparent': '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'})
+    assert jsonl_traces() == []
+
+
+@pytest.mark.parametrize('traceparent', [
+    '01-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01',  # Unknown version
+    '00-4BF92F3577B34DA6A3CE929D0E0E4736-00f067aa0ba902b7-01',  # Uppercase
+    '00-00000000000000000000000000000000-00f067aa0ba902b7-01',  # All-zero trace ID
+    '00-4bf92f3577b34da6a3ce929d0e0e4736-0000000000000000-01',  # All-zero parent ID
+    '00-<script>-x-01'
+])
+def test_malformed_traceparent_starts_new_trace(setup_and_teardown, jsonl_traces, traceparent):
+    account_id = setup_and_teardown
+    client.get(f'/teams/{account_id}', headers={'traceparent': traceparent})
+    spans = jsonl_traces()
+    assert spans and all(span['trace_id'] not in traceparent for span in spans)
+    assert all(len(span['trace_id']) == 32 for span in spans)
+    assert next(span for span in spans if span['name'].startswith('GET'))['parent_id'] is None
+
+
+def test_export_queue_is_bounded(monkeypatch):
+    monkeypatch.setattr('src.server.lib.tracing._export_queue', Queue(2))
+    monkeypatch.setattr('src.server.lib.tracing._exporter_thread', Thread())  # Never drains the queue
+    for _ in range(5): _submit([])
+    assert tracing._export_queue.qsize() == 2
+
+
+def test_unsampled_requests_record_nothing(setup_and_teardown, jsonl_traces, monkeypatch):
+    account_id = setup_and_teardown
+    monkeypatch.setattr('src.server.lib.tracing.TRACE_SAMPLE_RATE', 0.0)
+    client.get(f'/teams/{account_id}')
+    assert jsonl_traces() == []
+
+
+def test_otlp_export(setup_and_teardown, otlp_collector):
+    account_id = setup_and_teardown
+    client.get(f'/teams/{account_id}')
+    flush_traces()
+
+    assert len(otlp_collector) == 1
+    spans = otlp_collector[0]['resourceSpans'][0]['scopeSpans'][0]['spans']
+    names = {span['name'] for span in spans}
+    assert {f'GET /teams/{account_id}', 'endpoint.read_teams', 'db.get_teams', 'sql'} <= names
+    assert len({span['traceId'] for span in spans}) == 1
@@ -48,10 +48,11 @@ def test_change_password(setup_and_teardown):
     cookies = setup_and_teardown
     current_password = CRED.password
     new_password = 'NewPass!456'
-    modified_account = change_password(cookies, new_password, current_password)
+    modified_account, token = change_password(cookies, new_password, current_password)
 
     assert not _verify_password(current_password, modified_account.hashed_password)
     assert _verify_password(new_password, modified_account.hashed_password)
+    assert token != cookies.token  # Other sessions are logged out
 
 
 def test_change_password_invalid_current(setup_and_teardown):
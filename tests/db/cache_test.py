@@ -0,0 +1,123 @@
+from sqlalchemy import event, text
+import time, pytest
+from src.server.db import Session, engine, create_account, create_team, get_teams, update_team, bulk_create_employees, get_employees, get_cache_stats, \
+    log_in_account_with_cookies, change_password, get_session_cache_stats
+from src.server.lib.models import Cookies
+from src.server.lib.exceptions import InvalidCookies
+from src.server.db.cache import TTLCache, cache_session, get_cached_session, _session_keys
+from tests.utils import ctxtest, CRED
+
+NEW_PASSWORD = 'N3w_p@ssw0rd!'
+
+# Init
+@ctxtest()
+def setup_and_teardown():
+    account_id = create_account(CRED)[0].account_id
+    create_team(account_id, 'Test Team')
+    yield account_id
+
+
+@ctxtest()
+def cookies():
+    account, token = create_account(CRED)
+    yield Cookies(account_id=account.account_id, token=token)
+
+
+def _count_statements(func, *args) -> int:
+    statements = []
+    count = lambda *a, **kw: statements.append(a[2])
+    event.listen(engine, 'before_cursor_execute', count)
+    try: func(*args)
+    finally: event.remove(engine, 'before_cursor_execute', count)
+    return len(statements)
+
+
+# Tests
+def test_cache_hit_only_looks_up_version(setup_and_teardown):
+    account_id = setup_and_teardown
+    assert _count_statements(get_teams, account_id) == 2
+    assert _count_statements(get_teams, account_id) == 1  # The data version
+    assert get_cache_stats()['hits'] >= 1
+
+
+def test_other_workers_writes_invalidate_cache(setup_and_teardown):
+    account_id = setup_and_teardown
+    get_teams(account_id)
+    with Session() as session:  # Not seen by this process's session events, like a write from another worker
+        session.execute(text("UPDATE teams SET team_name = 'Renamed' WHERE account_id = :account_id"), {'account_id': account_id})
+        session.commit()
+    assert get_teams(account_id)[0].team_name == 'Renamed'
+
+
+def test_cached_objects_are_copies(setup_and_teardown):
+    account_id = setup_and_teardown
+    get_teams(account_id)[0].team_name = 'Modified'
+    assert get_teams(account_id)[0].team_name == 'Test Team'
+
+
+def test_write_invalidates_cache(setup_and_teardown):
+    account_id = setup_and_teardown
+    team_id = get_teams(account_id)[0].team_id
+    update_team(team_id, {'team_name': 'Renamed'})
+    assert get_teams(account_id)[0].team_name == 'Renamed'
+
+
+def test_bulk_insert_invalidates_cache(setup_and_teardown):
+    account_id = setup_and_teardown
+    assert get_employees(account_id) == []
+    bulk_create_employees(account_id, [{'employee_name': 'A', 'team_id': 1}])
+    assert len(get_employees(account_id)) == 1
+
+
+def test_ttl_and_lru_eviction():
+    cache = TTLCache(max_entries=2, ttl=0.05)
+    cache.set('a', [1])
+    cache.set('b', [2])
+    assert cache.get('a') == (True, [1])
+    cache.set('c', [3])  # Evicts "b", the least recently used
+    assert cache.get('b') == (False, None)
+    time.sleep(0.06)
+    assert cache.get('a') == (False, None)
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 1 and stats['misses'] == 2
+
+
+def test_cached_session_only_looks_up_version(cookies):
+    assert _count_statements(log_in_account_with_cookies, cookies) > 1
+    assert _count_statements(log_in_account_with_cookies, cookies) == 1  # The session version
+    assert get_session_cache_stats()['hits'] >= 1
+
+
+def test_other_workers_changes_revalidate_session(cookies):
+    log_in_account_with_cookies(cookies)
+    with Session() as session:  # Not seen by this process's session events, like a change through another worker
+        session.execute(text("UPDATE accounts SET email = 'changed@gmail.com' WHERE account_id = :account_id"), {'account_id': cookies.account_id})
+        session.commit()
+    assert _count_statements(log_in_account_with_cookies, cookies) > 1
+    assert log_in_account_with_cookies(cookies)[0].email == 'changed@gmail.com'
+
+
+def test_evicted_sessions_are_unindexed():
+    evicted = []
+    cache = TTLCache(max_entries=1, ttl=0.05, on_evict=evicted.append)
+    cache.set('a', 1)
+    cache.set('b', 2)  # Evicts "a", the least recently used
+    time.sleep(0.06)
+    assert cache.get('b') == (False, None)
+    assert evicted == ['a', 'b']
+
+    cache_session(99, 'expiring-token', ('account', None, 0), ttl=0.01)
+    assert 99 in _session_keys
+    time.sleep(0.02)
+    assert get_cached_session(99, 'expiring-token') is None
+    assert 99 not in _session_keys
+
+
+def test_password_change_evicts_session(cookies):
+    log_in_account_with_cookies(cookies)
+    _, token = change_password(cookies, NEW_PASSWORD, CRED.password)
+    with pytest.raises(InvalidCookies):
+        log_in_account_with_cookies(cookies)
+    assert log_in_account_with_cookies(Cookies(account_id=cookies.account_id, token=token))[0].account_id == cookies.account_id
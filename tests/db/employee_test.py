@@ -1,4 +1,4 @@
-from src.server.db import create_account, get_employees, create_team, create_employee, update_employee, delete_employee
+from src.server.db import create_account, get_employees, create_team, create_employee, update_employee, delete_employee, bulk_create_employees, bulk_update_employees
 from tests.utils import ctxtest, CRED, EMPLOYEE
 
 # Init
@@ -42,4 +42,32 @@ def test_delete_employee(setup_and_teardown):
     employee = create_employee(account_id, **EMPLOYEE)
     delete_employee(employee.employee_id)
     employees = get_employees(account_id)
-    assert len(employees) == 0
\ No newline at end of file
+    assert len(employees) == 0
+
+def test_bulk_create_employees(setup_and_teardown):
+    '''Test creating a batch of employees, where invalid items are reported per item.'''
+    account_id = setup_and_teardown
+    employees = [{**EMPLOYEE, 'employee_name': f'Employee {i}'} for i in range(100)]
+    employees.insert(10, {**EMPLOYEE, 'team_id': 999})
+    employees.insert(20, {**EMPLOYEE, 'employee_name': ''})
+
+    result = bulk_create_employees(account_id, employees)
+    assert len(result['created']) == 100
+    assert [error['index'] for error in result['errors']] == [10, 20]
+    assert result['created'][0]['employee_name'] == 'Employee 0'
+    assert result['created'][10]['index'] == 11
+    assert len(get_employees(account_id)) == 100
+
+
+def test_bulk_update_employees(setup_and_teardown):
+    '''Test updating a batch of employees.'''
+    account_id = setup_and_teardown
+    employee = create_employee(account_id, **EMPLOYEE)
+    result = bulk_update_employees(account_id, [
+        {'employee_id': employee.employee_id, 'employee_name': 'Jane Doe'},
+        {'employee_id': 999, 'employee_name': 'Ghost'},
+        {'employee_id': employee.employee_id, 'team_id': 2}
+    ])
+    assert [obj['employee_name'] for obj in result['updated']] == ['Jane Doe']
+    assert [error['index'] for error in result['errors']] == [1, 2]
+    assert get_employees(account_id)[0].employee_name == 'Jane Doe'
@@ -2,7 +2,7 @@ from src.server.lib.utils import parse_date
 from src.server.db import (
     create_account, create_team,
     create_employee, delete_employee,
-    create_holiday, delete_holiday, get_holidays, update_holiday
+    create_holiday, delete_holiday, get_holidays, update_holiday, bulk_create_holidays
 )
 from tests.utils import ctxtest, CRED
 
@@ -69,4 +69,16 @@ def test_holiday_deleted_if_only_employee_deleted(setup_and_teardown):
     delete_employee(1)
     delete_employee(2)
     holidays = get_holidays(account_id)
-    assert len(holidays) == 0
\ No newline at end of file
+    assert len(holidays) == 0
+
+def test_bulk_create_holidays(setup_and_teardown):
+    account_id, _ = setup_and_teardown
+    result = bulk_create_holidays(account_id, [
+        HOLIDAY,
+        {**HOLIDAY, 'assigned_to': [3]},
+        {**HOLIDAY, 'start_date': '2023-12-27'},
+        {**HOLIDAY, 'holiday_name': 'Eid', 'assigned_to': [2]}
+    ])
+    assert [holiday['index'] for holiday in result['created']] == [0, 3]
+    assert [error['index'] for error in result['errors']] == [1, 2]
+    assert len(get_holidays(account_id)) == 3
@@ -0,0 +1,71 @@
+from datetime import timedelta
+from unittest.mock import patch
+import pytest
+from src.server.lib.models import Credentials
+from src.server.lib.utils import utcnow
+from src.server.db import create_account, create_sub, get_invoices, refresh_invoices, refresh_stale_invoices
+from tests.utils import ctxtest, FakeStripeCheckoutSession, FakeStripeSubscription, FakeStripeServer
+
+# Init
+def _stripe_invoice(invoice_id: str, days_ago: int, status: str = 'paid') -> dict:
+    created = int((utcnow() - timedelta(days=days_ago)).timestamp())
+    return {
+        'id': invoice_id, 'object': 'invoice', 'customer': FakeStripeCheckoutSession.customer, 'subscription': FakeStripeCheckoutSession.subscription,
+        'amount_due': 4900, 'amount_paid': 4900 if status == 'paid' else 0, 'currency': 'usd', 'status': status,
+        'invoice_pdf': f'https://pay.stripe.com/{invoice_id}.pdf', 'hosted_invoice_url': f'https://pay.stripe.com/{invoice_id}',
+        'created': created, 'due_date': None, 'description': None
+    }
+
+
+INVOICES = {'object': 'list', 'url': '/v1/invoices', 'has_more': False, 'data': [_stripe_invoice('in_old', 40), _stripe_invoice('in_new', 10)]}
+
+@ctxtest()
+def setup_and_teardown():
+    account = create_account(Credentials(email='user@test.com', password='00123400'))[0]
+    with patch('stripe.checkout.Session.retrieve', return_value=FakeStripeCheckoutSession()), \
+         patch('stripe.Subscription.retrieve', return_value=FakeStripeSubscription(lookup_key='starter', period_end=utcnow() + timedelta(days=20))):
+        create_sub(account.account_id, chkout_session_id='cs_test_123')
+    with FakeStripeServer() as stripe_server:
+        stripe_server.objects['/v1/invoices'] = INVOICES
+        yield account.account_id, stripe_server
+
+
+# Tests
+def test_invoices_are_served_locally_after_first_sync(setup_and_teardown):
+    account_id, stripe_server = setup_and_teardown
+    invoices = get_invoices(account_id)
+    assert [invoice['invoice_id'] for invoice in invoices] == ['in_new', 'in_old']  # Newest first
+    assert invoices[0]['amount_paid'] == 49.0 and invoices[0]['currency'] == 'USD'
+
+    assert get_invoices(account_id) == invoices
+    assert len(stripe_server.requests) == 1
+
+
+def test_stale_invoices_are_refreshed(setup_and_teardown, monkeypatch):
+    account_id, stripe_server = setup_and_teardown
+    get_invoices(account_id)
+    monkeypatch.setattr('src.server.db.functions.INVOICE_MAX_STALENESS_SECONDS', 0)
+    get_invoices(account_id)
+    assert len(stripe_server.requests) == 2
+
+
+def test_manual_refresh_picks_up_new_invoices(setup_and_teardown):
+    account_id, stripe_server = setup_and_teardown
+    get_invoices(account_id)
+    stripe_server.objects['/v1/invoices'] = dict(INVOICES, data=INVOICES['data'] + [_stripe_invoice('in_latest', 0, 'open')])
+    assert refresh_invoices(account_id)[0]['invoice_id'] == 'in_latest'
+    assert len(get_invoices(account_id)) == 3
+
+
+def test_refresh_stale_invoices(setup_and_teardown):
+    account_id, stripe_server = setup_and_teardown
+    assert refresh_stale_invoices() == 1  # Never synced
+    assert refresh_stale_invoices() == 0  # Synced just now
+    get_invoices(account_id)
+    assert len(stripe_server.requests) == 1
+
+
+def test_get_invoices_without_sub():
+    account = create_account(Credentials(email='nosub@test.com', password='00123400'))[0]
+    with pytest.raises(LookupError):
+        get_invoices(account.account_id)
@@ -0,0 +1,66 @@
+import json, pytest
+from src.server.lib import utils
+from src.server.lib.utils import log, log_enabled, errlog, flush_logs
+
+# Init
+@pytest.fixture
+def log_dir(monkeypatch, tmp_path):
+    """Enables logging into a temporary directory, with a fresh listener & loggers."""
+    monkeypatch.setattr(utils, 'ENABLE_LOGGING', True)
+    monkeypatch.setattr(utils, 'LOG_DIR', str(tmp_path))
+    monkeypatch.setattr(utils, '_listener', None)
+    monkeypatch.setattr(utils, '_loggers', {})
+    yield tmp_path
+    utils._stop_listener()
+
+
+class Unformattable:
+    def __str__(self):
+        raise AssertionError('Filtered messages should not be formatted')
+
+
+# Tests
+def test_text_log(log_dir):
+    log('Hello %s', 'logging_test', 'INFO', 'world')
+    log('Lowercase level', 'logging_test', 'warning')
+    errlog('test_text_log', ValueError('Bad value'), 'logging_test')
+    flush_logs()
+
+    lines = (log_dir / 'logging_test.log').read_text().splitlines()
+    assert len(lines) == 3
+    assert lines[0].endswith(' - INFO - - - Hello world')
+    assert lines[1].endswith(' - WARNING - - - Lowercase level')
+    assert lines[2].endswith(' - ERROR - - - [test_text_log] ValueError: Bad value')
+
+
+def test_json_log(log_dir, monkeypatch):
+    monkeypatch.setattr(utils, 'LOG_FORMAT', 'json')
+    log('Hello %s', 'logging_test', 'INFO', 'world')
+    flush_logs()
+
+    entry = json.loads((log_dir / 'logging_test.log').read_text())
+    assert entry['level'] == 'INFO'
+    assert entry['logger'] == 'logging_test'
+    assert entry['message'] == 'Hello world'
+    assert 'trace_id' not in entry
+
+
+def test_filtered_args_are_not_formatted(log_dir, monkeypatch):
+    monkeypatch.setattr(utils, 'LOG_LEVEL', 'INFO')
+    log('Filtered %s', 'logging_test_filtered', 'DEBUG', Unformattable())
+    log('Written', 'logging_test_filtered', 'info')
+    flush_logs()
+
+    assert not log_enabled('logging_test_filtered', 'debug')
+    assert log_enabled('logging_test_filtered', 'INFO')
+    lines = (log_dir / 'logging_test_filtered.log').read_text().splitlines()
+    assert len(lines) == 1 and lines[0].endswith('Written')
+
+
+def test_disabled_logging_writes_nothing(log_dir, monkeypatch):
+    monkeypatch.setattr(utils, 'ENABLE_LOGGING', False)
+    log('Not written %s', 'logging_test', 'ERROR', Unformattable())
+    flush_logs()
+
+    assert not log_enabled('logging_test')
+    assert not (log_dir / 'logging_test.log').exists()
@@ -0,0 +1,46 @@
+from datetime import timedelta
+from src.server.lib.utils import utcnow
+from src.server.db import Session, Token, create_account
+from src.server.db.maintenance import sweep_expired_tokens, get_token_table_stats
+from tests.utils import ctxtest, CRED
+
+# Init
+@ctxtest()
+def setup_and_teardown():
+    account, _ = create_account(CRED)
+    with Session() as session:
+        session.add_all(
+            Token(account_id=account.account_id, token=f'expired{i}', token_type='reset', expires_at=utcnow() - timedelta(minutes=1))
+            for i in range(5)
+        )
+        session.commit()
+    yield account.account_id
+
+
+# Tests
+def test_sweep_deletes_only_expired_tokens(setup_and_teardown):
+    account_id = setup_and_teardown
+    swept = sweep_expired_tokens(batch_size=2)
+    assert swept['tokens'] == 5
+    with Session() as session:
+        tokens = session.query(Token).filter_by(account_id=account_id).all()
+        assert [token.token_type.value for token in tokens] == ['auth']
+
+
+def test_sweep_respects_max_batches(setup_and_teardown):
+    assert sweep_expired_tokens(batch_size=2, max_batches=1)['tokens'] == 2
+    assert sweep_expired_tokens(batch_size=2)['tokens'] == 3
+
+
+def test_token_table_stats(setup_and_teardown):
+    stats = get_token_table_stats()
+    assert stats['tokens_rows'] == 6
+    assert stats['tokens_expired_rows'] == 5
+    assert stats['tokens_size_bytes'] > 0
+
+    runs, swept = stats['runs'], stats['tokens_swept']
+    sweep_expired_tokens()
+    stats = get_token_table_stats()
+    assert stats['runs'] == runs + 1
+    assert stats['tokens_swept'] == swept + 5
+    assert stats['tokens_expired_rows'] == 0
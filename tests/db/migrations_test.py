@@ -0,0 +1,68 @@
+from threading import Thread
+import psycopg2, pytest, time
+from src.server.lib.constants import PSQL_DB, PSQL_USER, PSQL_PASSWORD, PSQL_HOST, PSQL_PORT
+from src.server.db.migrations import migrate, list_migrations, _ADVISORY_LOCK_KEY
+from src.server.lib.exceptions import MigrationModified
+
+# Init
+def _connect():
+    conn = psycopg2.connect(dbname=PSQL_DB, user=PSQL_USER, password=PSQL_PASSWORD, host=PSQL_HOST, port=PSQL_PORT)
+    conn.autocommit = True
+    return conn
+
+
+# Tests
+def test_migrations_are_recorded_with_checksums():
+    migrate()
+    with _connect() as conn, conn.cursor() as cur:
+        cur.execute('SELECT version, checksum FROM schema_migrations ORDER BY version')
+        assert cur.fetchall() == [(version, checksum) for version, _, checksum in list_migrations()]
+
+
+def test_migrate_skips_applied_migrations():
+    migrate()
+    assert migrate() == 0
+
+
+def test_migrate_skips_when_locked():
+    conn = _connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM schema_migrations WHERE version = (SELECT MAX(version) FROM schema_migrations)')
+            cur.execute('SELECT pg_advisory_lock(%s)', (_ADVISORY_LOCK_KEY,))
+            assert migrate() is None  # Another "worker" holds the lock
+            cur.execute('SELECT pg_advisory_unlock(%s)', (_ADVISORY_LOCK_KEY,))
+        assert migrate() == 1
+    finally:
+        conn.close()
+
+
+def test_migrate_waits_for_lock():
+    conn, results = _connect(), []
+    try:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM schema_migrations WHERE version = (SELECT MAX(version) FROM schema_migrations)')
+            cur.execute('SELECT pg_advisory_lock(%s)', (_ADVISORY_LOCK_KEY,))
+            worker = Thread(target=lambda: results.append(migrate(wait=True)))
+            worker.start()
+            time.sleep(0.5)
+            assert worker.is_alive()  # Blocked until the other "worker" releases the lock
+            cur.execute('SELECT pg_advisory_unlock(%s)', (_ADVISORY_LOCK_KEY,))
+        worker.join(timeout=10)
+        assert results == [1]
+    finally:
+        conn.close()
+
+
+def test_modified_migration_raises():
+    migrate()
+    version, _, checksum = list_migrations()[0]
+    conn = _connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('UPDATE schema_migrations SET checksum = %s WHERE version = %s', ('0' * 64, version))
+            with pytest.raises(MigrationModified):
+                migrate()
+            cur.execute('UPDATE schema_migrations SET checksum = %s WHERE version = %s', (checksum, version))
+    finally:
+        conn.close()
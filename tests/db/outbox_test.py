@@ -0,0 +1,130 @@
+from datetime import timedelta
+import asyncio, pytest
+from aiosmtpd.controller import Controller
+from src.server.lib.utils import utcnow
+from src.server.lib import emails
+from src.server.lib.emails import queue_email, send_pending_emails, close_email_connection
+from src.server.db import Session, OutboxEmail, Token, create_account, request_reset_password
+from tests.utils import ctxtest, CRED
+
+# Init
+class _Inbox:
+    """aiosmtpd handler that keeps received messages & counts SMTP sessions."""
+    def __init__(self):
+        self.messages = []
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return '250 Message accepted for delivery'
+
+
+@ctxtest()
+def setup_and_teardown():
+    yield
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    handler = _Inbox()
+    controller = Controller(handler, hostname='127.0.0.1', port=0)
+    controller.start()
+    for name, value in (('MAIL_SERVER', '127.0.0.1'), ('MAIL_PORT', controller.port), ('MAIL_TLS', False), ('MAIL_SSL', False), ('MAIL_USERNAME', None)):
+        monkeypatch.setattr(f'src.server.lib.emails.{name}', value)
+    yield handler
+    controller.stop()
+
+
+def _queue(n: int) -> None:
+    with Session() as session:
+        for i in range(n):
+            queue_email(f'Test {i}', f'<p>Body {i}</p>', 'noreply@test.com', [f'user{i}@test.com'], session=session)
+        session.commit()
+
+
+def _send_batches(*batch_sizes: int) -> list[int]:
+    async def run():
+        try: return [await send_pending_emails(size) for size in batch_sizes]
+        finally: await close_email_connection()
+    return asyncio.run(run())
+
+
+def _outbox() -> list[OutboxEmail]:
+    with Session() as session:
+        return session.query(OutboxEmail).order_by(OutboxEmail.email_id).all()
+
+
+# Tests
+def test_outbox_emails_are_delivered(inbox):
+    _queue(3)
+    assert _send_batches(10) == [3]
+    assert sorted(envelope.rcpt_tos[0] for envelope in inbox.messages) == ['user0@test.com', 'user1@test.com', 'user2@test.com']
+    assert b'Subject: Shiftiatrics: Test 0' in inbox.messages[0].original_content
+    assert all(email.status == 'sent' and email.sent_at for email in _outbox())
+
+
+def test_batches_share_one_connection(inbox):
+    _queue(4)
+    assert _send_batches(2, 2, 2) == [2, 2, 0]
+    assert len(inbox.messages) == 4
+    assert inbox.sessions == 1
+
+
+def test_failed_emails_are_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr('src.server.lib.emails.MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setattr('src.server.lib.emails.MAIL_PORT', 1)  # Nothing listens here
+    monkeypatch.setattr('src.server.lib.emails.MAIL_SSL', False)
+    _queue(1)
+    assert _send_batches(10) == [0]
+
+    email = _outbox()[0]
+    assert email.status == 'pending' and email.attempts == 1
+    assert email.last_error
+    assert email.next_attempt_at > utcnow()
+    assert _send_batches(10) == [0]  # Not due yet
+
+
+def test_connection_failure_stops_the_batch(monkeypatch):
+    monkeypatch.setattr('src.server.lib.emails.MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setattr('src.server.lib.emails.MAIL_PORT', 1)
+    monkeypatch.setattr('src.server.lib.emails.MAIL_SSL', False)
+    connects = []
+    get = emails._connection.get
+    monkeypatch.setattr(emails._connection, 'get', lambda: connects.append(1) or get())
+    _queue(3)
+    assert _send_batches(10) == [0]
+
+    assert len(connects) == 1
+    assert sorted(email.attempts for email in _outbox()) == [0, 0, 1]  # Only the email being sent counts the failure
+    assert all(email.status == 'pending' and email.last_error and email.next_attempt_at > utcnow() for email in _outbox())
+
+
+def test_emails_fail_after_max_attempts(monkeypatch):
+    monkeypatch.setattr('src.server.lib.emails.MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setattr('src.server.lib.emails.MAIL_PORT', 1)
+    monkeypatch.setattr('src.server.lib.emails.MAIL_SSL', False)
+    monkeypatch.setattr('src.server.lib.emails.EMAIL_MAX_ATTEMPTS', 2)
+    _queue(1)
+    for _ in range(2):
+        with Session() as session:
+            session.query(OutboxEmail).update({'next_attempt_at': utcnow() - timedelta(seconds=1)})
+            session.commit()
+        _send_batches(10)
+    assert _outbox()[0].status == 'failed'
+
+
+def test_reset_token_is_not_committed_without_email(monkeypatch):
+    account_id = create_account(CRED)[0].account_id
+    def fail(*args, **kwargs): raise RuntimeError('Template error')
+    monkeypatch.setattr('src.server.db.functions.format_template', fail)
+
+    with pytest.raises(RuntimeError):
+        request_reset_password(CRED.email)
+    with Session() as session:
+        assert session.query(Token).filter_by(account_id=account_id, token_type='reset').count() == 0
+    assert _outbox() == []
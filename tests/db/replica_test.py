@@ -0,0 +1,62 @@
+from sqlalchemy import event
+import pytest, time
+from src.server.db import engine, replica_engine, create_account, create_team, get_teams, get_schedules, log_in_account, own_writes
+from src.server.db.cache import _written_at
+from tests.utils import ctxtest, CRED
+
+# Init
+pytestmark = pytest.mark.skipif(replica_engine is None, reason='POSTGRES_REPLICA_HOST is not set')
+
+@ctxtest()
+def setup_and_teardown():
+    account_id = create_account(CRED)[0].account_id
+    create_team(account_id, 'Test Team')
+    yield account_id
+
+
+def _engines_used(func, *args) -> set[str]:
+    used = set()
+    listeners = {
+        'primary': lambda *a, **kw: used.add('primary'),
+        'replica': lambda *a, **kw: used.add('replica')
+    }
+    event.listen(engine, 'before_cursor_execute', listeners['primary'])
+    event.listen(replica_engine, 'before_cursor_execute', listeners['replica'])
+    try: func(*args)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listeners['primary'])
+        event.remove(replica_engine, 'before_cursor_execute', listeners['replica'])
+    return used
+
+
+# Tests
+def test_reads_stick_to_primary_after_write(setup_and_teardown):
+    account_id = setup_and_teardown
+    assert _engines_used(get_schedules, account_id) == {'primary'}
+
+
+def test_reads_go_to_replica(setup_and_teardown):
+    account_id = setup_and_teardown
+    _written_at.pop(account_id, None)  # Simulate the end of the stickiness window
+    time.sleep(0.5)  # Let the replica catch up
+    assert _engines_used(get_schedules, account_id) == {'replica'}
+    assert get_teams(account_id)[0].team_name == 'Test Team'
+
+
+def test_writes_go_to_primary(setup_and_teardown):
+    account_id = setup_and_teardown
+    _written_at.pop(account_id, None)
+    assert 'primary' in _engines_used(create_team, account_id, 'Another Team')
+
+
+def test_auth_reads_use_primary(setup_and_teardown):
+    account_id = setup_and_teardown
+    _written_at.pop(account_id, None)
+    assert _engines_used(log_in_account, CRED) == {'primary'}
+
+
+def test_recent_write_of_client_uses_primary(setup_and_teardown):
+    account_id = setup_and_teardown
+    _written_at.pop(account_id, None)  # Written through another worker
+    with own_writes():
+        assert _engines_used(get_schedules, account_id) == {'primary'}
@@ -37,4 +37,35 @@ def test_delete_schedule(setup_and_teardown):
     account_id, _, schedule_id = setup_and_teardown
     delete_schedule(schedule_id)
     schedules = get_schedules(account_id)
-    assert len(schedules) == 0
\ No newline at end of file
+    assert len(schedules) == 0
+
+
+def test_get_schedules_with_date_range(setup_and_teardown):
+    account_id, team_id, _ = setup_and_teardown
+    for year, month in [(2023, 11), (2024, 0), (2024, 5), (2025, 1)]:
+        create_schedule(account_id, team_id=team_id, schedule=SCHEDULE['schedule'], year=year, month=month)
+
+    schedules = get_schedules(account_id, since=(2024, 0), until=(2024, 11))
+    assert [(s.year, s.month) for s in schedules] == [(2024, 0), (2024, 5), (2024, 11)]
+
+
+def test_get_schedules_keyset_pagination(setup_and_teardown):
+    account_id, team_id, _ = setup_and_teardown
+    for month in range(6):
+        create_schedule(account_id, team_id=team_id, schedule=SCHEDULE['schedule'], year=2025, month=month)
+
+    pages, after = [], None
+    while True:
+        page = get_schedules(account_id, after=after, limit=3)
+        if not page: break
+        pages.append(page)
+        after = (page[-1].year, page[-1].month, page[-1].schedule_id)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [s.month for s in pages[0]] == [11, 0, 1]
+
+
+def test_get_schedules_projection(setup_and_teardown):
+    account_id, team_id, schedule_id = setup_and_teardown
+    schedules = get_schedules(account_id, fields=['team_id'])
+    assert schedules == [{'schedule_id': schedule_id, 'year': 2024, 'month': 11, 'team_id': team_id}]
@@ -61,6 +61,31 @@ def test_create_shift(setup_and_teardown):
     assert shifts[0].shift_name == 'D'
 
 
+def test_bulk_import_employees(setup_and_teardown, tmp_path):
+    cookies = setup_and_teardown
+    account_id = cookies.account_id
+    csv_path = tmp_path / 'employees.csv'
+    csv_path.write_text('employee_name,team_id,min_work_hours,max_work_hours\nDr. Alice,1,100,160\nDr. Bob,1,,\nDr. Ghost,999,,\n')
+
+    result = subprocess.run(
+        [
+            'python3', '-m', 'src.server.scripts.bulk_import',
+            '--account_id', str(account_id),
+            '--entity', 'employees',
+            '--csv', str(csv_path)
+        ],
+        capture_output=True,
+        text=True
+    )
+    print(result.stdout, result.stderr, end='')
+
+    emps = get_employees(account_id)
+    assert result.returncode == 0
+    assert '✅ Created 2 employees' in result.stdout
+    assert '❌ Row 3' in result.stdout
+    assert [emp.employee_name for emp in emps] == ['Dr. Alice', 'Dr. Bob']
+
+
 def test_create_team(setup_and_teardown):
     cookies = setup_and_teardown
     account_id = cookies.account_id
@@ -119,6 +144,24 @@ def test_create_checkout_url():
     assert '✅' in result.stdout
 
 
+def test_bench_startup():
+    result = subprocess.run(
+        ['python3', '-m', 'src.server.scripts.bench_startup'],  # Fails over `IMPORT_BUDGET_MS`
+        capture_output=True,
+        text=True
+    )
+    print(result.stdout, result.stderr, end='')
+
+    assert result.returncode == 0
+    assert '✅' in result.stdout
+    result = subprocess.run(['python3', '-m', 'src.server.scripts.bench_startup', '--budget_ms', '1'], capture_output=True, text=True)
+    assert result.returncode == 1
+    assert '❌' in result.stdout
+    # Heavy dependencies that are only needed by some requests are imported on first use
+    result = subprocess.run(['python3', '-c', "import sys, src.server.main; print('stripe' in sys.modules)"], capture_output=True, text=True)
+    assert result.stdout.strip() == 'False'
+
+
 @pytest.mark.parametrize('script, args', [
     (
         'src.server.scripts.create_employee',
@@ -1,5 +1,5 @@
 from src.server.lib.utils import parse_time
-from src.server.db import create_account, create_shift, delete_shift, get_shifts, update_shift
+from src.server.db import create_account, create_shift, delete_shift, get_shifts, update_shift, bulk_create_shifts, bulk_update_shifts
 from tests.utils import ctxtest, CRED
 
 # Init
@@ -46,4 +46,33 @@ def test_delete_shift(setup_and_teardown):
     delete_shift(shift.shift_id)
     delete_shift(shift_id)
     shifts = get_shifts(account_id)
-    assert len(shifts) == 0
\ No newline at end of file
+    assert len(shifts) == 0
+
+def test_bulk_create_shifts(setup_and_teardown):
+    account_id, _ = setup_and_teardown
+    result = bulk_create_shifts(account_id, [SHIFT, SHIFT2, SHIFT3, SHIFT3, {**SHIFT2, 'shift_name': 'Late', 'end_time': 'late'}])
+    assert [shift['shift_name'] for shift in result['created']] == [SHIFT2['shift_name'], SHIFT3['shift_name']]
+    assert [error['index'] for error in result['errors']] == [0, 3, 4]
+    assert len(get_shifts(account_id)) == 3
+
+
+def test_bulk_update_shifts_keeps_names_unique(setup_and_teardown):
+    account_id, shift_id = setup_and_teardown
+    night_id = create_shift(account_id, **SHIFT3).shift_id
+    result = bulk_update_shifts(account_id, [{'shift_id': shift_id, 'shift_name': 'Night'}, {'shift_id': night_id, 'start_time': '01:00'}])
+    assert [error['index'] for error in result['errors']] == [0]
+    assert [shift['shift_id'] for shift in result['updated']] == [night_id]
+    assert sorted(shift.shift_name for shift in get_shifts(account_id)) == ['Morning', 'Night']
+
+
+def test_bulk_update_shifts_swaps_names(setup_and_teardown):
+    account_id, shift_id = setup_and_teardown
+    night_id = create_shift(account_id, **SHIFT3).shift_id
+    result = bulk_update_shifts(account_id, [{'shift_id': shift_id, 'shift_name': 'Night'}, {'shift_id': night_id, 'shift_name': 'Morning'}])
+    assert not result['errors'] and len(result['updated']) == 2
+    assert {shift.shift_id: shift.shift_name for shift in get_shifts(account_id)} == {shift_id: 'Night', night_id: 'Morning'}
+
+    # A rename that fails keeps its shift's name, which its swap partner can then no longer take
+    result = bulk_update_shifts(account_id, [{'shift_id': shift_id, 'shift_name': 'Morning'}, {'shift_id': night_id, 'shift_name': 'Night', 'end_time': 'late'}])
+    assert [error['index'] for error in result['errors']] == [0, 1] and not result['updated']
+    assert {shift.shift_id: shift.shift_name for shift in get_shifts(account_id)} == {shift_id: 'Night', night_id: 'Morning'}
@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import text
+from src.server.db import Session, create_account, create_team, get_teams
+from src.server.db.slow_queries import normalize_sql, parameter_shapes, scrub_plan, get_slow_query_summary, reset_slow_query_summary
+from tests.utils import ctxtest, CRED
+
+# Init
+@ctxtest()
+def setup_and_teardown():
+    account, _ = create_account(CRED)
+    create_team(account.account_id, 'Test Team')
+    reset_slow_query_summary()
+    yield account.account_id
+    reset_slow_query_summary()
+
+
+@pytest.fixture
+def log_every_query(monkeypatch):
+    monkeypatch.setattr('src.server.db.slow_queries.SLOW_QUERY_SECONDS', 0)
+    monkeypatch.setattr('src.server.db.slow_queries.SLOW_QUERY_EXPLAIN_RATE', 1)
+
+
+# Tests
+def test_normalize_sql():
+    assert normalize_sql("SELECT *\n  FROM teams WHERE name = 'O''Brien' AND id IN (%(id_1_1)s, %(id_1_2)s) LIMIT 10") == \
+        'SELECT * FROM teams WHERE name = ? AND id IN (...) LIMIT ?'
+    assert normalize_sql('SELECT anon_1.x FROM t WHERE a = %(a_1)s') == 'SELECT anon_1.x FROM t WHERE a = %(a_1)s'
+
+
+def test_parameter_shapes_hide_values():
+    assert parameter_shapes({'email': 'secret@example.com', 'ids': [1, 2, 3], 'n': 1}) == {'email': 'str[18]', 'ids': 'list[3]', 'n': 'int'}
+    assert parameter_shapes([{'a': 1}, {'a': 2}], executemany=True) == {'rows': 2, 'row': {'a': 'int'}}
+
+
+def test_scrub_plan_hides_literals():
+    plan = scrub_plan(
+        "Index Scan using tokens_token_key on tokens  (cost=0.15..8.17 rows=1 width=80) (actual time=0.010..0.011 rows=1 loops=1)\n"
+        "  Index Cond: ((token)::text = 'secret-token'::text)\n"
+        "  Filter: ((account_id = 42) AND (email = 'user@example.com'::text))\n"
+        "  Rows Removed by Filter: 3\n"
+        "  Buffers: shared hit=2\n"
+        "Planning Time: 0.071 ms"
+    )
+    assert 'secret-token' not in plan and 'user@example.com' not in plan and '42' not in plan
+    assert '(cost=0.15..8.17 rows=1 width=80) (actual time=0.010..0.011 rows=1 loops=1)' in plan
+    assert "  Index Cond: ((token)::text = ?::text)" in plan
+    assert '  Rows Removed by Filter: 3' in plan and '  Buffers: shared hit=2' in plan and 'Planning Time: 0.071 ms' in plan
+
+
+def test_explained_plans_hide_parameters(setup_and_teardown, log_every_query):
+    with Session() as session:
+        session.execute(text('SELECT * FROM accounts WHERE email = :email'), {'email': CRED.email})
+
+    plan = next(stats for stats in get_slow_query_summary(limit=100) if 'FROM accounts WHERE email' in stats['sql'])['last_plan']
+    assert plan and CRED.email not in plan
+
+
+def test_slow_queries_are_attributed_and_explained(setup_and_teardown, log_every_query):
+    account_id = setup_and_teardown
+    get_teams(account_id)
+
+    summary = get_slow_query_summary(limit=100)
+    teams_query = next(stats for stats in summary if 'FROM teams' in stats['sql'])
+    assert teams_query['functions'] == ['get_teams']
+    assert teams_query['count'] == 1
+    assert 'Buffers' in teams_query['last_plan'] or 'actual time' in teams_query['last_plan']
+
+
+def test_summary_orders_by_total_time(setup_and_teardown, monkeypatch):
+    monkeypatch.setattr('src.server.db.slow_queries.SLOW_QUERY_SECONDS', 0.05)
+    monkeypatch.setattr('src.server.db.slow_queries.SLOW_QUERY_EXPLAIN_RATE', 0)
+    with Session() as session:
+        session.execute(text('SELECT pg_sleep(0.06)'))
+        for _ in range(2): session.execute(text('SELECT pg_sleep(0.1)'))
+        session.execute(text('SELECT 1'))
+
+    summary = get_slow_query_summary()
+    assert [stats['sql'] for stats in summary] == ['SELECT pg_sleep(?)']  # Both sleeps normalize to one statement
+    assert summary[0]['count'] == 3 and summary[0]['functions'] == [None]
+
+
+def test_writes_are_not_explained(setup_and_teardown, log_every_query):
+    account_id = setup_and_teardown
+    create_team(account_id, 'Second Team')  # EXPLAIN ANALYZE would insert it again
+    assert len(get_teams(account_id)) == 2
+    insert = next(stats for stats in get_slow_query_summary(limit=100) if stats['sql'].startswith('INSERT INTO teams'))
+    assert insert['last_plan'] is None
@@ -3,8 +3,9 @@ from unittest.mock import MagicMock, patch
 from freezegun import freeze_time
 from src.server.lib.models import Credentials
 from src.server.lib.utils import utcnow
-from src.server.db import create_account, check_sub_expired, create_sub, _get_active_sub
-from tests.utils import ctxtest, FakeStripeCheckoutSession, FakeStripeSubscription
+from src.server.lib.constants import SUB_GRACE_SECONDS
+from src.server.db import Session, create_account, check_sub_expired, create_sub, reconcile_subs, _get_active_sub
+from tests.utils import ctxtest, FakeStripeCheckoutSession, FakeStripeSubscription, FakeStripeServer, stripe_sub_json
 
 # Init
 @ctxtest()
@@ -13,9 +14,14 @@ def setup_and_teardown():
     yield account.account_id
 
 
+def _get_active_sub_of(account_id: int):
+    with Session() as session:
+        return _get_active_sub(account_id, session=session)
+
+
 # Tests
-@patch('src.server.db.stripe.Subscription.retrieve')
-@patch('src.server.db.stripe.checkout.Session.retrieve')
+@patch('stripe.Subscription.retrieve')
+@patch('stripe.checkout.Session.retrieve')
 def test_create_sub_and_check_expired(mock_session_retrieve, mock_subscription_retrieve, setup_and_teardown):
     account_id = setup_and_teardown
 
@@ -32,8 +38,8 @@ def test_create_sub_and_check_expired(mock_session_retrieve, mock_subscription_r
     assert check_sub_expired(account_id) is False
 
 
-@patch('src.server.db.stripe.Subscription.retrieve')
-@patch('src.server.db.stripe.checkout.Session.retrieve')
+@patch('stripe.Subscription.retrieve')
+@patch('stripe.checkout.Session.retrieve')
 def test_create_sub_and_check_expired_after_time(mock_session_retrieve, mock_subscription_retrieve, setup_and_teardown):
     account_id = setup_and_teardown
 
@@ -50,56 +56,88 @@ def test_create_sub_and_check_expired_after_time(mock_session_retrieve, mock_sub
         assert check_sub_expired(account_id) is True
 
 
-@patch('src.server.db.utils.stripe.Subscription.retrieve')
-def test_get_active_sub_with_expired_but_still_active_in_stripe(mock_stripe_retrieve):
+@patch('stripe.Subscription.retrieve')
+def test_get_active_sub_within_grace_period(mock_stripe_retrieve):
     session = MagicMock()
     sub = MagicMock()
     sub.account_id = 1
-    sub.expires_at = utcnow() - timedelta(days=1)
-    sub.stripe_subscription_id = 'sub_still_active'
+    sub.status = 'active'
+    sub.expires_at = utcnow() - timedelta(seconds=SUB_GRACE_SECONDS / 2)  # Renewal webhook not received yet
     session.query().filter().order_by().first.return_value = sub
 
-    new_expiry = utcnow() + timedelta(days=30)
-
-    class FakeStripeSub:
-        status = 'active'
-        current_period_end = int(new_expiry.timestamp())
-
-    mock_stripe_retrieve.return_value = FakeStripeSub()
-
-    result = _get_active_sub(1, session=session)
-    assert result is sub
-    assert sub.expires_at.replace(microsecond=0) == new_expiry.replace(microsecond=0)
-    session.commit.assert_called_once()
+    assert _get_active_sub(1, session=session) is sub
+    mock_stripe_retrieve.assert_not_called()
 
 
-@patch('src.server.db.stripe.Subscription.retrieve')
+@patch('stripe.Subscription.retrieve')
 def test_get_active_sub_fully_expired(mock_stripe_retrieve):
     session = MagicMock()
     sub = MagicMock()
     sub.account_id = 1
+    sub.status = 'active'
     sub.expires_at = utcnow() - timedelta(days=2)
     sub.stripe_subscription_id = 'sub_expired'
     session.query().filter().order_by().first.return_value = sub
 
-    mock_stripe_retrieve.return_value = MagicMock(
-        status='canceled',
-        current_period_end=int((utcnow() - timedelta(days=1)).timestamp())
-    )
-
     result = _get_active_sub(1, session=session)
     assert result is None
+    mock_stripe_retrieve.assert_not_called()
     session.commit.assert_not_called()
 
 
-@patch('src.server.db.utils.stripe.Subscription.retrieve')
+def test_get_active_sub_canceled():
+    session = MagicMock()
+    sub = MagicMock()
+    sub.account_id = 1
+    sub.status = 'canceled'
+    sub.expires_at = utcnow() + timedelta(days=5)
+    session.query().filter().order_by().first.return_value = sub
+    assert _get_active_sub(1, session=session) is None
+
+
+@patch('stripe.Subscription.retrieve')
 def test_get_active_sub_up_to_date(mock_stripe_retrieve):
     session = MagicMock()
     sub = MagicMock()
     sub.account_id = 1
+    sub.status = 'active'
     sub.expires_at = utcnow() + timedelta(days=5)
     session.query().filter().order_by().first.return_value = sub
 
     result = _get_active_sub(1, session=session)
     assert result is sub
-    mock_stripe_retrieve.assert_not_called()
\ No newline at end of file
+    mock_stripe_retrieve.assert_not_called()
+
+
+@patch('stripe.Subscription.retrieve')
+@patch('stripe.checkout.Session.retrieve')
+def _create_expired_sub(account_id, mock_session_retrieve, mock_subscription_retrieve):
+    mock_session_retrieve.return_value = FakeStripeCheckoutSession()
+    mock_subscription_retrieve.return_value = FakeStripeSubscription(lookup_key='starter', period_end=utcnow() - timedelta(days=1))
+    return create_sub(account_id, chkout_session_id='cs_test_789')[1]
+
+
+def test_reconcile_subs_applies_missed_renewal(setup_and_teardown):
+    account_id = setup_and_teardown
+    sub = _create_expired_sub(account_id)
+    assert _get_active_sub_of(account_id) is None
+
+    with FakeStripeServer() as stripe_server:
+        renewed_until = utcnow() + timedelta(days=30)
+        stripe_server.objects[f'/v1/subscriptions/{sub.stripe_subscription_id}'] = stripe_sub_json(sub.stripe_subscription_id, renewed_until, lookup_key='growth')
+        assert reconcile_subs() == 1
+        assert reconcile_subs() == 0  # No longer due
+        assert len(stripe_server.requests) == 1
+
+    active_sub = _get_active_sub_of(account_id)
+    assert active_sub.plan.value == 'growth'
+    assert active_sub.expires_at.replace(microsecond=0) == renewed_until.replace(microsecond=0)
+
+
+def test_reconcile_subs_applies_missed_cancellation(setup_and_teardown):
+    account_id = setup_and_teardown
+    sub = _create_expired_sub(account_id)
+    with FakeStripeServer() as stripe_server:
+        stripe_server.objects[f'/v1/subscriptions/{sub.stripe_subscription_id}'] = stripe_sub_json(sub.stripe_subscription_id, utcnow() - timedelta(days=1), status='canceled')
+        assert reconcile_subs() == 1
+    assert check_sub_expired(account_id) is True
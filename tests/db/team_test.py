@@ -1,5 +1,7 @@
+from sqlalchemy import event
+import pytest
 from src.server.lib.models import Credentials
-from src.server.db import create_account, create_employee, get_employees_of_team, create_team, get_teams, update_team, delete_team
+from src.server.db import engine, create_account, create_employee, get_employees_of_team, create_team, get_teams, update_team, delete_team, create_holiday, get_holidays
 from tests.utils import ctxtest, CRED
 
 # Init
@@ -54,4 +56,37 @@ def test_delete_team(setup_and_teardown):
     team = create_team(account_id, 'Epsilon Team')
     delete_team(team.team_id)
     teams = get_teams(account_id)
-    assert len(teams) == 0
\ No newline at end of file
+    assert len(teams) == 0
+
+def test_delete_team_removes_employees_from_holidays(setup_and_teardown):
+    account_id = setup_and_teardown
+    team1 = create_team(account_id, 'Team 1')
+    team2 = create_team(account_id, 'Team 2')
+    emp1 = create_employee(account_id, 'A', team1.team_id)
+    emp2 = create_employee(account_id, 'B', team2.team_id)
+    create_holiday(account_id, 'Shared', [emp1.employee_id, emp2.employee_id], '2024-01-01', '2024-01-02')
+    create_holiday(account_id, 'Only team 1', [emp1.employee_id], '2024-01-01', '2024-01-02')
+
+    delete_team(team1.team_id)
+    holidays = get_holidays(account_id)
+    assert len(holidays) == 1
+    assert holidays[0].assigned_to == [emp2.employee_id]
+
+
+@pytest.mark.parametrize('team_size', [1, 50])
+def test_delete_team_statement_count_is_constant(setup_and_teardown, team_size):
+    account_id = setup_and_teardown
+    team = create_team(account_id, 'Big Team')
+    emp_ids = [create_employee(account_id, f'Employee {i}', team.team_id).employee_id for i in range(team_size)]
+    for emp_id in emp_ids: create_holiday(account_id, 'Holiday', [emp_id], '2024-01-01', '2024-01-02')
+
+    statements = []
+    count = lambda *args, **kwargs: statements.append(args[2])
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        delete_team(team.team_id)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    assert len(statements) <= 6
+    assert get_holidays(account_id) == []
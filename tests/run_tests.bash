@@ -1,4 +1,8 @@
 #!/bin/bash
+if ! python3 -m src.server.scripts.migrate; then
+    exit 1
+fi
+
 if ! pytest tests -sv -x --cov=. --cov-report=html --cov-fail-under=85; then
     exit 1
 fi
@@ -6,4 +10,4 @@ fi
 cd tests/engine
 if ! bash run_engine_tests.bash; then
     exit 1
-fi
\ No newline at end of file
+fi
@@ -1,10 +1,9 @@
-from unittest.mock import patch, AsyncMock
 from fastapi.testclient import TestClient
 import pytest
 from src.server.main import app
 from src.server.lib.models import Credentials
 from src.server.lib.exceptions import InvalidCredentials, NonExistent
-from src.server.db import Session, log_in_account, _get_token_from_account
+from src.server.db import Session, OutboxEmail, log_in_account, _get_token_from_account
 from tests.utils import ctxtest, signup, CRED
 
 # Init
@@ -36,18 +35,17 @@ def test_log_in_account_nonexistent_user():
         log_in_account(nonexistent_credentials)
 
 
-@patch('src.server.db.functions.send_email', new_callable=AsyncMock, return_value=None)
-def test_request_reset_password(_, setup_and_teardown):
+def test_request_reset_password(setup_and_teardown):
     account_id, _ = setup_and_teardown
     response = request_reset_password()
     assert response.status_code == 200
     assert 'reset link will be sent' in response.json()['detail']
     with Session() as session:
         assert _get_token_from_account(account_id, 'reset', session=session) is not None
+        assert session.query(OutboxEmail).filter(OutboxEmail.recipients.any(CRED.email), OutboxEmail.status == 'pending').count() == 1
 
 
-@patch('src.server.db.functions.send_email', new_callable=AsyncMock, return_value=None)
-def test_reset_password(_, setup_and_teardown):
+def test_reset_password(setup_and_teardown):
     account_id, _ = setup_and_teardown
     new_password = 'newtestpass'
     request_reset_password()
@@ -63,8 +61,7 @@ def test_reset_password(_, setup_and_teardown):
     assert account.email == CRED.email
 
 
-@patch('src.server.db.functions.send_email', new_callable=AsyncMock, return_value=None)
-def test_request_verify_email(_, setup_and_teardown):
+def test_request_verify_email(setup_and_teardown):
     account_id, _ = setup_and_teardown
     response = request_verify_email()
     assert response.status_code == 200
@@ -73,8 +70,7 @@ def test_request_verify_email(_, setup_and_teardown):
         assert _get_token_from_account(account_id, 'verify', session=session) is not None
 
 
-@patch('src.server.db.functions.send_email', new_callable=AsyncMock, return_value=None)
-def test_verify_email(_, setup_and_teardown):
+def test_verify_email(setup_and_teardown):
     account_id, _ = setup_and_teardown
     request_verify_email()
 
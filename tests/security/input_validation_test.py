@@ -1,5 +1,7 @@
 import pytest, bcrypt
 from src.server.lib.models import Credentials
+from src.server.lib.constants import BCRYPT_ROUNDS
+from src.server.lib.hashing import get_hashing_stats, needs_rehash
 from src.server.db import Session, Account, _sanitize_email, _sanitize_password, _sanitize_credentials, _hash_password, _authenticate_credentials
 from src.server.lib.exceptions import NonExistent, InvalidCredentials
 from tests.utils import ctxtest
@@ -69,4 +71,25 @@ def test_authenticate_credentials_invalid_password():
         session.commit()
     
     with pytest.raises(InvalidCredentials):
-        _authenticate_credentials(cred, session=session)
\ No newline at end of file
+        _authenticate_credentials(cred, session=session)
+
+
+def test_hashing_runs_on_pool():
+    completed = get_hashing_stats()['completed']
+    _hash_password('securepassword')
+    stats = get_hashing_stats()
+    assert stats['completed'] == completed + 1
+    assert stats['queued'] == stats['running'] == 0
+
+
+def test_rehash_on_login_when_cost_changes():
+    cred = Credentials(email='validuser@hotmail.com', password='validpassword')
+    old_hash = bcrypt.hashpw(cred.password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS - 1)).decode('utf-8')
+    assert needs_rehash(old_hash)
+
+    with Session() as session:
+        session.add(Account(email=cred.email, hashed_password=old_hash))
+        session.commit()
+        account = _authenticate_credentials(cred, session=session)
+        assert not needs_rehash(account.hashed_password)
+        assert bcrypt.checkpw(cred.password.encode('utf-8'), account.hashed_password.encode('utf-8'))
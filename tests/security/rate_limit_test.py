@@ -1,10 +1,16 @@
 from typing import LiteralString, Optional
-from fastapi import Response
+from datetime import timedelta
+from fastapi import Response, Request
 from fastapi.testclient import TestClient
+from limits import parse
+from limits.strategies import MovingWindowRateLimiter
 import random, string
 from src.server.main import app
 from src.server.lib.models import Credentials
 from src.server.db import create_team
+from src.server.rate_limit import LeasedStorage, client_ip, rate_limit_key
+from src.server.db.tokens import encode_token
+from src.server.lib.utils import utcnow
 from tests.utils import ctxtest, login, signup, CRED
 
 # Init
@@ -79,4 +85,61 @@ def test_rate_limit_create_holiday():
     login_response = login(client)
     holiday_info = {'holiday_name': 'Christmas', 'assigned_to': [1, 2], 'start_date': '2023-12-24', 'end_date': '2023-12-26'}
     response = hit_endpoint('/holidays/1', method='post', json=holiday_info, cookies=login_response.cookies)
-    assert response.status_code == 429
\ No newline at end of file
+    assert response.status_code == 429
+
+## Storage & keys
+def _workers(count: int) -> list[LeasedStorage]:
+    """Storages of `count` workers sharing one moving window, standing in for a shared Redis."""
+    workers = [LeasedStorage('leased+memory://') for _ in range(count)]
+    for worker in workers[1:]: worker._backend = workers[0]._backend
+    return workers
+
+
+def _request(peer: str, headers: dict[str, str] = {}, cookies: str = '') -> Request:
+    raw_headers = [(key.lower().encode(), value.encode()) for key, value in headers.items()]
+    if cookies: raw_headers.append((b'cookie', cookies.encode()))
+    return Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': raw_headers, 'client': (peer, 1234)})
+
+
+def test_limits_are_shared_across_workers():
+    workers = [MovingWindowRateLimiter(storage) for storage in _workers(3)]
+    limit = parse('100/minute')
+    granted = sum(workers[i % 3].hit(limit, 'client') for i in range(150))
+    assert granted == 100
+
+
+def test_leases_skip_the_shared_storage(monkeypatch):
+    storage = LeasedStorage('leased+memory://')
+    calls = []
+    backend_acquire = storage._backend.acquire_entry
+    monkeypatch.setattr(storage._backend, 'acquire_entry', lambda *args, **kwargs: calls.append(args) or backend_acquire(*args, **kwargs))
+
+    limiter_ = MovingWindowRateLimiter(storage)
+    assert all(limiter_.hit(parse('100/minute'), 'client') for _ in range(50))
+    assert len(calls) == 5  # One lease of 10 entries per 10 requests
+
+
+def test_small_limits_are_always_checked_against_the_shared_storage():
+    workers = [MovingWindowRateLimiter(storage) for storage in _workers(2)]
+    limit = parse('5/minute')
+    assert [workers[i % 2].hit(limit, 'client') for i in range(7)] == [True] * 5 + [False] * 2
+
+
+def test_forwarded_for_is_trusted_only_from_proxies():
+    headers = {'X-Forwarded-For': '198.51.100.1, 203.0.113.7'}
+    assert client_ip(_request('127.0.0.1', headers)) == '203.0.113.7'  # The right-most address was added by the proxy
+    assert client_ip(_request('192.0.2.10', headers)) == '192.0.2.10'
+    assert client_ip(_request('127.0.0.1')) == '127.0.0.1'
+
+
+def test_key_uses_account_only_for_signed_tokens(monkeypatch):
+    monkeypatch.setattr('src.server.db.tokens.TOKEN_SECRET', 'test-secret')
+    cookies = 'account_id=42; auth_token=' + encode_token(42, 'jti', utcnow() + timedelta(hours=1))
+    assert rate_limit_key(_request('192.0.2.10', cookies=cookies)) == 'ip:192.0.2.10'  # Opaque tokens are not trusted
+
+    monkeypatch.setattr('src.server.rate_limit.TOKEN_FORMAT', 'signed')
+    assert rate_limit_key(_request('192.0.2.10', cookies=cookies)) == 'account:42'
+    assert rate_limit_key(_request('198.51.100.1', cookies=cookies)) == 'account:42'
+    assert rate_limit_key(_request('192.0.2.10', cookies=cookies.replace('42', '43', 1))) == 'ip:192.0.2.10'
+    assert rate_limit_key(_request('192.0.2.10', cookies='account_id=42; auth_token=forged')) == 'ip:192.0.2.10'
+    assert rate_limit_key(_request('192.0.2.10')) == 'ip:192.0.2.10'
@@ -0,0 +1,41 @@
+import os, time, pytest
+from jinja2 import UndefinedError
+from src.server.lib.templates import TemplateRegistry, templates
+from src.server.lib.utils import format_template
+
+# Tests
+def test_all_templates_are_precompiled():
+    assert {'contact_us_submission.html', 'delete_account.html', 'reset_password.html', 'verify_email.html'} <= set(templates._templates)
+
+
+def test_values_are_escaped():
+    html = format_template(
+        'contact_us_submission.html',
+        account_id=1, name='<script>alert(1)</script>', email='a@b.com', query_type='Other', description='{not a placeholder}'
+    )
+    assert '<script>' not in html
+    assert '&lt;script&gt;' in html
+    assert '{not a placeholder}' in html
+
+
+def test_missing_values_raise():
+    with pytest.raises(UndefinedError):
+        format_template('verify_email.html')
+
+
+def test_render_many():
+    links = [f'https://shiftiatrics.com/verify-email?token={i}' for i in range(3)]
+    rendered = templates.render_many('verify_email.html', [{'verify_link': link} for link in links])
+    assert all(link in html for link, html in zip(links, rendered))
+
+
+def test_auto_reload(tmp_path):
+    path = tmp_path / 'greeting.html'
+    path.write_text('Hello {{ name }}')
+    registry = TemplateRegistry(str(tmp_path), auto_reload=True)
+    assert registry.render('greeting.html', name='A') == 'Hello A'
+
+    path.write_text('Bye {{ name }}')
+    os.utime(path, (time.time() + 5, time.time() + 5))  # Ensure the mtime changes
+    assert registry.render('greeting.html', name='A') == 'Bye A'
+    assert TemplateRegistry(str(tmp_path)).render('greeting.html', name='A') == 'Bye A'
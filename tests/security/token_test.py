@@ -3,7 +3,9 @@ import pytest
 from src.server.lib.utils import utcnow
 from src.server.lib.models import Cookies
 from src.server.lib.exceptions import InvalidCookies, NonExistent
-from src.server.db import Session, create_account, _renew_token, _generate_new_token, _get_token_from_account, _validate_cookies
+from src.server.db import Session, Token, RevokedToken, create_account, log_in_account, log_out_account, change_password, _renew_token, _generate_new_token, _get_token_from_account, _validate_cookies
+from src.server.db import tokens
+from src.server.db.tokens import sync_revoked_tokens
 from tests.utils import ctxtest, CRED
 
 # Init
@@ -13,6 +15,12 @@ def setup_and_teardown():
     yield account.account_id, token
 
 
+@pytest.fixture
+def signed_tokens(monkeypatch):
+    monkeypatch.setattr('src.server.db.utils.TOKEN_FORMAT', 'signed')
+    monkeypatch.setattr('src.server.db.tokens.TOKEN_SECRET', 'test-secret')
+
+
 # Tests
 def test_create_new_token(setup_and_teardown):
     account_id, token = setup_and_teardown
@@ -94,4 +102,77 @@ def test_generate_new_token():
     assert 'expires_at' in token_data
     assert isinstance(token_data['token'], str)
     assert isinstance(token_data['expires_at'], datetime)
-    assert utcnow() < token_data['expires_at']
\ No newline at end of file
+    assert utcnow() < token_data['expires_at']
+
+
+def test_signed_token_is_validated_without_tokens_table(setup_and_teardown, signed_tokens):
+    account_id, _ = setup_and_teardown
+    with Session() as session:
+        token = _renew_token(account_id, session=session)
+        session.query(Token).delete()  # Validation must not depend on the row
+        session.commit()
+        assert _validate_cookies(Cookies(account_id=account_id, token=token), session=session).account_id == account_id
+
+
+def test_tampered_signed_token_is_rejected(setup_and_teardown, signed_tokens):
+    account_id, _ = setup_and_teardown
+    with Session() as session:
+        token = _renew_token(account_id, session=session)
+        with pytest.raises(InvalidCookies):
+            _validate_cookies(Cookies(account_id=account_id, token=token[:-2] + 'xx'), session=session)
+        with pytest.raises(InvalidCookies):
+            _validate_cookies(Cookies(account_id=account_id + 1, token=token), session=session)
+
+
+def test_renewal_revokes_previous_signed_token(setup_and_teardown, signed_tokens):
+    account_id, _ = setup_and_teardown
+    with Session() as session:
+        old_token = _renew_token(account_id, session=session)
+        new_token = _renew_token(account_id, session=session)
+        with pytest.raises(InvalidCookies):
+            _validate_cookies(Cookies(account_id=account_id, token=old_token), session=session)
+        assert _validate_cookies(Cookies(account_id=account_id, token=new_token), session=session)
+
+
+def test_revocations_from_other_processes_are_synced(setup_and_teardown, signed_tokens):
+    account_id, _ = setup_and_teardown
+    with Session() as session:
+        token = _renew_token(account_id, session=session)
+        token_obj = _get_token_from_account(account_id, 'auth', session=session)
+        session.add(RevokedToken(jti=token_obj.token, account_id=account_id, expires_at=token_obj.expires_at))
+        session.commit()
+        assert sync_revoked_tokens(session=session) >= 1
+        with pytest.raises(InvalidCookies):
+            _validate_cookies(Cookies(account_id=account_id, token=token), session=session)
+
+
+def _forget_revocations(monkeypatch) -> None:
+    """Empties the local deny-list & forces a sync, like a worker that did not handle the revocation."""
+    monkeypatch.setattr(tokens, '_revoked', {})
+    monkeypatch.setattr(tokens, '_synced_at', float('-inf'))
+
+
+def test_logged_out_signed_token_is_rejected(setup_and_teardown, signed_tokens, monkeypatch):
+    account_id, _ = setup_and_teardown
+    _, _, token = log_in_account(CRED)
+    log_out_account(Cookies(account_id=account_id, token=token))
+    _forget_revocations(monkeypatch)
+    with Session() as session:
+        with pytest.raises(InvalidCookies):
+            _validate_cookies(Cookies(account_id=account_id, token=token), session=session)
+
+    _, _, new_token = log_in_account(CRED)
+    assert new_token != token
+    with Session() as session:
+        assert _validate_cookies(Cookies(account_id=account_id, token=new_token), session=session).account_id == account_id
+
+
+def test_password_change_revokes_signed_token(setup_and_teardown, signed_tokens, monkeypatch):
+    account_id, _ = setup_and_teardown
+    _, _, token = log_in_account(CRED)
+    _, new_token = change_password(Cookies(account_id=account_id, token=token), 'N3w_p@ssw0rd!', CRED.password)
+    _forget_revocations(monkeypatch)
+    with Session() as session:
+        with pytest.raises(InvalidCookies):
+            _validate_cookies(Cookies(account_id=account_id, token=token), session=session)
+        assert _validate_cookies(Cookies(account_id=account_id, token=new_token), session=session).account_id == account_id
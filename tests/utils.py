@@ -2,11 +2,13 @@ from typing import Optional, Any
 from functools import wraps
 from datetime import datetime, timezone
 from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
 from sqlalchemy import text
-import pytest
+import pytest, stripe, json, time, hmac, hashlib
 from src.server.rate_limit import limiter
 from src.server.lib.models import Credentials
-from src.server.db import Session, Account, Token, Team, Employee, Shift, Schedule, Holiday
+from src.server.db import Session, Account, Token, RevokedToken, StripeEvent, OutboxEmail, Team, Employee, Shift, Schedule, Holiday, clear_cache
 
 # Defaults & constants
 CRED = Credentials(email='testuser@gmail.com', password='testpass')
@@ -31,6 +33,9 @@ def _reset_whole_db() -> None:
     """Resets the DB auto-increment sequence of SERIAL columns, and deletes all rows from all tables."""
     with Session() as session:
         session.query(Token).delete()
+        session.query(RevokedToken).delete()
+        session.query(StripeEvent).delete()
+        session.query(OutboxEmail).delete()
         session.query(Employee).delete()
         session.query(Team).delete()
         session.query(Shift).delete()
@@ -47,6 +52,7 @@ def _reset_whole_db() -> None:
         session.execute(text('ALTER SEQUENCE schedules_schedule_id_seq RESTART WITH 1;'))
         session.execute(text('ALTER SEQUENCE subscriptions_subscription_id_seq RESTART WITH 1;'))
         session.commit()
+    clear_cache()  # Bulk deletes bypass the version tracking of the cache
 
 
 def ctxtest(*, disable_rate_limiting: bool = True):
@@ -104,4 +110,64 @@ class FakeStripeSubscription:
         self.current_period_end = int(self.period_end.timestamp())
 
     def __getitem__(self, key):
-        return getattr(self, key)
\ No newline at end of file
+        return getattr(self, key)
+
+
+
+# Local Stripe stand-ins
+class FakeStripeServer:
+    """Local stand-in for the Stripe API. Serves canned objects by path (e.g., '/v1/subscriptions/sub_1') & records requested paths."""
+    def __init__(self):
+        self.objects: dict[str, dict] = {}
+        self.requests: list[str] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                obj = server.objects.get(self.path.split('?')[0])
+                body = json.dumps(obj if obj is not None else {'error': {'type': 'invalid_request_error', 'message': 'No such object'}}).encode()
+                self.send_response(200 if obj is not None else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+    def __enter__(self):
+        self._api_base = stripe.api_base
+        stripe.api_base = f'http://127.0.0.1:{self._httpd.server_port}'
+        Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        stripe.api_base = self._api_base
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def stripe_sub_json(sub_id: str, period_end: datetime, status: str = 'active', lookup_key: str = 'starter') -> dict:
+    """Returns a Stripe subscription object as served by the API & embedded in webhook events."""
+    return {
+        'id': sub_id,
+        'object': 'subscription',
+        'status': status,
+        'current_period_end': int(period_end.timestamp()),
+        'items': {'object': 'list', 'data': [{'price': {'unit_amount': 4900, 'lookup_key': lookup_key}}]}
+    }
+
+
+def stripe_event(event_id: str, event_type: str, obj: dict, created: Optional[datetime] = None) -> bytes:
+    """Returns the JSON payload of a Stripe webhook event."""
+    created = int((created or datetime.now(timezone.utc)).timestamp())
+    return json.dumps({'id': event_id, 'object': 'event', 'type': event_type, 'created': created, 'data': {'object': obj}}).encode()
+
+
+def sign_stripe_payload(payload: bytes, secret: str) -> str:
+    """Returns the `Stripe-Signature` header Stripe would send with the payload."""
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.'.encode() + payload, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'